@@ -0,0 +1,17 @@
+"""
+Asynchronous Server Gateway Interface (ASGI) entry point
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+
+import os
+from service.aio import create_asgi_app
+
+PORT = int(os.getenv("PORT", "8080"))
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
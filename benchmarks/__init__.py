@@ -0,0 +1,3 @@
+"""
+Performance benchmarks and load tools for the Wishlist service
+"""
@@ -0,0 +1,119 @@
+"""
+HTTP Load Driver
+
+A small closed-loop load generator built on the standard library. Each
+virtual user owns a keep-alive connection and sends requests back to back
+so the measured throughput is limited by the server, not by the driver.
+
+Usage:
+    python -m benchmarks.http_load http://localhost:8080/api/wishlists -c 32 -d 10
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, pct):
+    """Returns the pct percentile (0-100) of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class LoadResult:
+    """Collects latencies and errors from all of the virtual users"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latencies, errors):
+        """Merges the samples of one virtual user"""
+        with self._lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+    @property
+    def requests(self):
+        """Total number of requests that were sent"""
+        return len(self.latencies) + self.errors
+
+    def summary(self) -> dict:
+        """Returns throughput and latency percentiles in milliseconds"""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rps": round(self.requests / self.elapsed, 1) if self.elapsed else 0.0,
+            "mean_ms": round(statistics.fmean(self.latencies) * 1000, 2) if self.latencies else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+        }
+
+
+def _virtual_user(url, method, body, deadline, result):
+    """Sends requests on a single keep-alive connection until the deadline"""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    payload = json.dumps(body) if body is not None else None
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    conn.close()
+    result.record(latencies, errors)
+
+
+def run_load(url, concurrency=10, duration=10.0, method="GET", body=None) -> dict:
+    """Drives url with concurrency virtual users for duration seconds"""
+    result = LoadResult()
+    start = time.perf_counter()
+    deadline = start + duration
+    users = [
+        threading.Thread(target=_virtual_user, args=(url, method, body, deadline, result), daemon=True)
+        for _ in range(concurrency)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    result.elapsed = time.perf_counter() - start
+    return result.summary()
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Closed-loop HTTP load driver")
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("-X", "--method", default="GET")
+    parser.add_argument("--json", help="JSON request body")
+    args = parser.parse_args()
+    body = json.loads(args.json) if args.json else None
+    print(json.dumps(run_load(args.url, args.concurrency, args.duration, args.method, body), indent=2))
+
+
+if __name__ == "__main__":
+    main()
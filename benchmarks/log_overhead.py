@@ -0,0 +1,93 @@
+"""
+Logging Overhead Benchmark
+
+Measures what logging adds to request latency. Requests go through the
+Flask test client on the in-memory repository while the app logger writes
+to a file, once with the handlers called in the request (LOG_QUEUE=false)
+and once through the background queue, at INFO and at DEBUG (which turns
+the per-lookup model messages back on).
+
+--write-delay-us makes every write slower, like a container runtime or
+log shipper that is falling behind.
+
+Usage:
+    python -m benchmarks.log_overhead -n 3000
+    python -m benchmarks.log_overhead -n 3000 --write-delay-us 200
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from benchmarks.http_load import percentile
+
+LOGGER = "benchmarks.log_overhead"
+
+
+class SlowFileHandler(logging.FileHandler):
+    """A file handler whose writes take at least delay seconds"""
+
+    def __init__(self, path, delay):
+        super().__init__(path)
+        self.write_delay = delay
+
+    def emit(self, record):
+        super().emit(record)
+        if self.write_delay:
+            time.sleep(self.write_delay)
+
+
+def run(app, client, url, number) -> list:
+    """Returns the latency of number GET requests to url in microseconds"""
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        client.get(url)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    queue = app.extensions.get("log_queue")
+    if queue is not None:
+        queue.stop()
+    return latencies
+
+
+def main():
+    """Times each logging mode and prints a Markdown table"""
+    parser = argparse.ArgumentParser(description="Benchmark logging overhead per request")
+    parser.add_argument("-n", "--number", type=int, default=3000)
+    parser.add_argument("--write-delay-us", type=float, default=0.0, help="extra time each log write takes")
+    args = parser.parse_args()
+
+    os.environ["REPOSITORY_BACKEND"] = "memory"
+    # pylint: disable=import-outside-toplevel
+    from wsgi import app
+    from service.common.log_handlers import init_logging
+
+    client = app.test_client()
+    wishlist_id = client.post("/api/wishlists", json={"name": "bench", "userid": "bench"}).get_json()["id"]
+    url = f"/api/wishlists/{wishlist_id}"
+
+    print("| handlers | level | records/request | mean us | p50 us | p99 us |")
+    print("|---|---|---|---|---|---|")
+    with tempfile.TemporaryDirectory() as folder:
+        for level in (logging.INFO, logging.DEBUG):
+            for queued in (False, True):
+                path = os.path.join(folder, f"{queued}-{level}.log")
+                target = logging.getLogger(LOGGER)
+                target.handlers = [SlowFileHandler(path, args.write_delay_us / 1e6)]
+                target.setLevel(level)
+                app.config["LOG_QUEUE"] = queued
+                init_logging(app, LOGGER)
+                run(app, client, url, args.number // 10)  # warm up
+                init_logging(app, LOGGER)
+                latencies = run(app, client, url, args.number)
+                with open(path, encoding="utf-8") as file:
+                    records = sum(1 for _ in file) / (args.number + args.number // 10)
+                print(f"| {'queue' if queued else 'direct'} | {logging.getLevelName(level)} | {records:.1f} "
+                      f"| {statistics.mean(latencies):.1f} | {percentile(latencies, 50):.1f} "
+                      f"| {percentile(latencies, 99):.1f} |")
+                target.handlers[0].close()
+
+
+if __name__ == "__main__":
+    main()
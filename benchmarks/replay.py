@@ -0,0 +1,257 @@
+"""
+Traffic Replay Load Generator
+
+Replays a JSONL trace of requests against a running service at a target
+rate and reports latency percentiles and error rates per endpoint.
+
+Each trace line is one request:
+
+    {"name": "get_wishlist", "method": "GET", "path": "/api/wishlists/{wishlist}"}
+    {"name": "patch_purchased", "method": "PATCH", "t": 0.25,
+     "path": "/api/wishlists/{wishlist}/products/{product}", "body": {"purchased": true}}
+
+- name groups the request in the report (defaults to "METHOD path")
+- {wishlist} and {product} are filled with a seeded Wishlist and one of
+  its Products, so recorded traces work against a fresh database
+- t is the offset in seconds at which the request was recorded; it is
+  replayed as recorded (scaled by --speed) unless --rps is given
+- expect is the expected status; otherwise any status below 400 counts
+  as a success
+
+The load is open loop: requests are sent on schedule whether or not the
+earlier ones have answered, and latency is measured from the scheduled
+time, so queueing in an overloaded service shows up in the percentiles.
+--concurrency caps the number of connections sending at once.
+
+Usage:
+    python -m benchmarks.replay generate benchmarks/traces/mix.jsonl --count 1000
+    python -m benchmarks.replay run benchmarks/traces/mix.jsonl --url http://localhost:8080 --rps 200 --duration 30
+"""
+import argparse
+import http.client
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from urllib.parse import urlsplit
+from benchmarks.asgi_vs_wsgi import seed
+from benchmarks.http_load import percentile
+
+# name: (weight, method, path, body) of the default traffic mix
+MIX = {
+    "list_wishlists": (40, "GET", "/api/wishlists?limit=10", None),
+    "get_wishlist": (30, "GET", "/api/wishlists/{wishlist}", None),
+    "add_product": (15, "POST", "/api/wishlists/{wishlist}/products", {
+        "wishlist_id": 0, "name": "replayed", "price": 9.99, "description": "replayed product",
+        "quantity": 1, "note": None, "is_gift": False, "purchased": False,
+    }),
+    "patch_purchased": (15, "PATCH", "/api/wishlists/{wishlist}/products/{product}", {"purchased": True}),
+}
+
+
+######################################################################
+#  T R A C E S
+######################################################################
+def load_trace(path) -> list:
+    """Reads the requests of a JSONL trace, skipping blank lines"""
+    with open(path, encoding="utf-8") as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    for entry in entries:
+        entry.setdefault("method", "GET")
+        entry.setdefault("name", f"{entry['method']} {entry['path']}")
+    return entries
+
+
+def generate_trace(count, rps=100.0, mix=None, rng=None) -> list:
+    """Returns count requests drawn from the weighted mix, spaced for rps"""
+    mix = mix or MIX
+    rng = rng or random.Random(42)
+    names = rng.choices(list(mix), weights=[weight for weight, *_ in mix.values()], k=count)
+    entries = []
+    for index, name in enumerate(names):
+        _, method, path, body = mix[name]
+        entry = {"name": name, "method": method, "path": path, "t": round(index / rps, 6)}
+        if body is not None:
+            entry["body"] = body
+        entries.append(entry)
+    return entries
+
+
+def schedule(entries, rps=None, speed=1.0, duration=None):
+    """Yields (offset, entry) in send order, looping the trace to fill duration"""
+    if rps:
+        offsets = [index / rps for index in range(len(entries))]
+        cycle = len(entries) / rps
+    else:
+        offsets = [entry.get("t", 0.0) / speed for entry in entries]
+        cycle = (max(offsets) if offsets else 0.0) + (offsets[1] - offsets[0] if len(offsets) > 1 else 1.0)
+    loop = 0
+    while True:
+        for offset, entry in zip(offsets, entries):
+            offset += loop * cycle
+            if duration is not None and offset >= duration:
+                return
+            yield offset, entry
+        loop += 1
+        if duration is None:
+            return
+
+
+######################################################################
+#  R E P L A Y
+######################################################################
+class ReplayStats:
+    """Latencies and errors per endpoint name"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, status, ok):
+        """Adds the outcome of one request"""
+        with self._lock:
+            self.latencies[name].append(latency)
+            self.statuses[name][status] += 1
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self) -> dict:
+        """Returns count, rate, percentiles (ms) and error rate per endpoint and in total"""
+        rows = {}
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        groups = {**dict(sorted(self.latencies.items())), "TOTAL": everything}
+        for name, latencies in groups.items():
+            errors = sum(self.errors.values()) if name == "TOTAL" else self.errors[name]
+            rows[name] = {
+                "requests": len(latencies),
+                "rps": round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "errors": errors,
+                "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+            }
+            if name != "TOTAL":
+                rows[name]["statuses"] = dict(sorted(self.statuses[name].items()))
+        return rows
+
+
+def seed_targets(base_url, count=20, products=5) -> list:
+    """Seeds Wishlists and returns (wishlist_id, product_id) pairs to fill paths with"""
+    targets = []
+    for wishlist_id in seed(base_url, count, products):
+        with urllib.request.urlopen(f"{base_url}/api/wishlists/{wishlist_id}/products") as resp:
+            targets.extend((wishlist_id, product["id"]) for product in json.load(resp))
+    return targets
+
+
+def _sender(base_url, work, stats):
+    """Sends queued requests on one keep-alive connection until it gets None"""
+    parts = urlsplit(base_url)
+
+    def connect():
+        return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    conn = connect()
+    while (item := work.get()) is not None:
+        scheduled, entry, path = item
+        body = json.dumps(entry["body"]) if "body" in entry else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            conn.request(entry["method"], path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+            conn = connect()
+        ok = status == entry["expect"] if "expect" in entry else 0 < status < 400
+        stats.record(entry["name"], time.perf_counter() - scheduled, status, ok)
+    conn.close()
+
+
+def replay(base_url, entries, targets, options) -> ReplayStats:
+    """Sends the trace to base_url on schedule and returns the statistics
+
+    options holds concurrency, rps, speed and duration as parsed by main().
+    """
+    rng = random.Random(7)
+    stats = ReplayStats()
+    work = queue.SimpleQueue()
+    senders = [
+        threading.Thread(target=_sender, args=(base_url, work, stats), daemon=True) for _ in range(options.concurrency)
+    ]
+    for sender in senders:
+        sender.start()
+    start = time.perf_counter()
+    for offset, entry in schedule(entries, options.rps, options.speed, options.duration):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        wishlist_id, product_id = rng.choice(targets)
+        work.put((start + offset, entry, entry["path"].format(wishlist=wishlist_id, product=product_id)))
+    for _ in senders:
+        work.put(None)
+    for sender in senders:
+        sender.join()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def print_report(summary):
+    """Prints the per endpoint summary as a Markdown table"""
+    print("| endpoint | requests | rps | p50 ms | p95 ms | p99 ms | errors | error rate |")
+    print("|---|---|---|---|---|---|---|---|")
+    for name, row in summary.items():
+        print(f"| {name} | {row['requests']} | {row['rps']} | {row['p50_ms']} | {row['p95_ms']} | {row['p99_ms']} "
+              f"| {row['errors']} | {row['error_rate']:.2%} |")
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Replay a JSONL request trace against the service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a trace of the default traffic mix")
+    generate.add_argument("trace")
+    generate.add_argument("--count", type=int, default=1000)
+    generate.add_argument("--rps", type=float, default=100.0, help="rate the t offsets are spaced for")
+
+    run = commands.add_parser("run", help="replay a trace")
+    run.add_argument("trace")
+    run.add_argument("--url", default="http://localhost:8080")
+    run.add_argument("--rps", type=float, help="send at this rate instead of the recorded timing")
+    run.add_argument("--speed", type=float, default=1.0, help="speed up the recorded timing by this factor")
+    run.add_argument("--duration", type=float, help="loop the trace for this many seconds")
+    run.add_argument("-c", "--concurrency", type=int, default=32, help="maximum requests in flight")
+    run.add_argument("--seed", type=int, default=20, help="Wishlists to create for the {wishlist} placeholders")
+    run.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        with open(args.trace, "w", encoding="utf-8") as file:
+            for entry in generate_trace(args.count, args.rps):
+                file.write(json.dumps(entry) + "\n")
+        return 0
+
+    entries = load_trace(args.trace)
+    targets = seed_targets(args.url.rstrip("/"), args.seed)
+    stats = replay(args.url.rstrip("/"), entries, targets, args)
+    summary = stats.summary()
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+    return 1 if summary["TOTAL"]["requests"] == 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
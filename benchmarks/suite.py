@@ -0,0 +1,335 @@
+"""
+Model and Route Benchmark Suite
+
+Times the serialization hot spots of the models and every route in
+service/routes.py (through the Flask test client) and compares the
+results with a stored JSON baseline. Times are scored against a fixed
+reference workload measured alongside them, so a slower or busier machine
+does not look like a regression. A benchmark whose score got worse than
+the baseline by more than the threshold (after re-measuring it) fails the
+run with exit code 1.
+
+By default the routes run on the in-memory repository so the numbers
+measure this code, not the database, and need no services. Use
+--backend sqlalchemy (with DATABASE_URI) to include the database.
+
+Usage:
+    python -m benchmarks.suite                  # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --save           # record a new baseline
+    python -m benchmarks.suite -k route --threshold 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# name -> function(context) returning (operation, setup or None)
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a benchmark factory under name"""
+
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+
+    return register
+
+
+def measure(operation, setup=None, min_time=0.2, repeat=5) -> dict:
+    """Returns the median and best time of one call of operation in microseconds
+
+    The number of calls per round is calibrated so a round takes about
+    min_time / repeat seconds. When setup is given it runs before every
+    call, outside the timed part, and its result is passed to operation.
+    """
+
+    def run_round(number):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup:
+                argument = setup()
+                start = time.perf_counter()
+                operation(argument)
+            else:
+                start = time.perf_counter()
+                operation()
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    target = min_time / repeat
+    number = 1
+    while (elapsed := run_round(number)) < target and number < 1_000_000:
+        number = min(number * 10, max(number * 2, int(number * target / max(elapsed, 1e-9))))
+    rounds = [run_round(number) / number * 1e6 for _ in range(repeat)]
+    return {"median_us": round(statistics.median(rounds), 2), "best_us": round(min(rounds), 2), "number": number}
+
+
+def reference():
+    """A fixed pure Python workload used as the unit of the scores"""
+    table = {str(key): [key] * 3 for key in range(200)}
+    return sorted(table.items())
+
+
+def run_benchmark(operation, setup=None, min_time=0.5) -> dict:
+    """Times a benchmark and scores it against the reference workload
+
+    Shared CI machines and laptops change speed from one second to the
+    next, so the reference is timed right before and after and the score
+    (best time / reference time) is what gets compared with the baseline.
+    """
+    before = measure(reference, min_time=min_time / 10)["best_us"]
+    result = measure(operation, setup, min_time=min_time)
+    after = measure(reference, min_time=min_time / 10)["best_us"]
+    result["score"] = round(result["best_us"] / ((before + after) / 2), 4)
+    return result
+
+
+######################################################################
+# Test data
+######################################################################
+def product_data(index=0, wishlist_id=0) -> dict:
+    """Returns the JSON of a Product"""
+    return {
+        "wishlist_id": wishlist_id,
+        "name": f"item-{index}",
+        "price": 10 + index % 90 + 0.99,
+        "description": "benchmark product",
+        "quantity": 1 + index % 3,
+        "note": None,
+        "is_gift": index % 2 == 0,
+        "purchased": False,
+    }
+
+
+def make_wishlist(products: int):
+    """Builds an unsaved Wishlist with products, no database needed"""
+    # pylint: disable=import-outside-toplevel
+    from service.models import Wishlist, Product
+
+    wishlist = Wishlist()
+    wishlist.deserialize({"name": "bench", "userid": "bench"})
+    wishlist.id = 1
+    for index in range(products):
+        product = Product().deserialize(product_data(index, 1))
+        product.id = index + 1
+        wishlist.products.append(product)
+    return wishlist
+
+
+class RouteContext:
+    """A test client with a few seeded Wishlists for the route benchmarks"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        for index in range(20):
+            self.create_wishlist(f"bench-list-{index}", products=5)
+        self.wishlist_id = self.create_wishlist("bench", products=5)
+        self.product_id = self.client.get(f"/api/wishlists/{self.wishlist_id}/products").get_json()[0]["id"]
+
+    def create_wishlist(self, name, products=0) -> int:
+        """Creates a Wishlist through the API and returns its id"""
+        body = {"name": name, "userid": "bench", "products": [product_data(i) for i in range(products)]}
+        return self.client.post("/api/wishlists", json=body).get_json()["id"]
+
+    def new_product_url(self) -> str:
+        """Creates a Wishlist with one Product and returns the Product's URL"""
+        body = {"name": "bench-scratch", "userid": "bench", "products": [product_data()]}
+        product = self.client.post("/api/wishlists", json=body).get_json()["products"][0]
+        return f"/api/wishlists/{product['wishlist_id']}/products/{product['id']}"
+
+    def request(self, method, url, expected, **kwargs):
+        """Returns an operation sending one request that must answer expected"""
+
+        def operation(path=url):
+            resp = self.client.open(path, method=method, **kwargs)
+            if resp.status_code != expected:
+                raise RuntimeError(f"{method} {path} answered {resp.status_code}, expected {expected}")
+
+        return operation
+
+
+######################################################################
+# Model benchmarks
+######################################################################
+@benchmark("product.serialize")
+def product_serialize(_):  # pylint: disable=missing-function-docstring
+    product = make_wishlist(1).products[0]
+    return product.serialize, None
+
+
+@benchmark("product.deserialize")
+def product_deserialize(_):  # pylint: disable=missing-function-docstring
+    from service.models import Product  # pylint: disable=import-outside-toplevel
+
+    data = product_data()
+    return lambda: Product().deserialize(data), None
+
+
+def wishlist_serialize(products):
+    """Returns a benchmark factory serializing a Wishlist with products"""
+
+    def factory(_):
+        return make_wishlist(products).serialize, None
+
+    return factory
+
+
+for _size, _label in ((10, "10"), (1000, "1k"), (10_000, "10k")):
+    benchmark(f"wishlist.serialize[{_label}]")(wishlist_serialize(_size))
+
+
+######################################################################
+# Route benchmarks
+######################################################################
+ROUTES = {
+    "route.health": lambda ctx: (ctx.request("GET", "/health", 200), None),
+    "route.list_wishlists": lambda ctx: (ctx.request("GET", "/api/wishlists?limit=10", 200), None),
+    "route.list_wishlists_by_name": lambda ctx: (ctx.request("GET", "/api/wishlists?name=bench", 200), None),
+    "route.get_wishlist": lambda ctx: (ctx.request("GET", f"/api/wishlists/{ctx.wishlist_id}", 200), None),
+    "route.create_wishlist": lambda ctx: (
+        ctx.request("POST", "/api/wishlists", 201, json={"name": "bench-new", "userid": "bench"}), None),
+    "route.update_wishlist": lambda ctx: (
+        ctx.request("PUT", f"/api/wishlists/{ctx.wishlist_id}", 200, json={"name": "bench"}), None),
+    "route.delete_wishlist": lambda ctx: (
+        ctx.request("DELETE", None, 204), lambda: f"/api/wishlists/{ctx.create_wishlist('bench-gone')}"),
+    "route.list_products": lambda ctx: (
+        ctx.request("GET", f"/api/wishlists/{ctx.wishlist_id}/products", 200), None),
+    "route.create_product": lambda ctx: (
+        ctx.request("POST", None, 201, json=product_data()),
+        lambda: f"/api/wishlists/{ctx.create_wishlist('bench-scratch')}/products"),
+    "route.get_product": lambda ctx: (
+        ctx.request("GET", f"/api/wishlists/{ctx.wishlist_id}/products/{ctx.product_id}", 200), None),
+    "route.patch_product": lambda ctx: (
+        ctx.request("PATCH", f"/api/wishlists/{ctx.wishlist_id}/products/{ctx.product_id}", 200,
+                    json={"purchased": True}), None),
+    "route.put_product": lambda ctx: (
+        ctx.request("PUT", f"/api/wishlists/{ctx.wishlist_id}/products/{ctx.product_id}", 200,
+                    json=product_data()), None),
+    "route.delete_product": lambda ctx: (
+        ctx.request("DELETE", None, 204), ctx.new_product_url),
+}
+BENCHMARKS.update(ROUTES)
+
+
+######################################################################
+# Baselines
+######################################################################
+def change(result: dict, baseline: dict, name: str):
+    """Returns the relative change of a score against the baseline or None"""
+    before = baseline.get(name, {}).get("score")
+    return result["score"] / before - 1 if before else None
+
+
+def verdict(ratio, threshold: float) -> str:
+    """Classifies a change of score"""
+    if ratio is None:
+        return "new"
+    return "REGRESSION" if ratio > threshold else "faster" if ratio < -threshold else "ok"
+
+
+def report(results: dict, baseline: dict, threshold: float) -> list:
+    """Prints the results next to the baseline and returns the regressions"""
+    print(f"| benchmark | best us | score | baseline score | change | threshold {threshold:.0%} |")
+    print("|---|---|---|---|---|---|")
+    regressions = []
+    for name, result in results.items():
+        ratio = change(result, baseline, name)
+        print(f"| {name} | {result['best_us']:.2f} | {result['score']} | {baseline.get(name, {}).get('score', '-')} "
+              f"| {'-' if ratio is None else f'{ratio:+.1%}'} | {verdict(ratio, threshold)} |")
+        if verdict(ratio, threshold) == "REGRESSION":
+            regressions.append(name)
+    return regressions
+
+
+def load_baseline(path) -> dict:
+    """Reads a baseline file, empty if there is none"""
+    if not os.path.exists(path):
+        return {"meta": {}, "results": {}}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_baseline(path, results, backend) -> None:
+    """Writes results as the new baseline"""
+    meta = {
+        "recorded": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": backend,
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"meta": meta, "results": results}, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def time_benchmark(name, operation, setup, args, baseline: dict) -> dict:
+    """Runs one benchmark for a baseline (median of three) or a comparison"""
+    if args.save:
+        runs = sorted((run_benchmark(operation, setup, args.min_time) for _ in range(3)), key=lambda run: run["score"])
+        return runs[1]
+    result = run_benchmark(operation, setup, args.min_time)
+    # A regression has to show up again to count, one slow run is noise
+    for _ in range(args.retries):
+        if verdict(change(result, baseline, name), args.threshold) != "REGRESSION":
+            break
+        result = min(result, run_benchmark(operation, setup, args.min_time), key=lambda run: run["score"])
+    return result
+
+
+def main():
+    """Runs the selected benchmarks and checks them against the baseline"""
+    parser = argparse.ArgumentParser(description="Model and route benchmarks")
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.3")),
+                        help="allowed slowdown as a fraction of the baseline (default 0.3)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each benchmark")
+    parser.add_argument("--retries", type=int, default=3, help="times a regression is re-measured before it counts")
+    parser.add_argument("--backend", default="memory", choices=["memory", "sqlalchemy"])
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ["REPOSITORY_BACKEND"] = args.backend
+    from wsgi import app  # pylint: disable=import-outside-toplevel
+
+    app.logger.setLevel(logging.CRITICAL)
+    selected = {name: factory for name, factory in BENCHMARKS.items() if args.filter in name}
+    context = RouteContext(app) if any(name.startswith("route.") for name in selected) else None
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    with app.app_context():
+        for name, factory in selected.items():
+            operation, setup = factory(context)
+            results[name] = time_benchmark(name, operation, setup, args, baseline["results"])
+            print(f"{name:32} {results[name]['best_us']:>12.2f} us  score {results[name]['score']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.save:
+        save_baseline(args.baseline, {**baseline["results"], **results}, args.backend)
+        print(f"Saved {len(results)} results to {args.baseline}")
+        return 0
+
+    if baseline["meta"].get("backend", args.backend) != args.backend:
+        print(f"warning: baseline was recorded with the {baseline['meta']['backend']} backend", file=sys.stderr)
+    regressions = report(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Gunicorn configuration
+
+Every setting can be overridden from the environment so the same file is
+used by the Procfile, the Dockerfile and Kubernetes. Pick a worker model
+with GUNICORN_WORKER_CLASS:
+
+    sync     one request per process (gunicorn default)
+    gthread  a thread pool per process, good for I/O bound requests
+    gevent   green threads, many idle connections per process
+
+Worker and thread counts default to values derived from the CPUs that are
+actually available to the container (cgroup quota aware).
+"""
+
+import glob
+import math
+import os
+import signal
+import tempfile
+
+# gunicorn reads its settings from lowercase module globals
+# pylint: disable=invalid-name
+
+
+def cpu_count() -> int:
+    """Returns the number of CPUs available, honoring cgroup CPU quotas"""
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf-8") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            count = min(count, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean from the environment"""
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+CORES = cpu_count()
+
+# Worker model and sizing
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+if worker_class == "gthread":
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CORES + 1)))
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
+elif worker_class == "gevent":
+    # Patch before the app (and psycopg) is preloaded in the master
+    from gevent import monkey  # pylint: disable=import-outside-toplevel
+
+    monkey.patch_all()
+    workers = int(os.getenv("GUNICORN_WORKERS", str(CORES)))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+else:
+    workers = int(os.getenv("GUNICORN_WORKERS", str(2 * CORES + 1)))
+
+# Networking
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Load the app once in the master so workers share its memory and fork fast
+preload_app = env_bool("GUNICORN_PRELOAD", True)
+
+# Recycle workers to cap memory growth; the jitter keeps them from all
+# restarting at the same moment
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+
+# Workers write their Prometheus metrics to files in this directory so that
+# /metrics can add them up; it has to be set before the app is imported
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="wishlists-metrics-")
+
+# Logging
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+
+# kill -USR2 <worker pid> samples that worker for PROFILE_SECONDS and writes
+# collapsed stacks to PROFILE_DIR (USR2 sent to the master still upgrades it)
+profile_seconds = float(os.getenv("PROFILE_SECONDS", "10"))
+profile_dir = os.getenv("PROFILE_DIR", tempfile.gettempdir())
+
+
+######################################################################
+# Server Hooks
+######################################################################
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops database connections inherited from the master process
+
+    With preload_app the engine is created (and create_all() connects)
+    before the fork, so the pooled sockets would be shared by every worker.
+    close=False leaves them open for the parent and only resets the pool.
+    """
+    if not server.cfg.preload_app:
+        return
+    # pylint: disable=import-outside-toplevel
+    from service.models import db
+
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """Lets SIGUSR2 profile the worker; gunicorn resets it to the default, which exits"""
+    # pylint: disable=import-outside-toplevel
+    from service.common.profiler import install_signal_handler
+
+    install_signal_handler(signal.SIGUSR2, profile_seconds, profile_dir)
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Removes metrics left behind by a previous run in the same directory"""
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    # pylint: disable=import-outside-toplevel
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
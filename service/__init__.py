@@ -22,6 +22,15 @@ import sys
 from flask import Flask
 from service import config
 from service.common import log_handlers
+from service.common.compression import init_compression
+from service.common.deadlines import init_deadlines
+from service.common.metrics import init_metrics
+from service.common.profiler import init_profiler
+from service.common.query_stats import init_query_stats
+from service.common.readiness import init_readiness
+from service.common.slow_queries import init_slow_queries
+from service.common.snapshots import init_snapshots
+from service.common.tracing import init_tracing
 
 
 ############################################################
@@ -35,8 +44,9 @@ def create_app():
 
     # Initialize Plugins
     # pylint: disable=import-outside-toplevel
-    from service.models import db
+    from service.models import db, configure_sqlite, init_repository, MemoryRepository
     db.init_app(app)
+    repository = init_repository(app)
 
     with app.app_context():
         # Dependencies require we import the routes AFTER the Flask app is created
@@ -44,8 +54,23 @@ def create_app():
         from service import routes, models  # noqa: F401 E402
         from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
+        configure_sqlite(db.engine)
+        init_compression(app)
+        init_profiler(app)
+        # The deadline check raises in before_cursor_execute, where no
+        # handle_error follows, so it has to run before a SQL span starts
+        init_deadlines(app, db)
+        init_tracing(app, db)
+        init_metrics(app, db)
+        init_query_stats(app, db)
+        init_slow_queries(app, db)
+        init_readiness(app, db, memory=isinstance(repository, MemoryRepository))
+        init_snapshots(app)
+        log_handlers.init_request_logging(app)
+
         try:
-            db.create_all()
+            if not isinstance(repository, MemoryRepository):
+                db.create_all()
         except Exception as error:  # pylint: disable=broad-except
             app.logger.critical("%s: Cannot continue", error)
             # gunicorn requires exit code 4 to stop spawning workers when they die
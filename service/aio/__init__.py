@@ -0,0 +1,90 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Package: service.aio
+Async (ASGI) flavor of the Wishlist service
+
+This package creates a Starlette application that serves the same
+/api/wishlists contract as the Flask app, backed by async SQLAlchemy
+sessions that share the models in service.models
+"""
+import contextlib
+import logging
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse
+from service import config
+from service.models import DataValidationError
+from service.common import status
+from .database import create_engine, create_session_factory, create_all
+from .routes import routes
+
+logger = logging.getLogger("flask.app")
+
+
+######################################################################
+# Error Handlers
+######################################################################
+async def http_error(request, error):  # pylint: disable=unused-argument
+    """Returns HTTP errors in the same shape as flask_restx"""
+    return JSONResponse({"message": error.detail}, error.status_code)
+
+
+async def request_validation_error(request, error):  # pylint: disable=unused-argument
+    """Handles Value Errors from bad data"""
+    message = str(error)
+    logger.error(message)
+    return JSONResponse(
+        {"status_code": status.HTTP_400_BAD_REQUEST, "error": "Bad Request", "message": message},
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+############################################################
+# Initialize the Starlette instance
+############################################################
+def create_asgi_app(database_uri: str = None, **engine_options) -> Starlette:
+    """Initialize the async application"""
+    engine = create_engine(database_uri, **engine_options)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):  # pylint: disable=unused-argument
+        await create_all(engine)
+        logger.info("Async service initialized!")
+        yield
+        await engine.dispose()
+
+    # Same threshold and level as the Flask app's compression
+    middleware = []
+    if config.COMPRESS_LEVEL:
+        middleware.append(
+            Middleware(GZipMiddleware, minimum_size=config.COMPRESS_MIN_SIZE, compresslevel=config.COMPRESS_LEVEL)
+        )
+    app = Starlette(
+        routes=routes,
+        lifespan=lifespan,
+        middleware=middleware,
+        exception_handlers={
+            HTTPException: http_error,
+            DataValidationError: request_validation_error,
+        },
+    )
+    app.state.engine = engine
+    app.state.sessions = create_session_factory(engine)
+    return app
@@ -0,0 +1,62 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Async Database Layer
+
+Creates the async SQLAlchemy engine and session factory used by the
+ASGI entry point. The engine shares the table metadata of the Flask
+models in service.models so both entry points read the same schema.
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from service import config
+from service.models import db, configure_sqlite
+
+
+def create_engine(database_uri: str = None, **engine_options) -> AsyncEngine:
+    """Creates an async engine for the database
+
+    Postgres URIs use psycopg's async mode as they are; SQLite URIs are
+    switched to the aiosqlite driver.
+    """
+    url = make_url(database_uri or config.DATABASE_URI)
+    if url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+        if url.database in (None, "", ":memory:"):
+            engine_options.setdefault("poolclass", StaticPool)
+    if "poolclass" not in engine_options:
+        engine_options.setdefault("pool_size", config.ASYNC_POOL_SIZE)
+        engine_options.setdefault("max_overflow", config.ASYNC_MAX_OVERFLOW)
+    engine = create_async_engine(url, **engine_options)
+    configure_sqlite(engine.sync_engine)
+    return engine
+
+
+def create_session_factory(engine: AsyncEngine) -> async_sessionmaker:
+    """Creates a session factory bound to the engine
+
+    Attributes are not expired on commit because lazy loading is not
+    available on an AsyncSession; serialize() must work after commit.
+    """
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def create_all(engine: AsyncEngine) -> None:
+    """Creates the tables for all of the models if they do not exist"""
+    async with engine.begin() as conn:
+        await conn.run_sync(db.metadata.create_all)
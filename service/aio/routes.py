@@ -0,0 +1,348 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Async Wishlist Service
+
+Implements the same /api/wishlists REST contract as service.routes on
+top of Starlette and an AsyncSession, so a worker can keep many requests
+waiting on the database at the same time instead of pinning a thread each.
+"""
+
+# pylint: disable=duplicate-code
+import logging
+from decimal import Decimal, InvalidOperation
+from sqlalchemy.orm import load_only, selectinload
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from service.models import Wishlist, Product, DataValidationError
+from service.models.repository import select_page, filter_parameters
+from service.common import cursors, status
+
+logger = logging.getLogger("flask.app")
+
+
+######################################################################
+#  U T I L I T Y   F U N C T I O N S
+######################################################################
+async def get_json(request, content_type="application/json"):
+    """Checks that the media type is correct and returns the JSON body"""
+    if request.headers.get("Content-Type") != content_type:
+        logger.error("Invalid Content-Type: %s", request.headers.get("Content-Type"))
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Content-Type must be {content_type}")
+    try:
+        return await request.json()
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Request body must be valid JSON") from error
+
+
+def int_arg(request, name, default):
+    """Returns an integer query parameter or aborts with 400"""
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"{name}: invalid literal for int()") from error
+
+
+def price_arg(request, name):
+    """Returns a Decimal query parameter or None if it was not supplied"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation as error:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, f"Invalid {name} parameter. Must be a valid number."
+        ) from error
+
+
+async def find_wishlist(session, wishlist_id, with_products=True):
+    """Finds a Wishlist by id or aborts with 404"""
+    options = [selectinload(Wishlist.products)] if with_products else []
+    wishlist = await session.get(Wishlist, wishlist_id, options=options)
+    if not wishlist:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+    return wishlist
+
+
+async def find_product(session, wishlist_id, product_id, columns=()):
+    """Finds a Product by id and makes sure it belongs to the Wishlist
+
+    With columns only those (and wishlist_id) are loaded; the others cannot
+    be lazy loaded on an AsyncSession and must not be used.
+    """
+    await find_wishlist(session, wishlist_id, with_products=False)
+    options = [load_only(*(getattr(Product, column) for column in (*columns, "wishlist_id")))] if columns else None
+    product = await session.get(Product, product_id, options=options)
+    if not product:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+    if product.wishlist_id != wishlist_id:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Product does not belong to the specified wishlist.")
+    return product
+
+
+def fields_arg(request):
+    """Returns the Product fields of the fields query parameter, or None for all"""
+    value = request.query_params.get("fields")
+    if not value:
+        return None
+    try:
+        return Product.check_fields(value.split(","))
+    except DataValidationError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+
+
+######################################################################
+# GET HEALTH CHECK
+######################################################################
+async def health_check(request):  # pylint: disable=unused-argument
+    """Let them know our heart is still beating"""
+    return JSONResponse({"status": 200, "message": "Healthy"}, status.HTTP_200_OK)
+
+
+######################################################################
+#  W I S H L I S T   E N D P O I N T S
+######################################################################
+async def create_wishlist(request):
+    """Creates a new Wishlist (with optional products)"""
+    logger.info("Request to create a Wishlist")
+    data = await get_json(request)
+
+    # Start with a loaded (empty) collection, lazy loads are not allowed here
+    wishlist = Wishlist(products=[])
+    wishlist.deserialize(data)
+    async with request.app.state.sessions() as session:
+        session.add(wishlist)
+        await session.commit()
+
+    location_url = str(request.url_for("wishlist_resource", wishlist_id=wishlist.id))
+    return JSONResponse(wishlist.serialize(), status.HTTP_201_CREATED, {"Location": location_url})
+
+
+async def list_wishlists(request):
+    """Returns paginated Wishlists with optional name and userid filtering"""
+    logger.info("Request for Wishlists list")
+    page = max(1, int_arg(request, "page", 1))
+    limit = max(1, int_arg(request, "limit", 10))
+    sort = request.query_params.get("sort") or "id"
+    cursor = request.query_params.get("cursor")
+    try:
+        Wishlist.check_sort(sort)
+        after = cursors.decode(cursor, Wishlist.cursor_types(sort)) if cursor else None
+    except (DataValidationError, ValueError) as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+
+    params = {"limit": limit, "offset": 0 if after else (page - 1) * limit}
+    for key in ("name", "userid"):
+        if request.query_params.get(key):
+            params[key] = request.query_params[key]
+    if after:
+        params["after_id"] = after[-1]
+        if len(after) > 1:
+            params["after_value"] = Decimal(str(after[0])) if sort.lstrip("-") == "total_value" else after[0]
+
+    # The list statements are shared with the Flask routes; products are loaded
+    # eagerly because lazy loading is not available on an AsyncSession
+    filters = tuple(key for key in ("name", "userid") if key in params)
+    statement = select_page(Wishlist, filters, ("products",), sort, after is not None)
+    async with request.app.state.sessions() as session:
+        wishlists = (await session.scalars(statement, params)).all()
+        headers = {"X-Next-Cursor": cursors.encode(wishlists[-1].cursor(sort))} if len(wishlists) == limit else {}
+        return JSONResponse([wishlist.serialize() for wishlist in wishlists], status.HTTP_200_OK, headers)
+
+
+async def get_wishlist(request):
+    """Retrieve a Wishlist by its ID"""
+    wishlist_id = request.path_params["wishlist_id"]
+    logger.info("Request for Wishlist with id: %s", wishlist_id)
+    async with request.app.state.sessions() as session:
+        wishlist = await find_wishlist(session, wishlist_id)
+        return JSONResponse(wishlist.serialize(), status.HTTP_200_OK)
+
+
+async def update_wishlist(request):
+    """Update a Wishlist (only 'name' is allowed to change)"""
+    wishlist_id = request.path_params["wishlist_id"]
+    logger.info("Request to update Wishlist with id [%s]", wishlist_id)
+    data = await get_json(request)
+    async with request.app.state.sessions() as session:
+        wishlist = await find_wishlist(session, wishlist_id)
+        if "name" not in data:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Missing required field: name")
+        wishlist.name = data["name"]
+        await session.commit()
+        return JSONResponse(wishlist.serialize(), status.HTTP_200_OK)
+
+
+async def delete_wishlist(request):
+    """Delete a Wishlist by ID"""
+    wishlist_id = request.path_params["wishlist_id"]
+    logger.info("Request to delete wishlist with id: %s", wishlist_id)
+    async with request.app.state.sessions() as session:
+        wishlist = await session.get(Wishlist, wishlist_id)
+        if wishlist:
+            await session.delete(wishlist)
+            await session.commit()
+    # Return 204 regardless of whether the wishlist existed
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+######################################################################
+#  P R O D U C T   E N D P O I N T S
+######################################################################
+async def create_product(request):
+    """Create a new Product in a Wishlist"""
+    wishlist_id = request.path_params["wishlist_id"]
+    logger.info("Request to create Product for Wishlist with id: %s", wishlist_id)
+    data = await get_json(request)
+    async with request.app.state.sessions() as session:
+        await find_wishlist(session, wishlist_id, with_products=False)
+        product = Product()
+        try:
+            product.deserialize(data)
+        except DataValidationError as error:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Invalid product data: {error}") from error
+        product.wishlist_id = wishlist_id
+        session.add(product)
+        await session.commit()
+
+    location_url = str(request.url_for("product_resource", wishlist_id=wishlist_id, product_id=product.id))
+    return JSONResponse(product.serialize(), status.HTTP_201_CREATED, {"Location": location_url})
+
+
+async def list_products(request):
+    """Returns the Products of a Wishlist, optionally filtered by name and price, sorted and paged"""
+    wishlist_id = request.path_params["wishlist_id"]
+    logger.info("Request for all Products for Wishlist with id: %s", wishlist_id)
+    filters = Product.listing_filters(
+        wishlist_id,
+        (request.query_params.get("product_name") or "").strip(),
+        price_arg(request, "min_price"),
+        price_arg(request, "max_price"),
+    )
+    try:
+        order = Product.sort_order(request.query_params.get("sort") or "created")
+    except DataValidationError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+    limit = max(1, int_arg(request, "limit", 1)) if request.query_params.get("limit") else None
+    offset = (max(1, int_arg(request, "page", 1)) - 1) * limit if limit else 0
+    fields = fields_arg(request)
+
+    # Same statement as the Flask route's Product.find_by_wishlist()
+    statement = select_page(Product, tuple(sorted(filters)), (), order, columns=fields or ())
+    if limit is None:
+        statement = statement.limit(None)
+    params = {"limit": limit, "offset": offset, **filter_parameters(filters)}
+    async with request.app.state.sessions() as session:
+        await find_wishlist(session, wishlist_id, with_products=False)
+        products = (await session.scalars(statement, params)).all()
+        return JSONResponse([p.serialize(fields) for p in products], status.HTTP_200_OK)
+
+
+async def get_product(request):
+    """Retrieve a single Product by its ID within a Wishlist"""
+    wishlist_id = request.path_params["wishlist_id"]
+    product_id = request.path_params["product_id"]
+    logger.info("Request to retrieve Product %s for Wishlist id: %s", product_id, wishlist_id)
+    fields = fields_arg(request)
+    async with request.app.state.sessions() as session:
+        product = await find_product(session, wishlist_id, product_id, fields or ())
+        return JSONResponse(product.serialize(fields), status.HTTP_200_OK)
+
+
+async def update_product(request):
+    """Full update of a Product (PUT)"""
+    wishlist_id = request.path_params["wishlist_id"]
+    product_id = request.path_params["product_id"]
+    logger.info("Request to fully update Product %s in Wishlist %s", product_id, wishlist_id)
+    data = await get_json(request)
+    async with request.app.state.sessions() as session:
+        product = await find_product(session, wishlist_id, product_id)
+        if not data:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Missing product data")
+        missing = [f for f in ("name", "price", "quantity", "description") if f not in data]
+        if missing:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Missing required fields: {', '.join(missing)}")
+
+        product.name = data["name"]
+        product.price = data["price"]
+        product.quantity = data["quantity"]
+        product.description = data["description"]
+        product.note = data.get("note", product.note)
+        product.is_gift = data.get("is_gift", False if product.is_gift is None else product.is_gift)
+        product.purchased = data.get("purchased", product.purchased)
+        await session.commit()
+        return JSONResponse(product.serialize(), status.HTTP_200_OK)
+
+
+async def patch_product(request):
+    """Partial update of a Product (note, is_gift, quantity, purchased)"""
+    wishlist_id = request.path_params["wishlist_id"]
+    product_id = request.path_params["product_id"]
+    logger.info("Request to partially update Product %s in Wishlist %s", product_id, wishlist_id)
+    data = await get_json(request)
+    if not data:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Request must contain data")
+
+    allowed_fields = {"note", "is_gift", "quantity", "purchased"}
+    if not any(f in data for f in allowed_fields):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "PATCH must include note, is_gift, quantity, or purchased")
+
+    async with request.app.state.sessions() as session:
+        product = await find_product(session, wishlist_id, product_id)
+        if "quantity" in data:
+            if data["quantity"] == 0:
+                await session.delete(product)
+                await session.commit()
+                return Response(status_code=status.HTTP_204_NO_CONTENT)
+            if not isinstance(data["quantity"], int) or data["quantity"] < 0:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, "Quantity must be a non-negative integer")
+        for field in allowed_fields & data.keys():
+            setattr(product, field, data[field])
+        await session.commit()
+        return JSONResponse(product.serialize(), status.HTTP_200_OK)
+
+
+async def delete_product(request):
+    """Delete a Product from a Wishlist"""
+    wishlist_id = request.path_params["wishlist_id"]
+    product_id = request.path_params["product_id"]
+    logger.info("Request to delete Product %s for Wishlist id: %s", product_id, wishlist_id)
+    async with request.app.state.sessions() as session:
+        product = await session.get(Product, product_id)
+        # Only delete the product if it is linked to this wishlist
+        if product and product.wishlist_id == wishlist_id:
+            await session.delete(product)
+            await session.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+routes = [
+    Route("/health", health_check, methods=["GET"]),
+    Route("/api/wishlists", create_wishlist, methods=["POST"], name="wishlist_collection"),
+    Route("/api/wishlists", list_wishlists, methods=["GET"]),
+    Route("/api/wishlists/{wishlist_id:int}", get_wishlist, methods=["GET"], name="wishlist_resource"),
+    Route("/api/wishlists/{wishlist_id:int}", update_wishlist, methods=["PUT"]),
+    Route("/api/wishlists/{wishlist_id:int}", delete_wishlist, methods=["DELETE"]),
+    Route("/api/wishlists/{wishlist_id:int}/products", create_product, methods=["POST"], name="product_collection"),
+    Route("/api/wishlists/{wishlist_id:int}/products", list_products, methods=["GET"]),
+    Route("/api/wishlists/{wishlist_id:int}/products/{product_id:int}", get_product, methods=["GET"], name="product_resource"),
+    Route("/api/wishlists/{wishlist_id:int}/products/{product_id:int}", update_product, methods=["PUT"]),
+    Route("/api/wishlists/{wishlist_id:int}/products/{product_id:int}", patch_product, methods=["PATCH"]),
+    Route("/api/wishlists/{wishlist_id:int}/products/{product_id:int}", delete_product, methods=["DELETE"]),
+]
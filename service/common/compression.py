@@ -0,0 +1,130 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Response Compression
+
+Bodies of one of the COMPRESSIBLE_TYPES (JSON, MessagePack, JavaScript,
+XML and text) of at least COMPRESS_MIN_SIZE bytes are compressed with the
+encoding the client prefers in Accept-Encoding: brotli or gzip.
+The levels default to fast ones, gzip 5 and brotli 4, which get most of
+the size reduction of the highest levels in a fraction of the time;
+COMPRESS_LEVEL=0 turns compression off.
+
+A compressed response gets a weak ETag, since its bytes differ from the
+uncompressed ones. Responses with a strong ETag are the same every time
+they are served, so their compressed bytes are kept in an LRU of
+COMPRESS_CACHE_SIZE entries and compressed only once.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+import brotli
+from flask import request
+
+# Media types that are worth compressing
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/javascript", "application/xml", "text/")
+
+
+class Compressor:
+    """Compresses bodies and keeps the compressed bytes of cacheable ones"""
+
+    # The encodings that can be produced, most preferred first
+    encodings = ("br", "gzip")
+
+    def __init__(self, level=5, brotli_quality=4, cache_size=256):
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self.hits = 0
+        self._cache = OrderedDict()  # (path, etag, content type, encoding) -> bytes
+        self._lock = threading.Lock()
+
+    def choose(self, accept_encodings) -> str:
+        """Returns the encoding to use for an Accept-Encoding header, or None"""
+        # max() keeps the first of equally acceptable encodings
+        encoding = max(self.encodings, key=accept_encodings.quality)
+        return encoding if accept_encodings.quality(encoding) > 0 else None
+
+    def compress(self, body: bytes, encoding: str, key: tuple = None) -> bytes:
+        """Returns body compressed with encoding, from the cache if it is under key"""
+        if key is not None and self.cache_size:
+            with self._lock:
+                if (*key, encoding) in self._cache:
+                    self._cache.move_to_end((*key, encoding))
+                    self.hits += 1
+                    return self._cache[(*key, encoding)]
+        if encoding == "br":
+            data = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # mtime=0 gives the same bytes for the same body
+            data = gzip.compress(body, compresslevel=self.level, mtime=0)
+        if key is not None and self.cache_size:
+            with self._lock:
+                self._cache[(*key, encoding)] = data
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return data
+
+
+def compressible(response, min_size: int) -> bool:
+    """Returns whether a response body is worth compressing"""
+    return (
+        response.status_code >= 200
+        and response.status_code not in (204, 304)
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and "Content-Encoding" not in response.headers
+        and response.mimetype is not None
+        and response.mimetype.startswith(COMPRESSIBLE_TYPES)
+        and response.content_length is not None
+        and response.content_length >= min_size
+    )
+
+
+def init_compression(app):
+    """Compresses the responses of the app
+
+    Called before the other hooks are installed so that it runs after them
+    (Flask runs after_request functions in reverse order) and compresses the
+    final body.
+    """
+    compressor = Compressor(
+        app.config.get("COMPRESS_LEVEL", 5),
+        app.config.get("COMPRESS_BROTLI_QUALITY", 4),
+        app.config.get("COMPRESS_CACHE_SIZE", 256),
+    )
+    app.extensions["compression"] = compressor
+
+    def compress_response(response):
+        if not compressor.level or not compressible(response, app.config.get("COMPRESS_MIN_SIZE", 1024)):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = compressor.choose(request.accept_encodings)
+        if encoding is None:
+            return response
+        etag, weak = response.get_etag()
+        # Only a strong ETag promises the same bytes every time, and only for
+        # the resource it belongs to
+        key = (request.path, etag, response.content_type) if etag and not weak else None
+        response.set_data(compressor.compress(response.get_data(), encoding, key))
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+    app.after_request(compress_response)
+    return compressor
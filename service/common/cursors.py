@@ -0,0 +1,56 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Pagination Cursors
+
+A cursor holds the sort key of the last item of a page as URL safe base64
+JSON, which clients pass back as is. The next page is read from after that
+key (keyset pagination), so deep pages cost the same as the first and rows
+written in between are neither skipped nor repeated.
+"""
+import base64
+import binascii
+import json
+
+
+def encode(values: tuple) -> str:
+    """Returns the cursor for the sort key values of the last item of a page"""
+    data = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode(cursor: str, types: tuple) -> tuple:
+    """Returns the sort key values of a cursor
+
+    Args:
+        cursor (string): a cursor made by encode()
+        types (tuple): the type (or tuple of types) each value must have
+
+    Raises:
+        ValueError: if the cursor was not made by encode() for these types
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor {cursor!r}") from error
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(values, types))
+    ):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return tuple(values)
@@ -0,0 +1,110 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Request Deadlines
+
+Bounds the time a request may spend waiting on the database so a single
+slow request cannot hold a gunicorn worker for seconds:
+
+- every pooled Postgres connection gets the full budget as its default
+  statement_timeout, so a runaway query is cancelled server side
+- a transaction started after part of the budget is used gets
+  SET LOCAL statement_timeout with only the time that is left, and one
+  whose endpoint has a larger (or no) budget gets that instead
+- a query about to start after the deadline is refused in Python
+
+Budgets come from DB_REQUEST_BUDGET_MS with per-endpoint overrides in
+DB_ENDPOINT_BUDGETS_MS. A budget of 0 disables the deadline.
+"""
+import time
+from flask import g, has_request_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as DatabaseTimeoutError
+
+
+class DeadlineExceeded(DatabaseTimeoutError):
+    """Raised when a request runs out of database time before a query"""
+
+
+def request_budget_ms(app) -> int:
+    """Returns the database budget for the current request in milliseconds"""
+    budgets = app.config.get("DB_ENDPOINT_BUDGETS_MS", {})
+    return budgets.get(request.endpoint, app.config.get("DB_REQUEST_BUDGET_MS", 0))
+
+
+def remaining_ms():
+    """Returns the milliseconds left for the current request or None"""
+    if not has_request_context() or g.get("db_deadline") is None:
+        return None
+    return (g.db_deadline - time.monotonic()) * 1000
+
+
+def start_deadline():
+    """Records the database deadline at the start of a request"""
+    budget = request_budget_ms(current_app)
+    g.db_deadline = time.monotonic() + budget / 1000 if budget > 0 else None
+
+
+def on_connect(budget_ms):
+    """Returns a connect listener that sets the default statement timeout"""
+
+    def set_statement_timeout(dbapi_connection, connection_record):
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"SET statement_timeout = {int(budget_ms)}")
+        dbapi_connection.commit()
+        connection_record.info["statement_timeout_ms"] = budget_ms
+
+    return set_statement_timeout
+
+
+def on_begin(session, transaction, connection):  # pylint: disable=unused-argument
+    """Sets the statement timeout to what is left of the request budget"""
+    if not has_request_context() or connection.dialect.name != "postgresql":
+        return
+    default = connection.info.get("statement_timeout_ms")
+    remaining = remaining_ms()
+    if remaining is None:
+        # An endpoint without a budget is not held to the connection default
+        if default:
+            connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        return
+    # The connection defaults to DB_REQUEST_BUDGET_MS: raise it for larger
+    # endpoint budgets, and tighten it once a meaningful part is used
+    if default is None or remaining > default or remaining < 0.9 * default:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(remaining))}")
+
+
+def before_cursor_execute(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+    """Refuses to start a query once the request is past its deadline"""
+    remaining = remaining_ms()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Request exceeded its database time budget before: {statement}")
+
+
+def is_statement_timeout(error) -> bool:
+    """Returns True if a DBAPI error is a server side statement timeout"""
+    return getattr(getattr(error, "orig", None), "sqlstate", None) == "57014"
+
+
+def init_deadlines(app, db):
+    """Installs the request deadline hooks on the app and its engine"""
+    app.before_request(start_deadline)
+    event.listen(db.session, "after_begin", on_begin)
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    budget = app.config.get("DB_REQUEST_BUDGET_MS", 0)
+    if budget > 0 and db.engine.dialect.name == "postgresql":
+        event.listen(db.engine, "connect", on_connect(budget))
@@ -17,9 +17,12 @@
 Module: error_handlers
 """
 from flask import current_app as app  # Import Flask application
+from flask import request
+from sqlalchemy.exc import OperationalError, TimeoutError as DatabaseTimeoutError
 from service.routes import api
-from service.models import DataValidationError
+from service.models import db, DataValidationError
 from . import status
+from .deadlines import is_statement_timeout
 
 
 ######################################################################
@@ -35,3 +38,34 @@ def request_validation_error(error):
         "error": "Bad Request",
         "message": message,
     }, status.HTTP_400_BAD_REQUEST
+
+
+@api.errorhandler(DatabaseTimeoutError)
+def database_timeout(error):
+    """Handles requests that ran out of database time or connections"""
+    db.session.rollback()
+    app.logger.error("Database time budget exceeded on %s: %s", request.endpoint, error)
+    return {
+        "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+        "error": "Service Unavailable",
+        "message": "The request exceeded its database time budget",
+    }, status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@api.errorhandler(OperationalError)
+def database_unavailable(error):
+    """Handles statement timeouts and lost database connections"""
+    db.session.rollback()
+    if is_statement_timeout(error):
+        app.logger.error("Statement timeout on %s: %s", request.endpoint, error.statement)
+        return {
+            "status_code": status.HTTP_504_GATEWAY_TIMEOUT,
+            "error": "Gateway Timeout",
+            "message": "The database did not answer within the request time budget",
+        }, status.HTTP_504_GATEWAY_TIMEOUT
+    app.logger.error("Database unavailable on %s: %s", request.endpoint, error)
+    return {
+        "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+        "error": "Service Unavailable",
+        "message": "The database is unavailable",
+    }, status.HTTP_503_SERVICE_UNAVAILABLE
@@ -19,18 +19,267 @@ Log Handlers
 
 This module contains utility functions to set up logging
 consistently
+
+With LOG_QUEUE on (the default) the app logger only puts records on a
+queue; a background thread formats them and runs the gunicorn handlers, so
+requests never wait on log I/O. When the queue is full records are dropped
+and counted rather than blocking the request.
+
+LOG_FORMAT=json writes one JSON object per line. Records logged during a
+request carry its request id (X-Request-ID), route, elapsed time and the
+time spent in SQL so far. Each message template at LOG_RATE_LEVEL
+(WARNING) or above may be logged LOG_RATE_LIMIT times per LOG_RATE_WINDOW
+seconds; the rest are counted and reported in one summary record when the
+window ends. Lower levels, such as the INFO request lines, are never cut.
 """
+import atexit
+import json
 import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request, current_app
+
+# Formats used for all app log records
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+# Logger the models write to
+MODEL_LOGGER = "flask.app"
+
+# Request ids accepted from the X-Request-ID header, anything else is replaced
+REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+######################################################################
+#  F O R M A T T E R S   A N D   F I L T E R S
+######################################################################
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON objects"""
+
+    # Optional attributes copied to the output when a record has them
+    FIELDS = (
+        "request_id", "trace_id", "method", "route", "path", "status",
+        "latency_ms", "db_ms", "db_queries", "query_ms", "suppressed", "message_key",
+    )
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Adds the request id, route and timings of the current request to records"""
+
+    def filter(self, record):
+        if has_request_context() and "request_id" in g:
+            fields = record.__dict__
+            fields.setdefault("request_id", g.request_id)
+            fields.setdefault("method", request.method)
+            fields.setdefault("route", request.endpoint)
+            fields.setdefault("path", request.path)
+            fields.setdefault("latency_ms", round((time.perf_counter() - g.request_start) * 1000, 2))
+            if "trace_root" in g:
+                fields.setdefault("trace_id", g.trace_root.trace_id)
+            stats = g.get("query_stats")
+            if stats is not None:
+                fields.setdefault("db_ms", round(stats.seconds * 1000, 2))
+                fields.setdefault("db_queries", stats.count)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets each message template through limit times per window of seconds
+
+    Only records at level or above are limited, the others always pass.
+    Records can name a narrower key than their template with a message_key
+    extra field.
+    Records over the limit are dropped and counted. When the window ends
+    the first record logged after it is preceded by one summary record per
+    template that was cut, at that template's level, with the count.
+    """
+
+    def __init__(self, limit=10, window=10.0, level=logging.WARNING):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.level = level
+        self._lock = threading.Lock()
+        self._current = None
+        self._counts = defaultdict(int)  # (logger, level, template) -> records this window
+
+    def filter(self, record):
+        if getattr(record, "suppressed", None) is not None:
+            return True
+        window = int(time.monotonic() // self.window)
+        key = (record.name, record.levelno, getattr(record, "message_key", None) or str(record.msg))
+        with self._lock:
+            if window != self._current:
+                summaries = [(key, count - self.limit) for key, count in self._counts.items() if count > self.limit]
+                self._current = window
+                self._counts.clear()
+            else:
+                summaries = ()
+            allowed = True
+            if record.levelno >= self.level:
+                self._counts[key] += 1
+                allowed = self._counts[key] <= self.limit
+        for (name, level, template), count in summaries:
+            self.summarize(name, level, template, count)
+        return allowed
+
+    def summarize(self, name, level, template, count) -> None:
+        """Logs how many records of a template were suppressed"""
+        logging.getLogger(name).log(
+            level,
+            "Suppressed %d similar log records in %gs: %s",
+            count, self.window, template,
+            extra={"suppressed": count, "message_key": template},
+        )
+
+
+######################################################################
+#  Q U E U E D   H A N D L E R S
+######################################################################
+class NonBlockingQueueHandler(QueueHandler):
+    """Queues records for a QueueListener without waiting for room
+
+    Only the message is rendered in the caller so later changes to the
+    logged objects cannot alter it; the formatter runs on the listener.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogQueue:
+    """A queue handler and the listener thread that drains it into handlers"""
+
+    def __init__(self, handlers, size=10000):
+        self.handlers = handlers
+        self.size = size
+        self.handler = NonBlockingQueueHandler(queue.Queue(size))
+        self.listener = None
+        self.start()
+        atexit.register(self.stop)
+        # Threads do not survive fork, so gunicorn workers forked from a
+        # preloaded app start their own listener
+        os.register_at_fork(after_in_child=self.restart)
+
+    def start(self) -> None:
+        """Starts draining the queue on a background thread"""
+        self.listener = QueueListener(self.handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def restart(self) -> None:
+        """Replaces the queue and listener inherited from a parent process"""
+        if self.listener is not None:
+            self.handler.queue = queue.Queue(self.size)
+            self.start()
+
+    def stop(self) -> None:
+        """Writes out the queued records and stops the listener thread"""
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+
+
+######################################################################
+#  S E T U P
+######################################################################
+def start_request():
+    """Gives the request an id, taken from X-Request-ID when it sends a usable one"""
+    request_id = request.headers.get("X-Request-ID", "")
+    g.request_id = request_id if REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+
+
+def finish_request(response):
+    """Returns the request id and logs the finished request when LOG_REQUESTS is on"""
+    if "request_id" not in g:
+        return response
+    response.headers["X-Request-ID"] = g.request_id
+    if current_app.config.get("LOG_REQUESTS"):
+        current_app.logger.info(
+            "%s %s %s", request.method, request.path, response.status_code, extra={"status": response.status_code}
+        )
+    return response
+
+
+def init_request_logging(app):
+    """Installs the hooks that give every request an id for its log records"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
 
 
 def init_logging(app, logger_name: str):
-    """Set up logging for production"""
-    app.logger.propagate = False
+    """Set up logging for production
+
+    The models log to MODEL_LOGGER, which gets the same handlers, level
+    and filters as the app logger.
+    """
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
-    app.logger.setLevel(gunicorn_logger.level)
+    handlers = gunicorn_logger.handlers
+    loggers = (app.logger, logging.getLogger(MODEL_LOGGER))
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config.get("LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    filters = [RequestContextFilter()]
+    if app.config.get("LOG_RATE_LIMIT", 10) > 0:
+        filters.append(RateLimitFilter(
+            app.config.get("LOG_RATE_LIMIT", 10),
+            app.config.get("LOG_RATE_WINDOW", 10.0),
+            logging.getLevelName(app.config.get("LOG_RATE_LEVEL", "WARNING")),
+        ))
+    for handler in handlers:
         handler.setFormatter(formatter)
+    if app.config.get("LOG_QUEUE", True) and handlers:
+        old = app.extensions.pop("log_queue", None)
+        if old is not None:
+            old.stop()
+        app.extensions["log_queue"] = LogQueue(list(handlers), app.config.get("LOG_QUEUE_SIZE", 10000))
+        handlers = [app.extensions["log_queue"].handler]
+    for logger in loggers:
+        logger.propagate = False
+        logger.handlers = handlers
+        logger.setLevel(gunicorn_logger.level)
+        logger.filters = list(filters)
     app.logger.info("Logging handler established")
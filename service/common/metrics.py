@@ -0,0 +1,128 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Prometheus Metrics
+
+Request and database metrics labelled by the flask_restx endpoint name
+(wishlist_collection, product_resource, ...) and served by /metrics.
+
+Under gunicorn every worker is a separate process, so metrics are kept in
+multiprocess mode: each process writes its values to files in
+PROMETHEUS_MULTIPROC_DIR and /metrics adds them up. gunicorn.conf.py sets
+the directory up before the app is imported and cleans up after workers
+that exit. Without the variable the values live in this process only.
+"""
+import os
+import time
+from flask import g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from service.common import sql_timing
+
+# Label for requests that did not match a route, so unknown URLs cannot
+# create new time series
+UNMATCHED = "unmatched"
+
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["endpoint", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["endpoint", "method", "status"]
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", ["endpoint"], multiprocess_mode="livesum"
+)
+DB_QUERIES = Counter(
+    "db_queries_total", "SQL statements executed", ["endpoint"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ["endpoint"], buckets=DB_BUCKETS
+)
+
+
+def endpoint_label() -> str:
+    """Returns the endpoint of the current request for use as a label"""
+    if not has_request_context():
+        return "none"
+    return request.endpoint or UNMATCHED
+
+
+######################################################################
+# Request hooks
+######################################################################
+def start_request():
+    """Counts the request as in progress and starts its timer"""
+    g.metrics_endpoint = endpoint_label()
+    g.metrics_start = time.perf_counter()
+    IN_PROGRESS.labels(g.metrics_endpoint).inc()
+
+
+def record_response(response):
+    """Records the latency and status of a finished request"""
+    if "metrics_start" in g:
+        labels = (g.metrics_endpoint, request.method, str(response.status_code))
+        REQUESTS.labels(*labels).inc()
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - g.metrics_start)
+    return response
+
+
+def end_request(error=None):  # pylint: disable=unused-argument
+    """Takes the request out of the in progress gauge"""
+    if "metrics_start" in g:
+        IN_PROGRESS.labels(g.metrics_endpoint).dec()
+        del g.metrics_start
+
+
+######################################################################
+# Engine hooks
+######################################################################
+def record_statement(conn, statement, parameters, executemany, seconds):  # pylint: disable=unused-argument
+    """Records the count and duration of a SQL statement"""
+    endpoint = endpoint_label()
+    DB_QUERIES.labels(endpoint).inc()
+    DB_QUERY_LATENCY.labels(endpoint).observe(seconds)
+
+
+######################################################################
+# Exposition
+######################################################################
+def render() -> tuple:
+    """Returns the metrics of all processes in the text exposition format"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_metrics(app, db):
+    """Installs the metrics hooks on the app and its engine"""
+    app.before_request(start_request)
+    app.after_request(record_response)
+    app.teardown_request(end_request)
+    sql_timing.on_statement(db.engine, record_statement)
@@ -0,0 +1,185 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Live Profiling
+
+Profiles report collapsed stacks, one "frame;frame;frame weight" line per
+distinct stack, which flamegraph.pl, speedscope and inferno read directly.
+
+- GET /admin/profile?seconds=N samples the stacks of every other thread of
+  the worker that serves it. It needs "Authorization: Bearer <ADMIN_TOKEN>"
+  and is turned off while ADMIN_TOKEN is empty. A sync gunicorn worker is
+  busy with the profile request itself, so use it with gthread workers or
+  send the signal instead.
+- SIGUSR2 sent to a gunicorn worker (not the master, where it means
+  upgrade) samples that worker in a background thread for PROFILE_SECONDS
+  and writes the stacks to PROFILE_DIR/<pid>-<time>.collapsed.
+- ?profile=1 on any request, in debug mode only, records every call the
+  request makes and returns the stacks weighted by microseconds instead
+  of the response.
+"""
+import hmac
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from flask import g, request, current_app
+
+# Default and fastest sampling intervals in milliseconds
+DEFAULT_INTERVAL_MS = 5.0
+MIN_INTERVAL_MS = 1.0
+
+
+def frame_name(frame) -> str:
+    """Returns module.qualified_name of the function running in frame"""
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+def collapse(stacks: Counter) -> str:
+    """Returns stacks in the collapsed format, heaviest first"""
+    return "".join(f"{stack} {weight}\n" for stack, weight in stacks.most_common() if weight > 0)
+
+
+######################################################################
+#  S A M P L I N G   P R O F I L E R
+######################################################################
+def sample(seconds: float, interval_ms: float = DEFAULT_INTERVAL_MS, stop: threading.Event = None) -> Counter:
+    """Counts the stacks of all other threads every interval for seconds
+
+    Each stack starts with the name of its thread, so idle pool threads
+    and request threads can be told apart in the flamegraph.
+    """
+    stacks = Counter()
+    own = threading.get_ident()
+    interval = max(interval_ms, MIN_INTERVAL_MS) / 1000
+    stop = stop or threading.Event()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            functions = []
+            while frame is not None:
+                functions.append(frame_name(frame))
+                frame = frame.f_back
+            functions.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(functions))] += 1
+        if stop.wait(interval):
+            break
+    return stacks
+
+
+def profile_to_file(seconds: float, folder: str, interval_ms: float = DEFAULT_INTERVAL_MS) -> str:
+    """Samples this process and writes the collapsed stacks to a new file in folder"""
+    path = os.path.join(folder, f"{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+    stacks = sample(seconds, interval_ms)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(collapse(stacks))
+    return path
+
+
+def install_signal_handler(signum, seconds: float = 10.0, folder: str = None) -> None:
+    """Profiles this process in the background whenever it receives signum"""
+    folder = folder or tempfile.gettempdir()
+
+    def handler(signum, frame):  # pylint: disable=unused-argument
+        threading.Thread(target=profile_to_file, args=(seconds, folder), name="profiler", daemon=True).start()
+
+    signal.signal(signum, handler)
+
+
+def authorized() -> bool:
+    """Returns whether the request carries the ADMIN_TOKEN bearer token"""
+    token = current_app.config.get("ADMIN_TOKEN")
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+######################################################################
+#  R E Q U E S T   P R O F I L E R
+######################################################################
+class CallProfiler:
+    """Records the time spent in every call stack of the current thread
+
+    Uses sys.setprofile, so it sees calls that are too short for sampling
+    but slows the profiled code down several times; only for debugging.
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._open = []  # [stack, start ns, ns spent in callees] per active call
+
+    def start(self) -> None:
+        """Starts recording calls made by this thread"""
+        sys.setprofile(self._event)
+
+    def stop(self) -> Counter:
+        """Stops recording and returns microseconds spent per stack"""
+        sys.setprofile(None)
+        while self._open:
+            self._leave(time.perf_counter_ns())
+        return Counter({stack: nanoseconds // 1000 for stack, nanoseconds in self.stacks.items()})
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if event == "call":
+            self._enter(frame_name(frame), now)
+        elif event == "c_call":
+            self._enter(f"{getattr(arg, '__module__', None) or 'builtins'}.{getattr(arg, '__qualname__', arg)}", now)
+        elif self._open:  # return, c_return, c_exception
+            self._leave(now)
+
+    def _enter(self, name, now):
+        stack = f"{self._open[-1][0]};{name}" if self._open else name
+        self._open.append([stack, now, 0])
+
+    def _leave(self, now):
+        stack, start, callees = self._open.pop()
+        elapsed = now - start
+        self.stacks[stack] += elapsed - callees
+        if self._open:
+            self._open[-1][2] += elapsed
+
+
+def start_request():
+    """Profiles the request when debugging and it asks for ?profile=1"""
+    if current_app.debug and request.args.get("profile") == "1":
+        g.call_profiler = CallProfiler()
+        g.call_profiler.start()
+
+
+def finish_request(response):
+    """Replaces the response of a profiled request with its collapsed stacks"""
+    profiler = g.pop("call_profiler", None)
+    if profiler is None:
+        return response
+    body = collapse(profiler.stop())
+    profiled = current_app.response_class(body, mimetype="text/plain")
+    profiled.headers["X-Profiled-Status"] = str(response.status_code)
+    return profiled
+
+
+def init_profiler(app):
+    """Installs the ?profile=1 request hooks on the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
@@ -0,0 +1,82 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Per-request Query Statistics
+
+Counts the SQL statements a request executes and the time they take.
+Outside production (debug, testing or DB_STATS_HEADERS=true) the totals
+are returned in the X-DB-Queries and Server-Timing response headers.
+
+A statement that runs N_PLUS_ONE_THRESHOLD or more times in one request
+is logged as a likely N+1 query, e.g. a lazy relationship loaded once per
+row of a list.
+"""
+from collections import Counter
+from flask import g, has_request_context, request, current_app
+from service.common import sql_timing
+
+
+class QueryStats:
+    """The SQL statements executed by one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        """Adds one executed statement"""
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list:
+        """Returns (statement, times) for statements run at least threshold times"""
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+def start_request():
+    """Starts an empty tally for the request"""
+    g.query_stats = QueryStats()
+
+
+def record_statement(conn, statement, parameters, executemany, seconds):  # pylint: disable=unused-argument
+    """Adds a finished SQL statement to the tally of the request"""
+    if has_request_context() and "query_stats" in g:
+        g.query_stats.record(statement, seconds)
+
+
+def finish_request(response):
+    """Reports likely N+1 queries and adds the totals to the response"""
+    stats = g.get("query_stats")
+    if stats is None:
+        return response
+    for statement, times in stats.repeated(current_app.config.get("N_PLUS_ONE_THRESHOLD", 5)):
+        current_app.logger.warning(
+            "Possible N+1 query in %s: statement ran %d times: %s", request.endpoint, times, statement
+        )
+    if current_app.debug or current_app.testing or current_app.config.get("DB_STATS_HEADERS"):
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers.add("Server-Timing", f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"')
+    return response
+
+
+def init_query_stats(app, db):
+    """Installs the query statistics hooks on the app and its engine"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    sql_timing.on_statement(db.engine, record_statement)
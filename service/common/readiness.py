@@ -0,0 +1,160 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Readiness Checks
+
+/ready answers from state that is already in memory, so a probe never
+waits on the database or for a pooled connection:
+
+- a background thread in each worker runs SELECT 1 when it starts and
+  then every READY_PROBE_INTERVAL seconds and keeps the outcome; until
+  the first result is in the worker reports not ready, and a result older
+  than three intervals counts as a failure, since the probe itself is stuck
+- pool saturation is read from the pool counters when asked; the worker
+  reports not ready once READY_POOL_SATURATION of its connections
+  (pool_size + max_overflow) are checked out, and the ping is skipped
+  then so it does not take one of the last connections
+
+With REPOSITORY_BACKEND=memory there is no database to check. An
+in-memory SQLite database (StaticPool) has a single connection that all
+threads share, so it is pinged in the request instead of from a thread.
+"""
+import logging
+import os
+import threading
+import time
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+logger = logging.getLogger("flask.app")
+
+
+class Readiness:
+    """Cached database and connection pool checks for one worker process"""
+
+    def __init__(self, engine, interval=5.0, max_saturation=1.0):
+        self.engine = engine
+        self.interval = interval
+        self.max_saturation = max_saturation
+        self._lock = threading.Lock()
+        self._result = None  # (ok, detail, latency ms, monotonic time)
+        self._pid = None
+        self._stop = threading.Event()
+
+    @property
+    def shared(self) -> bool:
+        """Whether all threads share one connection, as with in-memory SQLite"""
+        return isinstance(self.engine.pool, StaticPool)
+
+    def pool(self) -> dict:
+        """Returns the pool counters, or {} for pools that do not keep them"""
+        pool = self.engine.pool
+        if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+            return {}
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        checked_out = pool.checkedout()
+        return {
+            "checked_out": checked_out,
+            "capacity": capacity,
+            "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+        }
+
+    def saturated(self, pool: dict) -> bool:
+        """Returns whether too many of the pool's connections are in use"""
+        return bool(pool) and pool["saturation"] >= self.max_saturation
+
+    def probe(self) -> None:
+        """Pings the database and stores the outcome"""
+        if self.saturated(self.pool()):
+            self._store(False, "connection pool saturated", None)
+            return
+        start = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning("Readiness probe failed: %s", error)
+            self._store(False, f"{type(error).__name__}: {error}".splitlines()[0], None)
+            return
+        self._store(True, "ok", round((time.perf_counter() - start) * 1000, 2))
+
+    def _store(self, ok, detail, latency_ms) -> None:
+        with self._lock:
+            self._result = (ok, detail, latency_ms, time.monotonic())
+
+    def _run(self) -> None:
+        self.probe()
+        while not self._stop.wait(self.interval):
+            self.probe()
+
+    def start(self) -> None:
+        """Starts the probe thread of this process unless it runs already
+
+        Threads do not survive fork, so a gunicorn worker starts its own on
+        the first check. The first probe runs on that thread too, so the
+        check does not wait for a database that is slow to connect.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._result = None
+        if not self.shared:
+            threading.Thread(target=self._run, name="readiness-probe", daemon=True).start()
+
+    def stop(self) -> None:
+        """Stops the probe thread"""
+        self._stop.set()
+
+    def check(self) -> tuple:
+        """Returns (ready, report) without doing any I/O unless the connection is shared"""
+        self.start()
+        if self.shared:
+            self.probe()
+        with self._lock:
+            result = self._result
+        if result is None:
+            ok, detail, latency_ms, age = False, "first probe pending", None, 0.0
+        else:
+            ok, detail, latency_ms, checked = result
+            age = time.monotonic() - checked
+            if age > 3 * self.interval:
+                ok, detail = False, f"probe result is {age:.0f}s old"
+        pool = self.pool()
+        if self.saturated(pool):
+            ok, detail = False, "connection pool saturated"
+        database = {"ok": ok, "detail": detail, "latency_ms": latency_ms, "age_s": round(age, 1)}
+        return ok, {"database": database, "pool": pool}
+
+
+class MemoryReadiness:  # pylint: disable=too-few-public-methods
+    """Readiness of the in-memory repository, which has no dependencies"""
+
+    def check(self) -> tuple:
+        """Returns (ready, report)"""
+        return True, {"repository": {"ok": True, "detail": "memory"}}
+
+
+def init_readiness(app, db, memory=False):
+    """Creates the readiness checks for the app"""
+    if memory:
+        app.extensions["readiness"] = MemoryReadiness()
+    else:
+        app.extensions["readiness"] = Readiness(
+            db.engine, app.config.get("READY_PROBE_INTERVAL", 5.0), app.config.get("READY_POOL_SATURATION", 1.0)
+        )
+    return app.extensions["readiness"]
@@ -0,0 +1,117 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Slow Query Log
+
+Logs SQL statements that take longer than SLOW_QUERY_MS (0 turns the log
+off) with the route that ran them and the shape of their parameters: the
+type of each value and the length of strings, never the values themselves.
+
+In debug mode (or with SLOW_QUERY_EXPLAIN=true) the plan of the statement
+is logged too. On PostgreSQL a SELECT is run again under EXPLAIN (ANALYZE,
+BUFFERS) to show actual row counts, timings and buffer hits; other
+statements are only planned, so nothing is changed twice. SQLite gives
+EXPLAIN QUERY PLAN. A Seq Scan or SCAN over a large table in the plan
+usually means an index is missing.
+"""
+import logging
+from flask import has_request_context, request
+from service.common import sql_timing
+
+logger = logging.getLogger("flask.app")
+
+# Longest statement text logged, after folding it onto one line
+MAX_STATEMENT_LENGTH = 2000
+
+
+def parameter_shape(parameters):
+    """Describes bound parameters by type, e.g. {'name': 'str[12]', 'limit': 'int'}"""
+
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+        return [shape(value) for value in parameters]
+    return shape(parameters)
+
+
+def explain_prefix(dialect: str, statement: str):
+    """Returns the EXPLAIN to run the statement under on dialect, or None"""
+    if dialect == "postgresql":
+        if statement.lstrip().upper().startswith("SELECT"):
+            return "EXPLAIN (ANALYZE, BUFFERS) "
+        return "EXPLAIN "
+    if dialect == "sqlite":
+        return "EXPLAIN QUERY PLAN "
+    return None
+
+
+def explain(conn, statement, parameters) -> str:
+    """Returns the plan of a statement that just ran on conn
+
+    Runs on a separate DBAPI cursor in the same transaction, inside a
+    savepoint on PostgreSQL so a failure cannot abort the transaction.
+    """
+    prefix = explain_prefix(conn.dialect.name, statement)
+    if prefix is None:
+        return f"EXPLAIN is not supported on {conn.dialect.name}"
+    savepoint = conn.dialect.name == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        finally:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    except Exception as error:  # pylint: disable=broad-except
+        return f"EXPLAIN failed: {error}"
+    finally:
+        cursor.close()
+    return "\n".join(" ".join(str(column) for column in row) for row in rows)
+
+
+def init_slow_queries(app, db):
+    """Installs the slow query log on the engine of the app"""
+
+    def log_slow_statement(conn, statement, parameters, executemany, seconds):
+        elapsed_ms = seconds * 1000
+        threshold = app.config.get("SLOW_QUERY_MS", 0)
+        if not threshold or elapsed_ms < threshold:
+            return
+        route = (request.endpoint or "unmatched") if has_request_context() else "none"
+        shape = parameter_shape(parameters)
+        one_line = " ".join(statement.split())[:MAX_STATEMENT_LENGTH]
+        plan = None
+        if not executemany and (app.debug or app.config.get("SLOW_QUERY_EXPLAIN")):
+            plan = explain(conn, statement, parameters)
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s params=%s%s",
+            elapsed_ms, route, one_line, shape, f"\n{plan}" if plan else "",
+            extra={"route": route, "query_ms": round(elapsed_ms, 2), "message_key": one_line},
+        )
+
+    sql_timing.on_statement(db.engine, log_slow_statement)
@@ -0,0 +1,67 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Shared Wishlist Snapshots
+
+A shared Wishlist is served to anyone with its token as a snapshot that
+only changes when the Wishlist's version does. Each worker keeps the
+encoded snapshots of the last SHARE_CACHE_SIZE (token, version) pairs, so
+a viewer costs one indexed lookup of the Wishlist row and the products
+are only read again after a change.
+
+Responses carry Cache-Control: public with SHARE_MAX_AGE, a strong ETag
+of the version and Last-Modified, so a reverse proxy or CDN in front can
+answer most viewers itself and revalidate with a 304 afterwards.
+"""
+import threading
+from collections import OrderedDict
+
+
+class SnapshotCache:  # pylint: disable=too-few-public-methods
+    """LRU of encoded snapshots keyed by (token, version)"""
+
+    def __init__(self, size=512):
+        self.size = size
+        self.hits = 0
+        self._cache = OrderedDict()  # (token, version) -> bytes
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build) -> bytes:
+        """Returns the snapshot under key, calling build() to make it when missing"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        data = build()
+        if self.size:
+            with self._lock:
+                self._cache[key] = data
+                while len(self._cache) > self.size:
+                    self._cache.popitem(last=False)
+        return data
+
+
+def etag(version: int) -> str:
+    """Returns the ETag of a snapshot version"""
+    return f"v{version}"
+
+
+def init_snapshots(app):
+    """Creates the snapshot cache of the app"""
+    app.extensions["snapshots"] = SnapshotCache(app.config.get("SHARE_CACHE_SIZE", 512))
+    return app.extensions["snapshots"]
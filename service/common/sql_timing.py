@@ -0,0 +1,66 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+SQL Statement Timing
+
+One set of engine listeners times every SQL statement and hands the
+duration to the callbacks registered with on_statement(), so the metrics,
+the per-request query statistics and the slow query log share a single
+timer. The start times are a stack in conn.info; the start of a failed
+statement is taken off it in handle_error, so a pooled connection never
+pairs the next statement with a stale start time.
+"""
+import time
+import weakref
+from sqlalchemy import event
+
+# conn.info key of the start times of the statements running on a connection
+START_TIMES = "sql_timing_start"
+
+_callbacks = weakref.WeakKeyDictionary()  # engine -> [callback]
+
+
+def before_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    """Starts the timer of a SQL statement"""
+    conn.info.setdefault(START_TIMES, []).append(time.perf_counter())
+
+
+# pylint: disable=unused-argument, too-many-arguments, too-many-positional-arguments
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Passes a finished SQL statement and its duration to the callbacks"""
+    seconds = time.perf_counter() - conn.info[START_TIMES].pop()
+    for callback in _callbacks.get(conn.engine, ()):
+        callback(conn, statement, parameters, executemany, seconds)
+
+
+def handle_error(context):
+    """Drops the start time of a failed SQL statement"""
+    starts = context.connection.info.get(START_TIMES) if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def on_statement(engine, callback) -> None:
+    """Calls callback(conn, statement, parameters, executemany, seconds) after
+    every SQL statement that completes on engine"""
+    if engine not in _callbacks:
+        _callbacks[engine] = []
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(engine, "handle_error", handle_error)
+    _callbacks[engine].append(callback)
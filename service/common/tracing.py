@@ -0,0 +1,364 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+In-process Tracing
+
+Records where the time of a request goes as a tree of spans: one for the
+request, with children for check_content_type, the PersistentBase CRUD
+methods, marshalling, session commits and every SQL statement.
+
+Spans follow the OpenTelemetry model (32 hex digit trace ids, 16 hex digit
+span ids, W3C traceparent propagation) and are written with OTLP JSON field
+names, so they can be loaded into standard tooling. A finished trace goes
+to the exporter named by TRACE_EXPORTER:
+
+- memory (default) keeps the last TRACE_BUFFER_SIZE spans in process
+- file appends one span per line to TRACE_FILE
+
+Only a TRACE_SAMPLE_RATE fraction of requests is traced (0 turns tracing
+off), plus requests whose traceparent header asks for it. Everything else
+pays for one context variable lookup per instrumented call.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import g, request, current_app
+from flask_restx import marshalling
+from sqlalchemy import event
+
+# W3C trace context: version-trace_id-parent_id-flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+
+# SQL statements longer than this are cut short in the db.statement attribute
+MAX_STATEMENT_LENGTH = 1000
+
+# The span new spans are children of, None when the request is not traced
+_current_span = ContextVar("current_span", default=None)
+
+
+######################################################################
+#  S P A N S
+######################################################################
+class Span:  # pylint: disable=too-many-instance-attributes
+    """A timed operation within a trace"""
+
+    __slots__ = (
+        "name", "kind", "trace_id", "span_id", "parent_id", "attributes",
+        "status", "start_ns", "end_ns", "finished",
+    )
+
+    def __init__(self, name, trace_id, parent_id=None, kind="INTERNAL"):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = {}
+        self.status = "UNSET"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        # the spans of the trace that have ended, shared by all its spans
+        self.finished = []
+
+    def child(self, name, kind="INTERNAL") -> "Span":
+        """Starts a span under this one"""
+        span = Span(name, self.trace_id, self.span_id, kind)
+        span.finished = self.finished
+        return span
+
+    def record_exception(self, error) -> None:
+        """Marks the span as failed by error"""
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(error).__name__
+        self.attributes["exception.message"] = str(error)
+
+    def end(self) -> None:
+        """Stops the clock and adds the span to its trace"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.finished.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        """Returns how long the span took in milliseconds"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        """Returns the span with OTLP JSON field names"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}"},
+        }
+
+
+def current_span():
+    """Returns the active span, or None when nothing is being traced"""
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name, kind="INTERNAL", **attributes):
+    """Runs the block in a child of the active span
+
+    Yields the span, or None when the request is not traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = parent.child(name, kind)
+    span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        span.record_exception(error)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name=None):
+    """Decorator that runs a function in a span when the request is traced
+
+    Methods get spans named after the class they were called on, so
+    PersistentBase.find shows up as Wishlist.find or Product.find.
+    """
+
+    def decorator(function):
+        method = "." in function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return function(*args, **kwargs)
+            span_name = name
+            if span_name is None:
+                if method and args:
+                    owner = args[0] if isinstance(args[0], type) else type(args[0])
+                    span_name = f"{owner.__name__}.{function.__name__}"
+                else:
+                    span_name = function.__qualname__
+            with start_span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# flask_restx's marshal in a span, for responses a route marshals itself
+marshal = traced("marshal")(marshalling.marshal)
+
+
+def marshal_with(namespace, model, **kwargs):
+    """namespace.marshal_with(model, **kwargs) with the marshalling in a span
+
+    The route runs outside the span, so it only times the marshalling and
+    flask_restx itself is left untouched.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def respond(response):
+            return response
+
+        marshalled = namespace.marshal_with(model, **kwargs)(respond)
+
+        @wraps(marshalled)
+        def wrapper(*args, **kw):
+            response = function(*args, **kw)
+            with start_span("marshal"):
+                return marshalled(response)
+
+        return wrapper
+
+    return decorator
+
+
+######################################################################
+#  E X P O R T E R S
+######################################################################
+class MemoryExporter:
+    """Keeps the most recent spans in a ring buffer"""
+
+    def __init__(self, size=1000):
+        self.spans = deque(maxlen=size)
+
+    def export(self, spans) -> None:
+        """Adds the spans of a finished trace"""
+        self.spans.extend(spans)
+
+    def trace(self, trace_id) -> list:
+        """Returns the buffered spans of one trace in the order they started"""
+        return sorted((span for span in self.spans if span.trace_id == trace_id), key=lambda span: span.start_ns)
+
+
+class FileExporter:  # pylint: disable=too-few-public-methods
+    """Appends spans to a file as JSON lines"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> None:
+        """Writes the spans of a finished trace in a single append"""
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+
+
+######################################################################
+#  T R A C E R
+######################################################################
+class Tracer:
+    """Decides which requests are traced and exports their spans"""
+
+    def __init__(self, exporter, sample_rate=0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name, traceparent=None, kind="SERVER"):
+        """Returns the root span of a new trace, or None if it is not sampled
+
+        A valid traceparent header continues the caller's trace and its
+        sampled flag decides; otherwise sample_rate does.
+        """
+        match = TRACEPARENT.match(traceparent) if traceparent else None
+        if match and match.group(1) != INVALID_TRACE_ID:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None
+            return Span(name, trace_id, parent_id, kind)
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Span(name, os.urandom(16).hex(), kind=kind)
+
+    def finish_trace(self, root) -> None:
+        """Ends the root span and exports the trace"""
+        root.end()
+        try:
+            self.exporter.export(root.finished)
+        except OSError as error:
+            current_app.logger.warning("Cannot export trace %s: %s", root.trace_id, error)
+
+
+EXPORTERS = {
+    "memory": lambda config: MemoryExporter(config.get("TRACE_BUFFER_SIZE", 1000)),
+    "file": lambda config: FileExporter(config.get("TRACE_FILE", "traces.jsonl")),
+}
+
+
+######################################################################
+# Request hooks
+######################################################################
+def start_request():
+    """Starts the root span of a sampled request"""
+    root = current_app.extensions["tracer"].start_trace(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        request.headers.get("traceparent"),
+    )
+    if root is None:
+        return
+    root.attributes.update({
+        "http.request.method": request.method,
+        "url.path": request.path,
+        "http.route": request.url_rule.rule if request.url_rule else "",
+    })
+    g.trace_root = root
+    _current_span.set(root)
+
+
+def record_response(response):
+    """Adds the response status to the root span and the trace id to the response"""
+    root = g.get("trace_root")
+    if root is not None:
+        root.attributes["http.response.status_code"] = response.status_code
+        if response.status_code >= 500:
+            root.status = "ERROR"
+        response.headers["X-Trace-Id"] = root.trace_id
+    return response
+
+
+def end_request(error=None):
+    """Exports the trace of the request"""
+    root = g.pop("trace_root", None)
+    _current_span.set(None)
+    if root is not None:
+        if error is not None:
+            root.record_exception(error)
+        current_app.extensions["tracer"].finish_trace(root)
+
+
+######################################################################
+# Engine hooks
+######################################################################
+def before_cursor_execute(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+    """Starts a span for a SQL statement of a traced request"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    span = parent.child(statement.split(None, 1)[0].upper() if statement.strip() else "SQL", "CLIENT")
+    span.attributes["db.system"] = conn.dialect.name
+    span.attributes["db.statement"] = statement[:MAX_STATEMENT_LENGTH]
+    conn.info.setdefault("trace_spans", []).append(span)
+
+
+def after_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    """Ends the span of a finished SQL statement"""
+    if conn.info.get("trace_spans"):
+        conn.info["trace_spans"].pop().end()
+
+
+def handle_error(context):
+    """Ends the span of a failed SQL statement"""
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_exception(context.original_exception)
+        span.end()
+
+
+def init_tracing(app, db):
+    """Installs the tracer on the app and its engine"""
+    name = app.config.get("TRACE_EXPORTER", "memory")
+    if name not in EXPORTERS:
+        raise ValueError(f"Unknown TRACE_EXPORTER {name!r}, expected one of {sorted(EXPORTERS)}")
+    app.extensions["tracer"] = Tracer(EXPORTERS[name](app.config), app.config.get("TRACE_SAMPLE_RATE", 0.0))
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db.engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(db.engine, "handle_error", handle_error)
+    app.before_request(start_request)
+    app.after_request(record_response)
+    app.teardown_request(end_request)
+    return app.extensions["tracer"]
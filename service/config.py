@@ -11,10 +11,84 @@ DATABASE_URI = os.getenv(
 )
 
 # Configure SQLAlchemy
+# Besides Postgres, DATABASE_URI may point at SQLite for hermetic runs:
+#   sqlite:///wishlists.db  file in the instance folder, WAL journal
+#   sqlite://               in memory, shared by all threads
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 # SQLALCHEMY_POOL_SIZE = 2
 
+# Where the models are stored: "sqlalchemy" (the database) or "memory"
+# (in process, to measure the HTTP layer without a database)
+REPOSITORY_BACKEND = os.getenv("REPOSITORY_BACKEND", "sqlalchemy")
+
+# Connection pool for the async (ASGI) entry point. Requests wait for a
+# connection without holding a thread, so this can be much larger.
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "20"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW", "30"))
+
+# Time a request may spend waiting on the database (0 disables the budget).
+# Endpoints can get their own budget, e.g. {"wishlist_collection": 2000}
+DB_REQUEST_BUDGET_MS = int(os.getenv("DB_REQUEST_BUDGET_MS", "5000"))
+DB_ENDPOINT_BUDGETS_MS = {}
+
+# Add X-DB-Queries and Server-Timing headers to responses (always on when
+# debugging or testing) and warn when one statement runs this many times
+DB_STATS_HEADERS = os.getenv("DB_STATS_HEADERS", "false").lower() in ("true", "yes", "1")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Log SQL statements slower than this (0 disables) with their route and
+# parameter types, plus their EXPLAIN plan when debugging or when asked to
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() in ("true", "yes", "1")
+
+# Fraction of requests traced (0 turns tracing off; a sampled traceparent
+# header is always followed) and where finished traces go: "memory" keeps
+# the last TRACE_BUFFER_SIZE spans, "file" appends JSON lines to TRACE_FILE
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "1000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# Bearer token for the /admin endpoints (empty turns them off) and the
+# longest profile /admin/profile will take; keep it under GUNICORN_TIMEOUT
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "20"))
+
+# /ready pings the database in the background every READY_PROBE_INTERVAL
+# seconds and fails once this fraction of the pool's connections is in use
+READY_PROBE_INTERVAL = float(os.getenv("READY_PROBE_INTERVAL", "5"))
+READY_POOL_SATURATION = float(os.getenv("READY_POOL_SATURATION", "1.0"))
+
+# Compress responses of at least COMPRESS_MIN_SIZE bytes with gzip at
+# COMPRESS_LEVEL (0 turns compression off) or brotli at
+# COMPRESS_BROTLI_QUALITY; up to COMPRESS_CACHE_SIZE compressed bodies of
+# responses with an ETag are kept for reuse
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "5"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", "256"))
+
+# Shared Wishlist snapshots may be cached by clients and proxies for
+# SHARE_MAX_AGE seconds; each worker keeps the last SHARE_CACHE_SIZE
+SHARE_MAX_AGE = int(os.getenv("SHARE_MAX_AGE", "60"))
+SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", "512"))
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
+
+# Hand log records to a background thread instead of writing them in the
+# request; records beyond LOG_QUEUE_SIZE waiting ones are dropped
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("true", "yes", "1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# "text" or "json" lines; LOG_REQUESTS adds one record per finished request
+# with its status, latency and DB time. A message template logged more than
+# LOG_RATE_LIMIT times in LOG_RATE_WINDOW seconds at LOG_RATE_LEVEL or above
+# is summarized (0 disables)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "false").lower() in ("true", "yes", "1")
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "10"))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))
+LOG_RATE_LEVEL = os.getenv("LOG_RATE_LEVEL", "WARNING").upper()
@@ -3,6 +3,7 @@ Models for Account
 
 All of the models are stored in this package
 """
-from .persistent_base import db, DataValidationError
+from .persistent_base import db, DataValidationError, configure_sqlite
 from .product import Product
 from .wishlist import Wishlist
+from .repository import Repository, SqlAlchemyRepository, MemoryRepository, init_repository
@@ -20,7 +20,11 @@ Persistent Base class for database CRUD functions
 
 import logging
 from abc import abstractmethod
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, TimeoutError as DatabaseTimeoutError
+from service.common.tracing import traced
 
 logger = logging.getLogger("flask.app")
 
@@ -31,6 +35,34 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+# Errors that mean the database is slow or unavailable rather than that the
+# data was bad; they are passed on so they can be answered with 503/504
+UNAVAILABLE_ERRORS = (OperationalError, DatabaseTimeoutError)
+
+
+def configure_sqlite(engine) -> None:
+    """Applies the connection settings the models rely on when using SQLite
+
+    SQLite only enforces ondelete="CASCADE" with foreign_keys turned on, and
+    WAL lets readers run while a writer commits (ignored for :memory:).
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+
+def repository():
+    """Returns the repository the models of the current app are stored in"""
+    return current_app.extensions["repository"]
+
+
 ######################################################################
 #  P E R S I S T E N T   B A S E   M O D E L
 ######################################################################
@@ -48,43 +80,53 @@ class PersistentBase:
     def deserialize(self, data: dict) -> None:
         """Convert a dictionary into an object"""
 
+    @traced()
     def create(self) -> None:
         """
         Creates a Wishlist to the database
         """
-        logger.info("Creating %s", self)
+        logger.debug("Creating %s", self)
         # id must be none to generate next primary key
         self.id = None
         try:
-            db.session.add(self)
-            db.session.commit()
+            repository().add(self)
+        except UNAVAILABLE_ERRORS:
+            repository().rollback()
+            raise
         except Exception as e:
-            db.session.rollback()
+            repository().rollback()
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
 
+    @traced()
     def update(self) -> None:
         """
         Updates a Wishlist to the database
         """
-        logger.info("Updating %s", self)
+        logger.debug("Updating %s", self)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
         try:
-            db.session.commit()
+            repository().save(self)
+        except UNAVAILABLE_ERRORS:
+            repository().rollback()
+            raise
         except Exception as e:
-            db.session.rollback()
+            repository().rollback()
             logger.error("Error updating record: %s", self)
             raise DataValidationError(e) from e
 
+    @traced()
     def delete(self) -> None:
         """Removes a Wishlist from the data store"""
-        logger.info("Deleting %s", self)
+        logger.debug("Deleting %s", self)
         try:
-            db.session.delete(self)
-            db.session.commit()
+            repository().remove(self)
+        except UNAVAILABLE_ERRORS:
+            repository().rollback()
+            raise
         except Exception as e:
-            db.session.rollback()
+            repository().rollback()
             logger.error("Error deleting record: %s", self)
             raise DataValidationError(e) from e
 
@@ -93,23 +135,26 @@ class PersistentBase:
     ##################################################
 
     @classmethod
+    @traced()
     def all(cls):
         """Returns all of the Wishlist in the database"""
-        logger.info("Processing all Wishlist")
-        return cls.query.all()
+        logger.debug("Processing all Wishlist")
+        return repository().all(cls)
 
     @classmethod
-    def find(cls, by_id):
-        """Finds a Wishlist by it's ID"""
-        logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.session.get(cls, by_id)
+    @traced()
+    def find(cls, by_id, columns: tuple = ()):
+        """Finds a Wishlist by it's ID, loading only columns if they are given"""
+        logger.debug("Processing lookup for id %s ...", by_id)
+        return repository().get(cls, by_id, columns)
 
     @classmethod
+    @traced()
     def find_by_name(cls, name):
         """Returns all Wishlist with the given name
 
         Args:
             name (string): the name of the Wishlist you want to match
         """
-        logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name)
+        logger.debug("Processing name query for %s ...", name)
+        return repository().find_by(cls, "name", name)
@@ -19,10 +19,73 @@ Persistent Base class for database CRUD functions
 """
 
 import logging
-from .persistent_base import db, PersistentBase, DataValidationError
+from decimal import Decimal
+from sqlalchemy import Index, func, literal_column
+from sqlalchemy.dialects.postgresql import to_tsvector, websearch_to_tsquery
+from sqlalchemy.orm import mapped_column
+from sqlalchemy.types import TypeDecorator, Numeric, Float
+from service.common.tracing import traced
+from .persistent_base import db, PersistentBase, DataValidationError, repository
 
 logger = logging.getLogger("flask.app")
 
+CENTS = Decimal("0.01")
+
+# Percentiles reported by Product.price_stats()
+PRICE_PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+
+# Text search configuration of the full-text index. It is written into the
+# SQL as a literal, like the other constants of search_document(), so that
+# queries repeat the indexed expression exactly and PostgreSQL can use it.
+SEARCH_CONFIG = literal_column("'english'")
+
+
+def search_document(name, *others):
+    """Returns the tsvector of the text columns that products are searched by"""
+    blank, space = literal_column("''"), literal_column("' '")
+    text = func.coalesce(name, blank)  # pylint: disable=assignment-from-no-return
+    for column in others:
+        text = text + space + func.coalesce(column, blank)
+    return to_tsvector(SEARCH_CONFIG, text)
+
+
+class Price(TypeDecorator):  # pylint: disable=too-many-ancestors, abstract-method
+    """
+    A Numeric(10, 2) column that also works on SQLite
+
+    SQLite has no fixed point type, so prices are stored as REAL there and
+    rounded back to cents when loaded. A double holds every 10 digit value
+    with 2 decimals exactly enough to round trip, and comparisons, sorting
+    and aggregates still happen in the database.
+    """
+
+    impl = Numeric(10, 2)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(Float())
+        return dialect.type_descriptor(self.impl)
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and dialect.name == "sqlite":
+            return float(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and dialect.name == "sqlite":
+            return Decimal(repr(value)).quantize(CENTS)
+        return value
+
+
+class Total(Price):  # pylint: disable=too-many-ancestors, abstract-method
+    """
+    A Price wide enough for sums of prices times quantities, Numeric(18, 2)
+    """
+
+    impl = Numeric(18, 2)
+    cache_ok = True
+
 
 ######################################################################
 #  PRODUCT   M O D E L
@@ -34,21 +97,38 @@ class Product(db.Model, PersistentBase):  # pylint: disable=too-many-instance-at
 
     __tablename__ = "products"  # Define table name explicitly
 
+    # Columns searched by Product.search()
+    SEARCH_FIELDS = ("name", "description", "note")
+
+    # Keys of serialize(), which a sparse fieldset picks from
+    FIELDS = ("id", "wishlist_id", "name", "price", "description", "quantity", "note", "is_gift", "purchased")
+
     # Table Schema
 
     id = db.Column(db.Integer, primary_key=True)
-    wishlist_id = db.Column(
-        db.Integer, db.ForeignKey("wishlist.id", ondelete="CASCADE"), nullable=False
+    # The columns the Wishlist totals are made of keep their old value when
+    # changed (active_history) so the totals can be adjusted by the difference
+    wishlist_id = mapped_column(
+        db.Integer, db.ForeignKey("wishlist.id", ondelete="CASCADE"), nullable=False, active_history=True
     )
     name = db.Column(db.String(64), nullable=False)  # Product name
-    price = db.Column(
-        db.Numeric(10, 2), nullable=False
-    )  # Numeric price with 2 decimal places
+    price = mapped_column(Price, nullable=False, active_history=True)  # Numeric price with 2 decimal places
     description = db.Column(db.String(255))  # Increased length for better descriptions
-    quantity = db.Column(db.Integer, default=1)
+    quantity = mapped_column(db.Integer, default=1, active_history=True)
     note = db.Column(db.String(255), nullable=True)  # Field for the note
     is_gift = db.Column(db.Boolean, default=False)
-    purchased = db.Column(db.Boolean, default=False)
+    purchased = mapped_column(db.Boolean, default=False, active_history=True)
+
+    __table_args__ = (
+        # Product listings filter by wishlist_id and sort by one of these, so
+        # each sort reads its rows from an index in order (see SORT_KEYS)
+        Index("ix_products_wishlist_id_id", "wishlist_id", "id"),
+        Index("ix_products_wishlist_id_price", "wishlist_id", "price", "id"),
+        Index("ix_products_wishlist_id_name", "wishlist_id", "name", "id"),
+        # GIN index for full-text search, only created on PostgreSQL
+        Index("ix_products_search", search_document(name, description, note), postgresql_using="gin")
+        .ddl_if(dialect="postgresql"),
+    )
 
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}] wishlist[{self.wishlist_id}]>"
@@ -56,8 +136,14 @@ class Product(db.Model, PersistentBase):  # pylint: disable=too-many-instance-at
     def __str__(self):
         return f"{self.name}: {self.price}, {self.description}"
 
-    def serialize(self) -> dict:
-        """Converts a Product into a dictionary"""
+    def serialize(self, fields: tuple = None) -> dict:
+        """Converts a Product into a dictionary
+
+        Args:
+            fields (tuple): only the keys to include, see check_fields()
+        """
+        if fields is not None:
+            return {key: self._field(key) for key in fields}
         return {
             "id": self.id,
             "wishlist_id": self.wishlist_id,
@@ -70,6 +156,145 @@ class Product(db.Model, PersistentBase):  # pylint: disable=too-many-instance-at
             "purchased": self.purchased if self.purchased is not None else False,
         }
 
+    def _field(self, key: str):
+        """Returns the serialized value of one field"""
+        value = getattr(self, key)
+        if key == "price":
+            return float(value)
+        if key in ("is_gift", "purchased"):
+            return value if value is not None else False
+        return value
+
+    @classmethod
+    def check_fields(cls, names: list) -> tuple:
+        """Returns the serialize() keys of a sparse fieldset such as ["id", "name"]
+
+        The keys come back in FIELDS order whatever order they were named in,
+        so each fieldset has one prebuilt statement and one response layout.
+        Raises a DataValidationError for a name that is not one of FIELDS.
+        """
+        requested = {name.strip() for name in names if name.strip()}
+        unknown = sorted(requested.difference(cls.FIELDS))
+        if unknown or not requested:
+            raise DataValidationError(f"Invalid fields {unknown or names}, expected some of {', '.join(cls.FIELDS)}")
+        return tuple(field for field in cls.FIELDS if field in requested)
+
+    def totals(self, values: dict = None) -> tuple:
+        """Returns what this Product adds to the (product_count, total_value,
+        purchased_count) of its Wishlist
+
+        Args:
+            values (dict): column values to use instead of the current ones
+        """
+        values = values or {}
+        price = values.get("price", self.price)
+        quantity = values.get("quantity", self.quantity)
+        purchased = values.get("purchased", self.purchased)
+        quantity = 1 if quantity is None else int(quantity)
+        value = Decimal(str(price)) * quantity if price is not None else Decimal(0)
+        return 1, value, 1 if purchased else 0
+
+    @classmethod
+    def search_vector(cls):
+        """Returns the indexed full-text document of a Product (PostgreSQL only)"""
+        return search_document(*(getattr(cls, field) for field in cls.SEARCH_FIELDS))
+
+    @staticmethod
+    def search_query(text: str):
+        """Returns the tsquery of a web style search such as 'lego -duplo' (PostgreSQL only)"""
+        return websearch_to_tsquery(SEARCH_CONFIG, text)
+
+    @classmethod
+    @traced()
+    def search(cls, userid: str, text: str, limit: int, after: tuple = None) -> list:
+        """Returns up to limit (rank, Product) pairs of the user's Products matching text
+
+        Args:
+            userid (string): the owner of the Wishlists to search
+            text (string): the words to search for, all of which must match
+            limit (int): the largest number of results
+            after (tuple): the (rank, id) of the last result of the previous page
+        """
+        logger.debug("Processing search for %r in the Products of %s ...", text, userid)
+        return repository().search(cls, text, limit, after=after, wishlist__userid=userid)
+
+    @classmethod
+    def sort_order(cls, sort: str) -> str:
+        """Returns the repository order of a listing sort such as "-price"
+
+        Raises a DataValidationError unless sort is one of SORT_KEYS, with a
+        leading "-" for descending.
+        """
+        key = sort.lstrip("-")
+        if key not in SORT_KEYS or len(sort) - len(key) > 1:
+            raise DataValidationError(f"Invalid sort {sort!r}, expected one of {', '.join(SORT_KEYS)}")
+        return sort[:-len(key)] + SORT_KEYS[key]
+
+    @staticmethod
+    def listing_filters(wishlist_id: int, name: str = None, min_price=None, max_price=None) -> dict:
+        """Returns the repository filters of a Product listing"""
+        filters = {"wishlist_id": wishlist_id}
+        for key, value in (("name__icontains", name), ("price__ge", min_price), ("price__le", max_price)):
+            if value is not None and value != "":
+                filters[key] = value
+        return filters
+
+    @classmethod
+    @traced()
+    def find_by_wishlist(  # pylint: disable=too-many-arguments, too-many-positional-arguments
+        cls, wishlist_id: int, sort: str = "created", page: int = 1, limit: int = None, fields: tuple = (), **filters
+    ) -> list:
+        """Returns the Products of a Wishlist, filtered and sorted by the database
+
+        Args:
+            wishlist_id (int): the Wishlist the Products are in
+            sort (string): one of SORT_KEYS, with a leading "-" for descending
+            page (int): the 1-based page number, when limit is given
+            limit (int): the number of Products per page, or None for all
+            fields (tuple): the only columns to load, as from check_fields()
+            filters: name (a case-insensitive part of it), min_price and max_price
+        """
+        logger.debug("Processing Products of Wishlist %s (%s, sort=%s) ...", wishlist_id, filters, sort)
+        order = cls.sort_order(sort)
+        offset = (page - 1) * limit if limit else 0
+        return repository().page(
+            cls, offset, limit, order=order, columns=fields, **cls.listing_filters(wishlist_id, **filters)
+        )
+
+    @classmethod
+    @traced()
+    def price_stats(cls, buckets: int = 10, wishlist_id: int = None, userid: str = None) -> dict:
+        """Returns the price statistics of a Wishlist's or a user's Products
+
+        The database does the aggregation, so only the results are loaded.
+
+        Args:
+            buckets (int): the number of equal width bins of the histogram
+            wishlist_id (int): the Wishlist whose Products to count
+            userid (string): the owner of the Wishlists whose Products to count
+        """
+        logger.debug("Processing price statistics (wishlist_id=%s, userid=%s) ...", wishlist_id, userid)
+        filters = {"wishlist_id": wishlist_id} if wishlist_id is not None else {"wishlist__userid": userid}
+        stats = repository().distribution(cls, "price", PRICE_PERCENTILES, buckets, **filters)
+
+        def cents(value):
+            return None if value is None else float(Decimal(str(value)).quantize(CENTS))
+
+        return {
+            "count": stats["count"],
+            "min": cents(stats["min"]),
+            "max": cents(stats["max"]),
+            "avg": cents(stats["mean"]),
+            "percentiles": {
+                f"p{round(fraction * 100)}": cents(value)
+                for fraction, value in zip(PRICE_PERCENTILES, stats["percentiles"])
+            },
+            "histogram": [
+                {"min": cents(start), "max": cents(end), "count": count}
+                for start, end, count in stats["histogram"]
+            ],
+        }
+
     def deserialize(self, data: dict) -> None:
         """
         Populates a Product from a dictionary
@@ -97,3 +322,9 @@ class Product(db.Model, PersistentBase):  # pylint: disable=too-many-instance-at
             ) from error
 
         return self
+
+
+# Sorts of Product listings and the column each one orders by; ties are
+# broken by id. Products have no creation time, but ids are handed out in
+# insertion order.
+SORT_KEYS = {"created": "id", "price": "price", "name": "name"}
@@ -0,0 +1,685 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Repositories
+
+PersistentBase keeps the models' CRUD API and delegates storage to a
+repository selected with the REPOSITORY_BACKEND setting:
+
+- sqlalchemy (default) stores models in the database through db.session
+- memory keeps them in process so the HTTP and serialization layers can
+  be measured without a database
+"""
+import bisect
+import itertools
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from decimal import Decimal
+from functools import cache, lru_cache
+from sqlalchemy import inspect, select, bindparam, func, case, cast, and_, or_, Numeric, String
+from sqlalchemy.orm import ONETOMANY, MANYTOONE, load_only, selectinload
+from service.common.tracing import traced
+from .persistent_base import db
+
+# Attributes the in-memory repository keeps secondary indexes for
+INDEXED_ATTRIBUTES = ("name", "userid", "share_token")
+
+# Prebuilt page statements kept, bounded since request parameters pick them
+PAGE_STATEMENTS = 512
+
+
+@cache
+def select_by_name(model):
+    """Returns a prebuilt SELECT of model rows matching the :name parameter
+
+    Hot lookups reuse one statement object with bound parameters so
+    SQLAlchemy skips building the statement and its cache key per call.
+    """
+    return select(model).where(model.name == bindparam("name"))
+
+
+# Comparisons a filter can name after its attribute, as in price__ge. A
+# filter without one matches equal values, and one named parent__attribute
+# matches an attribute of the many-to-one parent.
+FILTER_OPERATORS = {
+    "ge": lambda column, value: column >= value,
+    "le": lambda column, value: column <= value,
+    # value is bound through filter_parameters() as an escaped LIKE pattern
+    "icontains": lambda column, value: column.ilike(value, escape="\\"),
+}
+
+
+def filter_where(statement, model, keys):
+    """Returns statement restricted by the filters named in keys
+
+    Each filter compares with the parameter of the same name, see
+    filter_parameters(). Filters on a parent join it.
+    """
+    for key in keys:
+        attribute, _, operator = key.partition("__")
+        column = getattr(model, attribute)
+        if operator in FILTER_OPERATORS:
+            condition = FILTER_OPERATORS[operator](column, bindparam(key))
+        elif operator:
+            statement = statement.join(column)
+            condition = getattr(column.property.mapper.class_, operator) == bindparam(key)
+        else:
+            condition = column == bindparam(key)
+        statement = statement.where(condition)
+    return statement
+
+
+def filter_parameters(filters: dict) -> dict:
+    """Returns the values to bind for filter_where()"""
+    return {
+        key: like_pattern(value) if key.endswith("__icontains") else value
+        for key, value in filters.items()
+    }
+
+
+def matches_filter(instance, key: str, value) -> bool:
+    """Returns whether instance passes a filter, like filter_where() in SQL"""
+    attribute, _, operator = key.partition("__")
+    actual = getattr(instance, attribute, None)
+    if operator == "icontains":
+        return value.lower() in (actual or "").lower()
+    if operator in FILTER_OPERATORS:
+        return actual is not None and FILTER_OPERATORS[operator](actual, value)
+    if operator:
+        return getattr(actual, operator, None) == value
+    return actual == value
+
+
+def sort_column(model, attribute: str):
+    """Returns what rows of model are sorted by for attribute
+
+    A nullable String sorts NULL as the empty string, so keyset cursors
+    never compare with NULL, which would drop the rows after it.
+    """
+    column = getattr(model, attribute)
+    if column.expression.nullable and isinstance(column.type, String):
+        return func.coalesce(column, "")
+    return column
+
+
+def sort_value(instance, attribute: str):
+    """Returns the value of attribute an instance sorts by, as sort_column() does"""
+    value = getattr(instance, attribute)
+    if value is None and isinstance(getattr(type(instance), attribute).type, String):
+        return ""
+    return value
+
+
+def order_by(model, order: str) -> tuple:
+    """Returns the ORDER BY of an order such as "name" or "-total_value"
+
+    Ties are broken by id so pages do not overlap.
+    """
+    column = sort_column(model, order.lstrip("-"))
+    if order.startswith("-"):
+        column = column.desc()
+    return (column,) if order.lstrip("-") == "id" else (column, model.id)
+
+
+def after_key(model, order: str):
+    """Returns the condition for rows that sort after :after_value, :after_id"""
+    attribute = order.lstrip("-")
+    descending = order.startswith("-")
+    if attribute == "id":
+        return model.id < bindparam("after_id") if descending else model.id > bindparam("after_id")
+    column = sort_column(model, attribute)
+    value = bindparam("after_value")
+    beyond = column < value if descending else column > value
+    return or_(beyond, and_(column == value, model.id > bindparam("after_id")))
+
+
+@lru_cache(maxsize=PAGE_STATEMENTS)
+def select_page(  # pylint: disable=too-many-arguments, too-many-positional-arguments
+    model, filters: tuple = (), preload: tuple = (), order: str = "id", keyset: bool = False, columns: tuple = ()
+):
+    """Returns a prebuilt page of model rows sorted by order (see order_by)
+
+    The statement takes :limit and :offset plus the filter_parameters() of
+    filters. With keyset it also takes :after_id (and :after_value unless
+    order is by id) and only returns the rows after that sort key, which
+    an index on the filters and order can seek to.
+    The relationships named in preload are loaded for the whole page with
+    one SELECT ... IN instead of one lazy load per row (the N+1 query
+    pattern). With columns only those attributes (and the primary key) are
+    loaded and the others are deferred until they are used.
+    """
+    statement = select(model).order_by(*order_by(model, order)).limit(bindparam("limit")).offset(bindparam("offset"))
+    if keyset:
+        statement = statement.where(after_key(model, order))
+    statement = filter_where(statement, model, filters)
+    if columns:
+        statement = statement.options(load_only(*(getattr(model, column) for column in columns)))
+    for relationship in preload:
+        statement = statement.options(selectinload(getattr(model, relationship)))
+    return statement
+
+
+def search_terms(text: str) -> list:
+    """Returns the lower case words of a search"""
+    return re.findall(r"\w+", text.lower())
+
+
+def like_pattern(term: str) -> str:
+    """Returns a LIKE pattern matching term anywhere, with % and _ escaped"""
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+def histogram_edges(low, high, buckets: int) -> list:
+    """Returns the inner edges of buckets equal width bins from low to high
+
+    All values fall in one bin when low equals high.
+    """
+    if low == high:
+        return []
+    return [low + (high - low) * step / buckets for step in range(1, buckets)]
+
+
+def interpolate(pair: list, weight):
+    """Returns the point weight (0 to 1) of the way from pair[0] to pair[-1]
+
+    With the two sorted values around a fractional position this gives the
+    same percentile as PostgreSQL's percentile_cont.
+    """
+    return pair[0] + (pair[-1] - pair[0]) * weight
+
+
+def empty_distribution(percentiles: tuple) -> dict:
+    """Returns the Repository.distribution() of no values"""
+    return {"count": 0, "min": None, "max": None, "mean": None, "percentiles": [None] * len(percentiles), "histogram": []}
+
+
+def histogram_bins(low, high, edges: list, below: list, count: int) -> list:
+    """Returns the (start, end, count) of each bin from the number of values below each inner edge"""
+    bounds, totals = [low, *edges, high], [0, *below, count]
+    return [(bounds[n], bounds[n + 1], totals[n + 1] - totals[n]) for n in range(len(edges) + 1)]
+
+
+######################################################################
+#  R E P O S I T O R Y   I N T E R F A C E
+######################################################################
+class Repository(ABC):
+    """Storage used by PersistentBase for the models"""
+
+    @abstractmethod
+    def add(self, instance) -> None:
+        """Stores a new instance and assigns its id"""
+
+    @abstractmethod
+    def save(self, instance) -> None:
+        """Stores the changes made to an existing instance"""
+
+    @abstractmethod
+    def remove(self, instance) -> None:
+        """Deletes an instance and the children it owns"""
+
+    @abstractmethod
+    def rollback(self) -> None:
+        """Discards a failed unit of work"""
+
+    @abstractmethod
+    def get(self, model, by_id, columns: tuple = ()):
+        """Returns the instance of model with the id or None
+
+        With columns the database may load only those attributes; the
+        others are loaded when they are first used.
+        """
+
+    @abstractmethod
+    def all(self, model) -> list:
+        """Returns every instance of model"""
+
+    @abstractmethod
+    def find_by(self, model, attribute: str, value) -> list:
+        """Returns the instances of model whose attribute equals value"""
+
+    @abstractmethod
+    def page(  # pylint: disable=too-many-arguments
+        self, model, offset: int, limit: int, *, preload: tuple = (), order: str = "id", after: tuple = None,
+        columns: tuple = (), **filters
+    ) -> list:
+        """Returns a page of instances matching all filters
+
+        Filters are named as in FILTER_OPERATORS. A limit of None returns
+        every instance from offset on. The page is sorted by the attribute
+        named in order, descending if it starts with "-", then by id. With
+        after, the page starts after that (value, id) sort key, or (id,)
+        when sorted by id, instead of at offset. The relationships named in
+        preload are loaded up front because every row's will be used. With
+        columns the database may load only those attributes, as in get().
+        """
+
+    @abstractmethod
+    def search(self, model, text: str, limit: int, *, after: tuple = None, **filters) -> list:
+        """Returns up to limit (rank, instance) pairs of model matching a text search
+
+        Every word of text must appear in one of model.SEARCH_FIELDS. Results
+        are ordered by rank, best first, then by id and start after the
+        (rank, id) in after. Filters are named as in FILTER_OPERATORS.
+        """
+
+    @abstractmethod
+    def distribution(self, model, attribute: str, percentiles: tuple, buckets: int, **filters) -> dict:
+        """Returns the spread of a numeric attribute over the matching instances
+
+        The result has the count, min, max and mean of the attribute, its
+        values at each of the percentiles (fractions from 0 to 1, found by
+        linear interpolation like percentile_cont) and the number of values
+        in each of buckets equal width bins from min to max, as (start, end,
+        count). Everything but count is None, and the histogram empty, when
+        nothing matches.
+        """
+
+
+######################################################################
+#  S Q L A L C H E M Y   R E P O S I T O R Y
+######################################################################
+class SqlAlchemyRepository(Repository):
+    """Stores the models in the database through the Flask-SQLAlchemy session"""
+
+    def add(self, instance) -> None:
+        db.session.add(instance)
+        self._commit()
+
+    def save(self, instance) -> None:
+        self._commit()
+
+    def remove(self, instance) -> None:
+        db.session.delete(instance)
+        self._commit()
+
+    def rollback(self) -> None:
+        db.session.rollback()
+
+    def get(self, model, by_id, columns: tuple = ()):
+        options = [load_only(*(getattr(model, column) for column in columns))] if columns else None
+        return db.session.get(model, by_id, options=options)
+
+    def all(self, model) -> list:
+        return db.session.scalars(select(model)).all()
+
+    def find_by(self, model, attribute: str, value) -> list:
+        if attribute == "name":
+            return db.session.scalars(select_by_name(model), {"name": value}).all()
+        return db.session.scalars(select(model).where(getattr(model, attribute) == value)).all()
+
+    def page(  # pylint: disable=too-many-arguments
+        self, model, offset: int, limit: int, *, preload: tuple = (), order: str = "id", after: tuple = None,
+        columns: tuple = (), **filters
+    ) -> list:
+        statement = select_page(model, tuple(sorted(filters)), preload, order, after is not None, tuple(columns))
+        if limit is None:
+            statement = statement.limit(None)
+        parameters = {"limit": limit, "offset": offset, **filter_parameters(filters)}
+        if after is not None:
+            parameters["after_id"] = after[-1]
+            if len(after) > 1:
+                parameters["after_value"] = after[0]
+        return db.session.scalars(statement, parameters).all()
+
+    def search(self, model, text: str, limit: int, *, after: tuple = None, **filters) -> list:
+        ranking = self._ranking(model, text)
+        if ranking is None:
+            return []
+        rank, condition = ranking
+        statement = filter_where(select(rank, model).where(condition), model, filters)
+        if after is not None:
+            if isinstance(rank.type, Numeric):
+                after = (Decimal(str(after[0])), after[1])
+            statement = statement.where(or_(rank < after[0], and_(rank == after[0], model.id > after[1])))
+        statement = statement.order_by(rank.desc(), model.id).limit(limit)
+        return [(float(rank), instance) for rank, instance in db.session.execute(statement, filter_parameters(filters))]
+
+    def distribution(  # pylint: disable=too-many-locals
+        self, model, attribute: str, percentiles: tuple, buckets: int, **filters
+    ) -> dict:
+        column = getattr(model, attribute)
+        postgres = db.session.get_bind().dialect.name == "postgresql"
+        # pylint: disable=not-callable
+        summary = [func.count(column), func.min(column), func.max(column), func.avg(column)]
+        if postgres:
+            summary += [func.percentile_cont(fraction).within_group(column) for fraction in percentiles]
+        count, low, high, mean, *values = db.session.execute(
+            filter_where(select(*summary), model, filters), filter_parameters(filters)
+        ).one()
+        if not count:
+            return empty_distribution(percentiles)
+        if not postgres:
+            values = self._percentiles(model, column, count, percentiles, filters)
+        edges = histogram_edges(low, high, buckets)
+        below = self._count_below(model, column, edges, filters) if edges else []
+        return {"count": count, "min": low, "max": high, "mean": mean,
+                "percentiles": values, "histogram": histogram_bins(low, high, edges, below, count)}
+
+    @staticmethod
+    def _count_below(model, column, edges: list, filters: dict) -> list:
+        """Returns the number of values below each edge, counted in one pass"""
+        counts = [func.count(case((column < edge, 1))) for edge in edges]  # pylint: disable=not-callable
+        return list(db.session.execute(filter_where(select(*counts), model, filters), filter_parameters(filters)).one())
+
+    @staticmethod
+    def _percentiles(model, column, count: int, percentiles: tuple, filters: dict) -> list:
+        """Returns percentiles on databases without percentile_cont, in one query
+
+        The values are numbered in order with row_number() and only the one
+        or two rows around each percentile's position are returned.
+        """
+        positions = [Decimal(count - 1) * Decimal(str(fraction)) for fraction in percentiles]
+        wanted = {int(position) + step for position in positions for step in (1, 2)}
+        numbered = filter_where(
+            select(column.label("value"), func.row_number().over(order_by=column).label("row")), model, filters
+        ).subquery()
+        statement = select(numbered.c.row, numbered.c.value).where(numbered.c.row.in_(sorted(wanted)))
+        values = dict(db.session.execute(statement, filter_parameters(filters)).all())
+        return [
+            interpolate([values[int(position) + 1], values.get(int(position) + 2, values[int(position) + 1])], position % 1)
+            for position in positions
+        ]
+
+    @staticmethod
+    def _ranking(model, text: str):
+        """Returns the (rank, condition) of a search, or None if it has no words"""
+        if db.session.get_bind().dialect.name == "postgresql":
+            # Matches the GIN index on the same document; ranked by cover
+            # density, rounded to a numeric so the cursor compares exactly
+            document = model.search_vector()
+            query = model.search_query(text)
+            rank = func.round(cast(func.ts_rank_cd(document, query), Numeric), 6, type_=Numeric())
+            return rank, document.op("@@")(query)
+        # Portable fallback: each word has to be in one of the fields and the
+        # rank is the number of fields it is in
+        matches = [
+            [getattr(model, field).ilike(like_pattern(term), escape="\\") for field in model.SEARCH_FIELDS]
+            for term in search_terms(text)
+        ]
+        if not matches:
+            return None
+        rank = sum(case((match, 1), else_=0) for term in matches for match in term)
+        return rank, and_(*(or_(*term) for term in matches))
+
+    @staticmethod
+    @traced("session.commit")
+    def _commit() -> None:
+        """Flushes the pending changes and commits them"""
+        db.session.commit()
+
+
+######################################################################
+#  I N - M E M O R Y   R E P O S I T O R Y
+######################################################################
+class MemoryRepository(Repository):
+    """
+    Keeps the models in process, guarded by a lock
+
+    Instances are stored per model in a dict keyed by id with secondary
+    indexes on the INDEXED_ATTRIBUTES they have. On add and save the
+    column rules the database would enforce (NOT NULL, defaults, String
+    lengths, numeric types and foreign keys) are checked, one-to-many
+    children are stored with their parent and deleting a parent deletes
+    its children, like ondelete="CASCADE".
+
+    The stored objects themselves are handed out, so changes made to them
+    are only indexed when save() is called.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows = defaultdict(dict)  # model -> {id: instance}
+        self._ids = defaultdict(lambda: itertools.count(1))  # model -> id sequence
+        self._indexes = defaultdict(lambda: defaultdict(set))  # (model, attribute) -> {value: {id}}
+        self._indexed = {}  # (model, id) -> {attribute: indexed value}
+
+    def add(self, instance) -> None:
+        with self._lock:
+            self._store(instance)
+            self._refresh_totals(instance, self._parents(instance))
+
+    def save(self, instance) -> None:
+        with self._lock:
+            # Like a session commit, copies that were never stored are ignored
+            if self._rows[type(instance)].get(instance.id) is instance:
+                parents = self._parents(instance)
+                self._store(instance)
+                self._refresh_totals(instance, parents + self._parents(instance))
+
+    def remove(self, instance) -> None:
+        with self._lock:
+            parents = self._parents(instance)
+            self._remove(instance)
+            self._refresh_totals(None, parents)
+
+    def rollback(self) -> None:
+        """Nothing to undo, instances are validated before they are stored"""
+
+    def get(self, model, by_id, columns: tuple = ()):
+        with self._lock:
+            return self._rows[model].get(by_id)
+
+    def all(self, model) -> list:
+        with self._lock:
+            return [self._rows[model][key] for key in sorted(self._rows[model])]
+
+    def find_by(self, model, attribute: str, value) -> list:
+        with self._lock:
+            rows = self._rows[model]
+            if attribute in INDEXED_ATTRIBUTES:
+                ids = self._indexes[model, attribute].get(value, ())
+            else:
+                ids = [key for key, row in rows.items() if getattr(row, attribute) == value]
+            return [rows[key] for key in sorted(ids)]
+
+    def page(  # pylint: disable=too-many-arguments
+        self, model, offset: int, limit: int, *, preload: tuple = (), order: str = "id", after: tuple = None,
+        columns: tuple = (), **filters
+    ) -> list:
+        with self._lock:
+            ids = None
+            for attribute, value in filters.items():
+                if "__" not in attribute:
+                    matches = {row.id for row in self.find_by(model, attribute, value)}
+                    ids = matches if ids is None else ids & matches
+            rows = [self._rows[model][key] for key in sorted(self._rows[model] if ids is None else ids)]
+            rows = [
+                row for row in rows
+                if all(matches_filter(row, key, value) for key, value in filters.items() if "__" in key)
+            ]
+            attribute = order.lstrip("-")
+            if order != "id":
+                # sorted() is stable, so equal values stay in id order
+                rows = sorted(rows, key=lambda row: sort_value(row, attribute), reverse=order.startswith("-"))
+            if after is not None:
+                rows = [row for row in rows if self._sorts_after(row, attribute, order.startswith("-"), after)]
+            return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+    def search(self, model, text: str, limit: int, *, after: tuple = None, **filters) -> list:
+        terms = search_terms(text)
+        if not terms:
+            return []
+        results = []
+        with self._lock:
+            for row in self._rows[model].values():
+                if not all(matches_filter(row, key, value) for key, value in filters.items()):
+                    continue
+                fields = [(getattr(row, field) or "").lower() for field in model.SEARCH_FIELDS]
+                found = [sum(term in field for field in fields) for term in terms]
+                if all(found) and (after is None or (-sum(found), row.id) > (-after[0], after[1])):
+                    results.append((float(sum(found)), row))
+        results.sort(key=lambda result: (-result[0], result[1].id))
+        return results[:limit]
+
+    def distribution(self, model, attribute: str, percentiles: tuple, buckets: int, **filters) -> dict:
+        with self._lock:
+            values = sorted(
+                Decimal(str(getattr(row, attribute))) for row in self._rows[model].values()
+                if getattr(row, attribute) is not None
+                and all(matches_filter(row, key, value) for key, value in filters.items())
+            )
+        if not values:
+            return empty_distribution(percentiles)
+        count = len(values)
+        positions = [Decimal(count - 1) * Decimal(str(fraction)) for fraction in percentiles]
+        edges = histogram_edges(values[0], values[-1], buckets)
+        return {
+            "count": count,
+            "min": values[0],
+            "max": values[-1],
+            "mean": sum(values) / count,
+            "percentiles": [interpolate(values[int(p):int(p) + 2], p % 1) for p in positions],
+            "histogram": histogram_bins(
+                values[0], values[-1], edges, [bisect.bisect_left(values, edge) for edge in edges], count
+            ),
+        }
+
+    ##################################################
+    # INTERNALS (called with the lock held)
+    ##################################################
+
+    def _store(self, instance) -> None:
+        """Validates and stores an instance with its one-to-many children"""
+        model = type(instance)
+        self._check_columns(instance)
+        self._link_parents(instance)
+        rows = self._rows[model]
+        if instance.id is None:
+            instance.id = next(key for key in self._ids[model] if key not in rows)
+        elif rows.get(instance.id, instance) is not instance:
+            raise ValueError(f"duplicate key {model.__name__} id={instance.id}")
+        rows[instance.id] = instance
+        self._index(instance)
+        for relationship in inspect(model).relationships:
+            if relationship.direction is ONETOMANY:
+                for child in getattr(instance, relationship.key):
+                    for local, remote in relationship.local_remote_pairs:
+                        setattr(child, remote.key, getattr(instance, local.key))
+                    self._store(child)
+
+    def _remove(self, instance) -> None:
+        """Removes an instance, its children and its place in its parents"""
+        model = type(instance)
+        for relationship in inspect(model).relationships:
+            if relationship.direction is ONETOMANY:
+                for child in list(getattr(instance, relationship.key)):
+                    self._remove(child)
+            elif relationship.direction is MANYTOONE:
+                setattr(instance, relationship.key, None)
+        self._rows[model].pop(instance.id, None)
+        for attribute, value in self._indexed.pop((model, instance.id), {}).items():
+            self._indexes[model, attribute][value].discard(instance.id)
+
+    @staticmethod
+    def _sorts_after(row, attribute: str, descending: bool, after: tuple) -> bool:
+        """Returns whether row comes after the sort key after, like select_page's keyset"""
+        value = sort_value(row, attribute)
+        if attribute != "id" and value != after[0]:
+            return value < after[0] if descending else value > after[0]
+        if attribute == "id" and descending:
+            return row.id < after[-1]
+        return row.id > after[-1]
+
+    @staticmethod
+    def _parents(instance) -> list:
+        """Returns the objects instance belongs to through many-to-one relationships"""
+        return [
+            getattr(instance, relationship.key)
+            for relationship in inspect(type(instance)).relationships
+            if relationship.direction is MANYTOONE
+        ]
+
+    def _refresh_totals(self, instance, parents: list) -> None:
+        """Recounts the totals kept by instance and by parents that are stored
+
+        The database keeps them, and the versions, with the session's
+        before_flush hooks; here they are recounted from the children in
+        memory and the versions touched.
+        """
+        for target in [instance, *parents]:
+            if hasattr(target, "refresh_totals") and self._rows[type(target)].get(target.id) is target:
+                target.refresh_totals()
+                target.touch()
+
+    def _check_columns(self, instance) -> None:
+        """Applies defaults and the column constraints the database enforces"""
+        for column in inspect(type(instance)).columns:
+            value = getattr(instance, column.key)
+            if value is None:
+                if column.key not in instance.__dict__ and column.default is not None and column.default.is_scalar:
+                    setattr(instance, column.key, column.default.arg)
+                elif column.key not in instance.__dict__ and column.default is not None and column.default.is_callable:
+                    # SQLAlchemy wraps callable defaults to take an execution context
+                    setattr(instance, column.key, column.default.arg(None))
+                elif not column.nullable and not column.primary_key:
+                    raise ValueError(f"null value in column {column.key!r} violates not-null constraint")
+                continue
+            column_type = getattr(column.type, "impl", column.type)
+            python_type = column_type.python_type
+            if python_type is Decimal:
+                value = Decimal(str(value))
+                if column_type.scale is not None:
+                    value = value.quantize(Decimal(1).scaleb(-column_type.scale))
+            elif python_type is str and getattr(column_type, "length", None) and len(value) > column_type.length:
+                raise ValueError(f"value too long for column {column.key!r} ({column_type.length})")
+            elif not isinstance(value, python_type):
+                value = python_type(value)
+            setattr(instance, column.key, value)
+
+    def _link_parents(self, instance) -> None:
+        """Resolves foreign keys set by id to stored parents, like a FOREIGN KEY constraint"""
+        for relationship in inspect(type(instance)).relationships:
+            if relationship.direction is not MANYTOONE or getattr(instance, relationship.key) is not None:
+                continue
+            (local, _), = relationship.local_remote_pairs
+            parent_id = getattr(instance, local.key)
+            if parent_id is None:
+                continue
+            parent = self._rows[relationship.mapper.class_].get(parent_id)
+            if parent is None:
+                raise ValueError(f"foreign key {local.key}={parent_id} does not exist")
+            setattr(instance, relationship.key, parent)
+
+    def _index(self, instance) -> None:
+        """Moves an instance to the index entries for its current values"""
+        model = type(instance)
+        indexed = self._indexed.setdefault((model, instance.id), {})
+        for attribute in INDEXED_ATTRIBUTES:
+            if not hasattr(model, attribute):
+                continue
+            value = getattr(instance, attribute)
+            if attribute in indexed:
+                self._indexes[model, attribute][indexed[attribute]].discard(instance.id)
+            self._indexes[model, attribute][value].add(instance.id)
+            indexed[attribute] = value
+
+
+BACKENDS = {
+    "sqlalchemy": SqlAlchemyRepository,
+    "memory": MemoryRepository,
+}
+
+
+def init_repository(app) -> Repository:
+    """Creates the repository named by REPOSITORY_BACKEND for the app"""
+    backend = app.config.get("REPOSITORY_BACKEND", "sqlalchemy")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown REPOSITORY_BACKEND {backend!r}, expected one of {sorted(BACKENDS)}")
+    app.extensions["repository"] = BACKENDS[backend]()
+    return app.extensions["repository"]
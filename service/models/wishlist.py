@@ -5,15 +5,23 @@ All of the models are stored in this module
 """
 
 import logging
+import secrets
+from itertools import chain
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import Index, event, inspect
+from sqlalchemy.orm import Session
+from service.common.tracing import traced
+from .persistent_base import db, PersistentBase, DataValidationError, repository
+from .product import Product, Total
+from .repository import sort_value
 
-from .persistent_base import db, PersistentBase, DataValidationError
-from .product import Product
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
 
 
-class Wishlist(db.Model, PersistentBase):
+class Wishlist(db.Model, PersistentBase):  # pylint: disable=too-many-instance-attributes
     """
     Class that represents a Wishlist
     """
@@ -25,6 +33,20 @@ class Wishlist(db.Model, PersistentBase):
     name = db.Column(db.String(63))
     userid = db.Column(db.String(16), nullable=False)
     products = db.relationship("Product", backref="wishlist", passive_deletes=True)
+    # Totals of the products, kept up to date as products are written
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(Total, nullable=False, default=0)
+    purchased_count = db.Column(db.Integer, nullable=False, default=0)
+    # Opaque token of the public snapshot, None while the Wishlist is not shared
+    share_token = db.Column(db.String(43), unique=True)
+    # Moved on by every change to the Wishlist or its products
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # "My wishlists" in id order is one range scan of this index
+        Index("ix_wishlist_userid_id", "userid", "id"),
+    )
 
     # Completed Table Schema
 
@@ -37,9 +59,62 @@ class Wishlist(db.Model, PersistentBase):
             "id": self.id,
             "name": self.name,
             "userid": self.userid,
+            "product_count": self.product_count or 0,
+            "total_value": float(self.total_value or 0),
+            "purchased_count": self.purchased_count or 0,
             "products": [product.serialize() for product in self.products],
         }
 
+    def refresh_totals(self) -> None:
+        """Recounts the totals from the products that are loaded"""
+        totals = [product.totals() for product in self.products]
+        self.product_count = len(totals)
+        self.total_value = sum((value for _, value, _ in totals), Decimal(0))
+        self.purchased_count = sum(purchased for _, _, purchased in totals)
+
+    def snapshot(self) -> dict:
+        """Serializes the public view of a shared Wishlist, without its owner"""
+        data = self.serialize()
+        del data["id"], data["userid"]
+        for product in data["products"]:
+            del product["wishlist_id"]
+        data["version"] = self.version
+        data["updated_at"] = self.modified().isoformat()
+        return data
+
+    def modified(self) -> datetime:
+        """Returns when the Wishlist last changed, in UTC"""
+        # SQLite hands back naive datetimes
+        if self.updated_at.tzinfo is None:
+            return self.updated_at.replace(tzinfo=timezone.utc)
+        return self.updated_at
+
+    def touch(self, now: datetime = None) -> None:
+        """Moves the version and updated_at on after a change
+
+        A stored row is bumped with version = version + 1 in SQL, like the
+        totals, so concurrent writers add up; instances that are not in a
+        session (the in-memory repository's) just count on in Python.
+        """
+        if inspect(self).persistent:
+            self.version = Wishlist.version + 1
+        else:
+            self.version = (self.version or 0) + 1
+        self.updated_at = now or datetime.now(timezone.utc)
+
+    def share(self) -> bool:
+        """Gives the Wishlist a share token unless it has one, returns whether it was new"""
+        if self.share_token:
+            return False
+        self.share_token = secrets.token_urlsafe(32)
+        self.update()
+        return True
+
+    def unshare(self) -> None:
+        """Revokes the share token, so the public snapshot is gone"""
+        self.share_token = None
+        self.update()
+
     def deserialize(self, data):
         """
         Deserializes a Wishlist from a dictionary
@@ -65,3 +140,191 @@ class Wishlist(db.Model, PersistentBase):
                 + str(error)
             ) from error
         return self
+
+    ##################################################
+    # CLASS METHODS
+    ##################################################
+
+    def cursor(self, sort: str = "id") -> tuple:
+        """Returns the sort key of this Wishlist that the next page starts after"""
+        key = sort.lstrip("-")
+        if key == "id":
+            return (self.id,)
+        value = sort_value(self, key)
+        return float(value) if isinstance(value, Decimal) else value, self.id
+
+    @classmethod
+    def cursor_types(cls, sort: str = "id") -> tuple:
+        """Returns the JSON types of the values of a cursor() for sort"""
+        cls.check_sort(sort)
+        key = sort.lstrip("-")
+        return (int,) if key == "id" else (SORT_KEYS[key], int)
+
+    @classmethod
+    def check_sort(cls, sort: str) -> None:
+        """Raises a DataValidationError unless Wishlists can be sorted by sort"""
+        key = sort.lstrip("-")
+        if key not in SORT_KEYS or len(sort) - len(key) > 1:
+            raise DataValidationError(f"Invalid sort {sort!r}, expected one of {', '.join(SORT_KEYS)}")
+
+    @classmethod
+    @traced()
+    def find_by_share_token(cls, token: str):
+        """Returns the Wishlist shared under token, or None"""
+        logger.debug("Processing lookup for share token ...")
+        found = repository().find_by(cls, "share_token", token)
+        return found[0] if found else None
+
+    @classmethod
+    @traced()
+    def find_page(  # pylint: disable=too-many-arguments, too-many-positional-arguments
+        cls, page: int, limit: int, name: str = None, sort: str = "id", userid: str = None
+    ) -> list:
+        """Returns one page of Wishlists, optionally by name and owner
+
+        Args:
+            page (int): the 1-based page number
+            limit (int): the number of Wishlists per page
+            name (string): only return Wishlists with this name
+            sort (string): one of SORT_KEYS, with a leading "-" for descending
+            userid (string): only return Wishlists of this user
+        """
+        logger.debug("Processing page %s of %s Wishlists (name=%s, userid=%s, sort=%s) ...", page, limit, name, userid, sort)
+        cls.check_sort(sort)
+        filters = {key: value for key, value in (("name", name), ("userid", userid)) if value}
+        return repository().page(cls, (page - 1) * limit, limit, preload=("products",), order=sort, **filters)
+
+    @classmethod
+    @traced()
+    def find_after(cls, after: tuple, limit: int, sort: str = "id", **filters) -> list:
+        """Returns the limit Wishlists that follow the cursor() after in sort order
+
+        Unlike pages numbers, this reads only the rows it returns however far
+        into the list it is, and rows added or deleted meanwhile do not shift it.
+
+        Args:
+            after (tuple): the cursor() of the last Wishlist of the previous page
+            limit (int): the number of Wishlists to return
+            sort (string): one of SORT_KEYS, with a leading "-" for descending
+            filters: name and userid to match
+        """
+        logger.debug("Processing %s Wishlists after %s (%s, sort=%s) ...", limit, after, filters, sort)
+        cls.check_sort(sort)
+        if sort.lstrip("-") == "total_value":
+            after = (Decimal(str(after[0])), after[1])
+        filters = {key: value for key, value in filters.items() if value}
+        return repository().page(cls, 0, limit, preload=("products",), order=sort, after=after, **filters)
+
+
+# Columns Wishlist pages can be sorted by, with the JSON type of their cursor
+# values; ties are broken by id
+SORT_KEYS = {"id": int, "name": str, "product_count": int, "total_value": (int, float), "purchased_count": int}
+
+
+######################################################################
+#  T O T A L S   M A I N T E N A N C E
+######################################################################
+def _committed(product, key):
+    """Returns the value a Product column had before this flush"""
+    history = inspect(product).attrs[key].history
+    return (history.deleted or history.unchanged or [getattr(product, key)])[0]
+
+
+def _stored(session, wishlist_id):
+    """Returns the Wishlist with wishlist_id from the session, or None"""
+    return session.get(Wishlist, wishlist_id) if wishlist_id is not None else None
+
+
+def _parent(session, product):
+    """Returns the Wishlist a Product is in now"""
+    return product.__dict__.get("wishlist") or _stored(session, product.wishlist_id)
+
+
+def _added(session):
+    """Yields (Wishlist, totals, 1) for the Products this flush inserts"""
+    for product in session.new:
+        if isinstance(product, Product):
+            yield _parent(session, product), product.totals(), 1
+
+
+def _changed(session):
+    """Yields what the Products this flush updates take from and add to Wishlists"""
+    for product in session.dirty:
+        if isinstance(product, Product) and any(
+            inspect(product).attrs[key].history.has_changes() for key in TOTAL_COLUMNS
+        ):
+            old = {key: _committed(product, key) for key in TOTAL_COLUMNS}
+            yield _stored(session, old["wishlist_id"]), product.totals(old), -1
+            yield _parent(session, product), product.totals(), 1
+
+
+def _removed(session):
+    """Yields (Wishlist, totals, -1) for the Products this flush deletes"""
+    for product in session.deleted:
+        if isinstance(product, Product):
+            old = {key: _committed(product, key) for key in TOTAL_COLUMNS}
+            yield _stored(session, old["wishlist_id"]), product.totals(old), -1
+
+
+def _apply_totals(wishlist, count, value, purchased) -> None:
+    """Adds the changes to the totals of a Wishlist"""
+    if inspect(wishlist).persistent:
+        wishlist.product_count = Wishlist.product_count + count
+        wishlist.total_value = Wishlist.total_value + value
+        wishlist.purchased_count = Wishlist.purchased_count + purchased
+    else:
+        wishlist.product_count = (wishlist.product_count or 0) + count
+        wishlist.total_value = (wishlist.total_value or Decimal(0)) + value
+        wishlist.purchased_count = (wishlist.purchased_count or 0) + purchased
+
+
+@event.listens_for(Session, "before_flush")
+def adjust_totals(session, flush_context, instances):  # pylint: disable=unused-argument
+    """Adds what the Products in this flush changed to their Wishlists' totals
+
+    Persistent Wishlists are updated with column = column + change, so
+    concurrent transactions add up instead of overwriting each other, and
+    the adjustment commits or rolls back together with the products.
+    """
+    changes = {}  # Wishlist -> [count, value, purchased]
+    for wishlist, totals, sign in chain(_added(session), _changed(session), _removed(session)):
+        if wishlist is None or wishlist in session.deleted:
+            continue
+        change = changes.setdefault(wishlist, [0, Decimal(0), 0])
+        for index, amount in enumerate(totals):
+            change[index] += sign * amount
+
+    for wishlist, change in changes.items():
+        if any(change):
+            _apply_totals(wishlist, *change)
+
+
+@event.listens_for(Session, "before_flush")
+def touch_wishlists(session, flush_context, instances):  # pylint: disable=unused-argument
+    """Moves the version and updated_at on of Wishlists this flush changes
+
+    Changing a Product changes its Wishlist, old and new when it is moved.
+    The in-memory repository calls Wishlist.touch() itself.
+    """
+    touched = set()
+    for instance in session.dirty:
+        if isinstance(instance, Wishlist) and session.is_modified(instance):
+            touched.add(instance)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(instance, Product):
+            continue
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+        if instance not in session.deleted:
+            touched.add(_parent(session, instance))
+        if instance not in session.new:
+            touched.add(_stored(session, _committed(instance, "wishlist_id")))
+    now = datetime.now(timezone.utc)
+    for wishlist in touched:
+        # New Wishlists start at the column defaults
+        if wishlist is not None and wishlist not in session.deleted and inspect(wishlist).persistent:
+            wishlist.touch(now)
+
+
+# Product columns the totals are computed from
+TOTAL_COLUMNS = ("wishlist_id", "price", "quantity", "purchased")
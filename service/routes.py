@@ -21,12 +21,19 @@ This service implements a REST API that allows you to Create, Read, Update
 and Delete Wishlist
 """
 
+import json
+import os
 from decimal import Decimal, InvalidOperation
-from flask import jsonify, request, url_for, abort
+import msgpack
+from flask import jsonify, make_response, request, url_for, abort
 from flask import current_app as app  # Import Flask application
 from flask_restx import Api, Resource, fields, Namespace, reqparse
 from service.models import Wishlist, Product, DataValidationError
+from service.models.repository import search_terms
 from service.common import status  # HTTP Status Codes
+from service.common import cursors, metrics, profiler
+from service.common.snapshots import etag
+from service.common.tracing import traced, marshal, marshal_with
 
 api = Api(
     app,                    # your Flask app instance
@@ -39,6 +46,21 @@ api = Api(
     doc="/apidocs",         # 👈 Swagger docs
 )
 
+# Media types of request and response bodies; the same flask_restx models
+# are encoded as JSON or, for clients that ask for it, as MessagePack
+MSGPACK = "application/msgpack"
+BODY_TYPES = ("application/json", MSGPACK)
+
+
+@api.representation(MSGPACK)
+def output_msgpack(data, code, headers=None):
+    """Encodes a response as MessagePack for clients that Accept it"""
+    response = make_response(msgpack.packb(data), code)
+    response.headers.extend(headers or {})
+    response.content_type = MSGPACK
+    return response
+
+
 ######################################################################
 # GET HEALTH CHECK
 ######################################################################
@@ -50,6 +72,50 @@ def health_check():
     return jsonify(status=200, message="Healthy"), status.HTTP_200_OK
 
 
+######################################################################
+# GET READINESS
+######################################################################
+@app.route("/ready")
+def readiness_check():
+    """Reports whether this worker can serve traffic, from cached checks"""
+    ready, checks = app.extensions["readiness"].check()
+    if ready:
+        return jsonify(status="ready", checks=checks), status.HTTP_200_OK
+    return jsonify(status="not ready", checks=checks), status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+######################################################################
+# GET METRICS
+######################################################################
+@app.route("/metrics")
+def get_metrics():
+    """Returns the Prometheus metrics of all worker processes"""
+    body, content_type = metrics.render()
+    return body, status.HTTP_200_OK, {"Content-Type": content_type}
+
+
+######################################################################
+# GET PROFILE
+######################################################################
+@app.route("/admin/profile")
+def get_profile():
+    """Samples the stacks of this worker and returns them collapsed for a flamegraph"""
+    if not app.config.get("ADMIN_TOKEN"):
+        abort(status.HTTP_404_NOT_FOUND, "Profiling is not enabled.")
+    if not profiler.authorized():
+        abort(status.HTTP_401_UNAUTHORIZED, "A valid admin token is required.")
+    seconds = request.args.get("seconds", 10.0, type=float)
+    interval_ms = request.args.get("interval_ms", profiler.DEFAULT_INTERVAL_MS, type=float)
+    if not 0 < seconds <= app.config["PROFILE_MAX_SECONDS"]:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"seconds must be between 0 and {app.config['PROFILE_MAX_SECONDS']:g}",
+        )
+    app.logger.info("Profiling worker %d for %.1f seconds", os.getpid(), seconds)
+    stacks = profiler.sample(seconds, interval_ms)
+    return profiler.collapse(stacks), status.HTTP_200_OK, {"Content-Type": "text/plain; charset=utf-8"}
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -79,14 +145,25 @@ wishlist_model = wishlists_ns.inherit(
     create_wishlist_model,
     {
         "id": fields.Integer(readOnly=True, description="The unique ID of the Wishlist", example=1),
+        "product_count": fields.Integer(readOnly=True, description="Number of products", example=2),
+        "total_value": fields.Float(readOnly=True, description="Sum of price x quantity", example=39.98),
+        "purchased_count": fields.Integer(readOnly=True, description="Number of purchased products", example=1),
         "products": fields.List(fields.Raw, description="List of products in the Wishlist", example=[]),
     },
 )
 
 wishlist_args = reqparse.RequestParser()
 wishlist_args.add_argument("name", type=str, required=False, location="args", help="Filter wishlists by name")
+wishlist_args.add_argument("userid", type=str, required=False, location="args", help="Filter wishlists by owner")
 wishlist_args.add_argument("page", type=int, required=False, default=1, location="args", help="Page number")
 wishlist_args.add_argument("limit", type=int, required=False, default=10, location="args", help="Items per page")
+wishlist_args.add_argument(
+    "sort", type=str, required=False, default="id", location="args",
+    help="Sort by id, name, product_count, total_value or purchased_count; prefix with - for descending",
+)
+wishlist_args.add_argument(
+    "cursor", type=str, required=False, location="args", help="X-Next-Cursor of the previous page, instead of page"
+)
 
 products_ns = Namespace("products", description="Product operations")
 api.add_namespace(products_ns, path="/wishlists/<int:wishlist_id>/products")
@@ -123,10 +200,86 @@ product_patch_model = products_ns.model(
     }
 )
 
-product_filter_args = reqparse.RequestParser()
+product_search_model = products_ns.inherit(
+    "ProductSearchResult",
+    product_model,
+    {"rank": fields.Float(readOnly=True, description="How well the Product matches, higher is better", example=0.1)},
+)
+
+# Largest page of search results
+SEARCH_MAX_LIMIT = 100
+
+product_search_args = reqparse.RequestParser()
+product_search_args.add_argument("userid", type=str, required=True, location="args", help="Owner of the Wishlists")
+product_search_args.add_argument("q", type=str, required=True, location="args", help="Words to search for")
+product_search_args.add_argument("limit", type=int, required=False, default=10, location="args", help="Results per page")
+product_search_args.add_argument(
+    "cursor", type=str, required=False, location="args", help="X-Next-Cursor of the previous page"
+)
+
+price_bucket_model = products_ns.model(
+    "PriceBucket",
+    {
+        "min": fields.Float(description="Lowest price of the bin", example=10.0),
+        "max": fields.Float(description="Highest price of the bin, inclusive only for the last", example=20.0),
+        "count": fields.Integer(description="Number of Products in the bin", example=3),
+    },
+)
+
+price_stats_model = products_ns.model(
+    "PriceStats",
+    {
+        "count": fields.Integer(description="Number of Products", example=12),
+        "min": fields.Float(example=4.99),
+        "max": fields.Float(example=89.0),
+        "avg": fields.Float(example=23.5),
+        "percentiles": fields.Nested(
+            products_ns.model("PricePercentiles", {f"p{n}": fields.Float() for n in (25, 50, 75, 90)}),
+            description="Interpolated percentiles, like percentile_cont",
+        ),
+        "histogram": fields.List(fields.Nested(price_bucket_model), description="Equal width price bins"),
+    },
+)
+
+# Most bins a price histogram can have
+PRICE_STATS_MAX_BUCKETS = 50
+
+price_stats_args = reqparse.RequestParser()
+price_stats_args.add_argument(
+    "buckets", type=int, required=False, default=10, location="args", help="Number of histogram bins"
+)
+user_price_stats_args = price_stats_args.copy()
+user_price_stats_args.add_argument("userid", type=str, required=True, location="args", help="Owner of the Wishlists")
+
+product_fields_args = reqparse.RequestParser()
+product_fields_args.add_argument(
+    "fields", type=str, required=False, location="args",
+    help="Comma separated Product fields to return, e.g. id,name,price (all if not given)",
+)
+
+product_filter_args = product_fields_args.copy()
 product_filter_args.add_argument("product_name", type=str, required=False, help="Filter products by name")
 product_filter_args.add_argument("min_price", type=str, required=False, help="Minimum price filter")
 product_filter_args.add_argument("max_price", type=str, required=False, help="Maximum price filter")
+product_filter_args.add_argument(
+    "sort", type=str, required=False, default="created", location="args",
+    help="created, price or name, with a leading - for descending",
+)
+product_filter_args.add_argument("page", type=int, required=False, default=1, location="args", help="Page number")
+product_filter_args.add_argument(
+    "limit", type=int, required=False, location="args", help="Items per page, all Products if not given"
+)
+
+shared_ns = Namespace("shared", description="Public read-only snapshots of shared Wishlists")
+api.add_namespace(shared_ns, path="/shared")
+
+share_model = wishlists_ns.model(
+    "WishlistShare",
+    {
+        "token": fields.String(readOnly=True, description="Opaque token of the public snapshot"),
+        "url": fields.String(readOnly=True, description="Public URL of the snapshot"),
+    },
+)
 
 
 @wishlists_ns.route("", endpoint="wishlist_collection")
@@ -137,13 +290,13 @@ class WishlistCollection(Resource):
     @wishlists_ns.expect(create_wishlist_model)
     @wishlists_ns.response(201, "Wishlist created")
     @wishlists_ns.response(400, "Invalid Wishlist data")
-    @wishlists_ns.marshal_with(wishlist_model, code=201)
+    @marshal_with(wishlists_ns, wishlist_model, code=201)
     def post(self):
         """Creates a new Wishlist (with optional products)"""
         app.logger.info("Request to create a Wishlist")
-        check_content_type("application/json")
+        check_content_type(*BODY_TYPES)
 
-        data = request.get_json()
+        data = request_data()
 
         wishlist = Wishlist()
         try:
@@ -158,23 +311,87 @@ class WishlistCollection(Resource):
 
     @wishlists_ns.doc("list_wishlists")
     @wishlists_ns.expect(wishlist_args)
-    @wishlists_ns.marshal_list_with(wishlist_model)
+    @marshal_with(wishlists_ns, wishlist_model, as_list=True)
     def get(self):
-        """Returns paginated Wishlists with optional name filtering"""
+        """Returns paginated Wishlists with optional name and userid filtering and sorting
+
+        Pages are selected by page number or, for long lists, by passing the
+        X-Next-Cursor header of the previous page as cursor.
+        """
         app.logger.info("Request for Wishlists list")
 
         args = wishlist_args.parse_args()
         name = args.get("name")
+        userid = args.get("userid")
+        sort = args.get("sort") or "id"
         page = max(1, args.get("page", 1))
         limit = max(1, args.get("limit", 10))
 
-        query = Wishlist.query
-        if name:
-            query = query.filter(Wishlist.name == name)
+        try:
+            if args.get("cursor"):
+                after = cursors.decode(args["cursor"], Wishlist.cursor_types(sort))
+                wishlists = Wishlist.find_after(after, limit, sort, name=name, userid=userid)
+            else:
+                wishlists = Wishlist.find_page(page, limit, name, sort, userid)
+        except (DataValidationError, ValueError) as e:
+            abort(status.HTTP_400_BAD_REQUEST, description=str(e))
 
-        paginated = query.paginate(page=page, per_page=limit, error_out=False)
+        # A full page may have more after it; the last page can come back empty
+        headers = {}
+        if len(wishlists) == limit:
+            headers["X-Next-Cursor"] = cursors.encode(wishlists[-1].cursor(sort))
+        return [wishlist.serialize() for wishlist in wishlists], status.HTTP_200_OK, headers
 
-        return [wishlist.serialize() for wishlist in paginated.items], status.HTTP_200_OK
+
+@wishlists_ns.route("/products", endpoint="product_search")
+class ProductSearch(Resource):
+    """Searches the Products of all of a user's Wishlists"""
+
+    @wishlists_ns.doc("search_products")
+    @wishlists_ns.expect(product_search_args)
+    @wishlists_ns.response(400, "No words to search for or invalid cursor")
+    @marshal_with(wishlists_ns, product_search_model, as_list=True)
+    def get(self):
+        """Returns the Products matching all of the words in q, best matches first
+
+        Pages are linked by cursor: the X-Next-Cursor header of a page is
+        passed as cursor to get the next one and is missing on the last.
+        """
+        app.logger.info("Request to search Products")
+        args = product_search_args.parse_args()
+        if not search_terms(args["q"]):
+            abort(status.HTTP_400_BAD_REQUEST, description="q must contain at least one word")
+        limit = min(max(1, args["limit"]), SEARCH_MAX_LIMIT)
+        after = None
+        if args.get("cursor"):
+            try:
+                after = cursors.decode(args["cursor"], ((int, float), int))
+            except ValueError as e:
+                abort(status.HTTP_400_BAD_REQUEST, description=str(e))
+
+        results = Product.search(args["userid"], args["q"], limit + 1, after)
+
+        headers = {}
+        if len(results) > limit:
+            results = results[:limit]
+            rank, product = results[-1]
+            headers["X-Next-Cursor"] = cursors.encode((rank, product.id))
+        return [{**product.serialize(), "rank": rank} for rank, product in results], status.HTTP_200_OK, headers
+
+
+@wishlists_ns.route("/products/stats", endpoint="user_price_stats")
+class UserPriceStats(Resource):
+    """Price statistics over all of a user's Wishlists"""
+
+    @wishlists_ns.doc("user_price_stats")
+    @wishlists_ns.expect(user_price_stats_args)
+    @marshal_with(wishlists_ns, price_stats_model)
+    def get(self):
+        """Returns the min, max, average, percentiles and histogram of a user's Product prices"""
+        args = user_price_stats_args.parse_args()
+        app.logger.info("Request for price statistics of user: %s", args["userid"])
+        buckets = min(max(1, args["buckets"]), PRICE_STATS_MAX_BUCKETS)
+        return Product.price_stats(buckets, userid=args["userid"]), status.HTTP_200_OK
 
 
 @wishlists_ns.route("/<int:wishlist_id>", endpoint="wishlist_resource")
@@ -183,7 +400,7 @@ class WishlistResource(Resource):
     @wishlists_ns.doc("get_wishlist")
     @wishlists_ns.response(200, "Wishlist retrieved successfully")
     @wishlists_ns.response(404, "Wishlist not found")
-    @wishlists_ns.marshal_with(wishlist_model)
+    @marshal_with(wishlists_ns, wishlist_model)
     def get(self, wishlist_id):
         """Retrieve a Wishlist by its ID"""
         app.logger.info("Request for Wishlist with id: %s", wishlist_id)
@@ -213,17 +430,17 @@ class WishlistResource(Resource):
     @wishlists_ns.response(400, "Missing required field: name")
     @wishlists_ns.response(404, "Wishlist not found")
     @wishlists_ns.expect(create_wishlist_model)  # reuses existing input model
-    @wishlists_ns.marshal_with(wishlist_model)
+    @marshal_with(wishlists_ns, wishlist_model)
     def put(self, wishlist_id):
         """Update a Wishlist (only 'name' is allowed to change)"""
         app.logger.info("Request to update Wishlist with id [%s]", wishlist_id)
-        check_content_type("application/json")
+        check_content_type(*BODY_TYPES)
 
         wishlist = Wishlist.find(wishlist_id)
         if not wishlist:
             abort(status.HTTP_404_NOT_FOUND, description=f"Wishlist with id '{wishlist_id}' was not found.")
 
-        data = request.get_json()
+        data = request_data()
         app.logger.debug("Payload = %s", data)
 
         if "name" not in data:
@@ -235,6 +452,68 @@ class WishlistResource(Resource):
         return wishlist.serialize(), status.HTTP_200_OK
 
 
+@wishlists_ns.route("/<int:wishlist_id>/share", endpoint="wishlist_share")
+@wishlists_ns.param("wishlist_id", "The Wishlist ID")
+class WishlistShare(Resource):
+    """Shares a Wishlist publicly or stops sharing it"""
+
+    @wishlists_ns.doc("share_wishlist")
+    @wishlists_ns.response(201, "Wishlist shared")
+    @wishlists_ns.response(200, "Wishlist was already shared")
+    @wishlists_ns.response(404, "Wishlist not found")
+    @marshal_with(wishlists_ns, share_model)
+    def post(self, wishlist_id):
+        """Returns the public share token of a Wishlist, creating it if needed"""
+        app.logger.info("Request to share Wishlist with id [%s]", wishlist_id)
+        wishlist = Wishlist.find(wishlist_id)
+        if not wishlist:
+            abort(status.HTTP_404_NOT_FOUND, description=f"Wishlist with id '{wishlist_id}' was not found.")
+        created = wishlist.share()
+        token = wishlist.share_token
+        url = url_for("shared_wishlist", token=token, _external=True)
+        return {"token": token, "url": url}, status.HTTP_201_CREATED if created else status.HTTP_200_OK
+
+    @wishlists_ns.doc("unshare_wishlist")
+    @wishlists_ns.response(204, "Wishlist no longer shared")
+    def delete(self, wishlist_id):
+        """Revokes the share token of a Wishlist"""
+        app.logger.info("Request to stop sharing Wishlist with id [%s]", wishlist_id)
+        wishlist = Wishlist.find(wishlist_id)
+        if wishlist and wishlist.share_token:
+            wishlist.unshare()
+        return "", status.HTTP_204_NO_CONTENT
+
+
+@shared_ns.route("/<string:token>", endpoint="shared_wishlist")
+@shared_ns.param("token", "The share token of the Wishlist")
+class SharedWishlist(Resource):
+    """Public snapshot of a shared Wishlist"""
+
+    @shared_ns.doc("get_shared_wishlist")
+    @shared_ns.response(200, "Snapshot of the Wishlist")
+    @shared_ns.response(304, "Snapshot not modified since If-None-Match or If-Modified-Since")
+    @shared_ns.response(404, "No Wishlist is shared under this token")
+    def get(self, token):
+        """Returns the snapshot of a shared Wishlist, cacheable by proxies"""
+        app.logger.info("Request for shared Wishlist")
+        wishlist = Wishlist.find_by_share_token(token)
+        if not wishlist:
+            abort(status.HTTP_404_NOT_FOUND, description="No Wishlist is shared under this token.")
+        version = wishlist.version
+        data = app.extensions["snapshots"].get(
+            (token, version), lambda: json.dumps(wishlist.snapshot(), separators=(",", ":")).encode()
+        )
+        response = make_response(data, status.HTTP_200_OK)
+        response.content_type = "application/json"
+        response.set_etag(etag(version))
+        response.last_modified = wishlist.modified()
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config.get("SHARE_MAX_AGE", 60)
+        # If-None-Match is compared weakly, so the weak ETags of compressed
+        # copies match too
+        return response.make_conditional(request)
+
+
 @products_ns.route("", endpoint="product_collection")
 class ProductCollection(Resource):
     """Handles all interactions with collections of Pets"""
@@ -243,11 +522,11 @@ class ProductCollection(Resource):
     @products_ns.response(201, "Product created")
     @products_ns.response(400, "Invalid data")
     @products_ns.response(404, "Wishlist not found")
-    @products_ns.marshal_with(product_model, code=201)
+    @marshal_with(products_ns, product_model, code=201)
     def post(self, wishlist_id):
         """Create a new Product in a Wishlist"""
         app.logger.info("Request to create Product for Wishlist with id: %s", wishlist_id)
-        check_content_type("application/json")
+        check_content_type(*BODY_TYPES)
 
         wishlist = Wishlist.find(wishlist_id)
         if not wishlist:
@@ -255,7 +534,7 @@ class ProductCollection(Resource):
 
         product = Product()
         try:
-            product.deserialize(request.get_json())
+            product.deserialize(request_data())
         except DataValidationError as e:
             abort(status.HTTP_400_BAD_REQUEST, description=f"Invalid product data: {e}")
 
@@ -267,9 +546,12 @@ class ProductCollection(Resource):
 
     @products_ns.doc("list_products")
     @products_ns.expect(product_filter_args)
-    @products_ns.marshal_list_with(product_model)
+    @products_ns.response(200, "Products", [product_model])
     def get(self, wishlist_id):
-        """Returns all Products for a Wishlist, optionally filtered by name and price"""
+        """Returns the Products of a Wishlist, optionally filtered by name and price, sorted and paged
+
+        Filtering, sorting and paging all happen in the database.
+        """
         app.logger.info("Request for all Products for Wishlist with id: %s", wishlist_id)
 
         wishlist = Wishlist.find(wishlist_id)
@@ -277,7 +559,7 @@ class ProductCollection(Resource):
             abort(status.HTTP_404_NOT_FOUND, description=f"Wishlist with id '{wishlist_id}' could not be found.")
 
         args = product_filter_args.parse_args()
-        name_filter = (args.get("product_name") or "").strip().lower()
+        name_filter = (args.get("product_name") or "").strip()
 
         # Parse and validate min_price and max_price
         try:
@@ -290,15 +572,36 @@ class ProductCollection(Resource):
         except (ValueError, TypeError, InvalidOperation):
             abort(status.HTTP_400_BAD_REQUEST, description="Invalid max_price parameter. Must be a valid number.")
 
-        # Apply filters
-        filtered = [
-            p for p in wishlist.products
-            if (not name_filter or name_filter in p.name.lower())
-            and (min_price is None or p.price >= min_price)
-            and (max_price is None or p.price <= max_price)
-        ]
+        limit = max(1, args["limit"]) if args.get("limit") is not None else None
+        fieldset, mask = sparse_fields(args.get("fields"))
+        try:
+            products = Product.find_by_wishlist(
+                wishlist.id, args.get("sort") or "created", max(1, args.get("page") or 1), limit, fieldset or (),
+                name=name_filter, min_price=min_price, max_price=max_price,
+            )
+        except DataValidationError as e:
+            abort(status.HTTP_400_BAD_REQUEST, description=str(e))
 
-        return [p.serialize() for p in filtered], status.HTTP_200_OK
+        return marshal([p.serialize(fieldset) for p in products], product_model, mask=mask), status.HTTP_200_OK
+
+
+@products_ns.route("/stats", endpoint="wishlist_price_stats")
+@products_ns.param("wishlist_id", "The Wishlist ID")
+class WishlistPriceStats(Resource):
+    """Price statistics of one Wishlist"""
+
+    @products_ns.doc("wishlist_price_stats")
+    @products_ns.expect(price_stats_args)
+    @products_ns.response(404, "Wishlist not found")
+    @marshal_with(products_ns, price_stats_model)
+    def get(self, wishlist_id):
+        """Returns the min, max, average, percentiles and histogram of a Wishlist's Product prices"""
+        app.logger.info("Request for price statistics of Wishlist with id: %s", wishlist_id)
+        if not Wishlist.find(wishlist_id):
+            abort(status.HTTP_404_NOT_FOUND, description=f"Wishlist with id '{wishlist_id}' could not be found.")
+        args = price_stats_args.parse_args()
+        buckets = min(max(1, args["buckets"]), PRICE_STATS_MAX_BUCKETS)
+        return Product.price_stats(buckets, wishlist_id=wishlist_id), status.HTTP_200_OK
 
 
 @products_ns.route("/<int:product_id>", endpoint="product_resource")
@@ -310,16 +613,18 @@ class ProductResource(Resource):
     @products_ns.response(200, "Product retrieved")
     @products_ns.response(403, "Product does not belong to the specified wishlist")
     @products_ns.response(404, "Product not found")
-    @products_ns.marshal_with(product_model)
+    @products_ns.expect(product_fields_args)
+    @products_ns.response(200, "Product", product_model)
     def get(self, wishlist_id, product_id):
         """Retrieve a single Product by its ID within a Wishlist"""
         app.logger.info("Request to retrieve Product %s for Wishlist id: %s", product_id, wishlist_id)
+        fieldset, mask = sparse_fields(product_fields_args.parse_args().get("fields"))
 
         wishlist = Wishlist.find(wishlist_id)
         if not wishlist:
             abort(status.HTTP_404_NOT_FOUND, description=f"Wishlist with id '{wishlist_id}' was not found.")
 
-        product = Product.find(product_id)
+        product = Product.find(product_id, (*fieldset, "wishlist_id") if fieldset else ())
         if not product:
             abort(status.HTTP_404_NOT_FOUND, description=f"Product with id '{product_id}' was not found.")
 
@@ -327,7 +632,7 @@ class ProductResource(Resource):
         if product.wishlist_id != wishlist.id:
             abort(status.HTTP_403_FORBIDDEN, description="Product does not belong to the specified wishlist.")
 
-        return product.serialize(), status.HTTP_200_OK
+        return marshal(product.serialize(fieldset), product_model, mask=mask), status.HTTP_200_OK
 
     @products_ns.doc("delete_product")
     @products_ns.response(204, "Product deleted")
@@ -359,13 +664,13 @@ class ProductResource(Resource):
     @products_ns.response(400, "Invalid product data")
     @products_ns.response(403, "Product does not belong to the specified wishlist")
     @products_ns.response(404, "Product not found")
-    @products_ns.marshal_with(product_model)
+    @marshal_with(products_ns, product_model)
     def patch(self, wishlist_id, product_id):
         """Partial update of a Product (note, is_gift, quantity, purchased)"""
         app.logger.info("Request to partially update Product %s in Wishlist %s", product_id, wishlist_id)
-        check_content_type("application/json")
+        check_content_type(*BODY_TYPES)
 
-        data = request.get_json()
+        data = request_data()
         if not data:
             abort(status.HTTP_400_BAD_REQUEST, "Request must contain data")
 
@@ -380,11 +685,11 @@ class ProductResource(Resource):
 
     @products_ns.doc("put_product")
     @products_ns.expect(create_product_model)
-    @products_ns.marshal_with(product_model)
+    @marshal_with(products_ns, product_model)
     def put(self, wishlist_id, product_id):
         """Full update of a Product (PUT)"""
         app.logger.info("Request to fully update Product %s in Wishlist %s", product_id, wishlist_id)
-        check_content_type("application/json")
+        check_content_type(*BODY_TYPES)
 
         wishlist = Wishlist.find(wishlist_id)
         if not wishlist:
@@ -397,7 +702,7 @@ class ProductResource(Resource):
         if product.wishlist_id != wishlist.id:
             abort(status.HTTP_403_FORBIDDEN, "Product does not belong to the specified wishlist.")
 
-        data = request.get_json()
+        data = request_data()
         if not data:
             abort(status.HTTP_400_BAD_REQUEST, description="Missing product data")
 
@@ -423,24 +728,49 @@ class ProductResource(Resource):
 ######################################################################
 
 
-def check_content_type(content_type):
-    """Checks that the media type is correct"""
+@traced()
+def check_content_type(*content_types):
+    """Checks that the media type is one of content_types"""
+    expected = " or ".join(content_types)
     if "Content-Type" not in request.headers:
         app.logger.error("No Content-Type specified.")
         abort(
             status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            f"Content-Type must be {content_type}",
+            f"Content-Type must be {expected}",
         )
 
-    if request.headers["Content-Type"] == content_type:
+    if request.mimetype in content_types:
         return
 
     app.logger.error("Invalid Content-Type: %s", request.headers["Content-Type"])
     abort(
-        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Content-Type must be {content_type}"
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Content-Type must be {expected}"
     )
 
 
+def sparse_fields(value):
+    """Returns the Product fields named in a fields parameter and the marshalling
+    mask that keeps only them, or (None, None) when all fields are wanted"""
+    if not value:
+        return None, None
+    try:
+        fieldset = Product.check_fields(value.split(","))
+    except DataValidationError as e:
+        abort(status.HTTP_400_BAD_REQUEST, description=str(e))
+    return fieldset, "{" + ",".join(fieldset) + "}"
+
+
+def request_data():
+    """Returns the decoded JSON or MessagePack body of the request"""
+    if request.mimetype != MSGPACK:
+        return request.get_json()
+    try:
+        return msgpack.unpackb(request.get_data())
+    except (ValueError, msgpack.UnpackException) as error:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid MessagePack body: {error}")
+    return None
+
+
 def validate_patch_input(wishlist_id, product_id):
     """Validate wishlist and product existence and ownership"""
     wishlist = Wishlist.find(wishlist_id)
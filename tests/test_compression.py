@@ -0,0 +1,129 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Response Compression Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import gzip
+import json
+import logging
+from unittest import TestCase
+import brotli
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+from wsgi import app
+from service.common import status
+from service.common.compression import Compressor
+from tests.factories import WishlistFactory, ProductFactory
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestCompression(TestCase):
+    """Response Compression Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        self.compressor = app.extensions["compression"]
+        wishlist_id = self.client.post("/api/wishlists", json=WishlistFactory().serialize()).get_json()["id"]
+        for _ in range(20):
+            self.client.post(f"/api/wishlists/{wishlist_id}/products", json=ProductFactory().serialize())
+        self.url = f"/api/wishlists/{wishlist_id}"
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["COMPRESS_MIN_SIZE"] = 1024
+        self.client.delete(self.url)
+
+    def test_gzip_large_response(self):
+        """It should gzip large JSON responses for clients that accept it"""
+        plain = self.client.get(self.url)
+        self.assertGreaterEqual(len(plain.data), 1024)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.headers["Vary"], "Accept-Encoding")
+        resp = self.client.get(self.url, headers=GZIP)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(resp.headers["Vary"], "Accept-Encoding")
+        self.assertLess(int(resp.headers["Content-Length"]), len(plain.data))
+        self.assertEqual(json.loads(gzip.decompress(resp.data)), plain.get_json())
+
+    def test_brotli_large_response(self):
+        """It should prefer brotli for clients that accept it"""
+        plain = self.client.get(self.url)
+        resp = self.client.get(self.url, headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(resp.headers["Content-Encoding"], "br")
+        self.assertEqual(json.loads(brotli.decompress(resp.data)), plain.get_json())
+
+    def test_small_response(self):
+        """It should send responses below COMPRESS_MIN_SIZE as they are"""
+        app.config["COMPRESS_MIN_SIZE"] = 1 << 20
+        resp = self.client.get(self.url, headers=GZIP)
+        self.assertNotIn("Content-Encoding", resp.headers)
+        resp = self.client.get("/health", headers=GZIP)
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+    def test_encoding_refused(self):
+        """It should not compress for encodings the client refuses"""
+        resp = self.client.get(self.url, headers={"Accept-Encoding": "gzip;q=0, deflate"})
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+    def test_choose_encoding(self):
+        """It should pick the first of the most acceptable encodings"""
+        compressor = Compressor()
+        for header, expected in (
+            ("gzip", "gzip"),
+            ("*", "br"),
+            ("br, gzip", "br"),
+            ("deflate, gzip;q=0.5", "gzip"),
+            ("identity", None),
+        ):
+            self.assertEqual(compressor.choose(parse_accept_header(header, Accept)), expected)
+
+    def test_reuse_compressed_bytes(self):
+        """It should compress a body with a strong ETag only once"""
+        with app.test_request_context(headers=GZIP):
+            first = app.make_response(({"name": "x" * 2000}, 200))
+            first.set_etag("v1")
+            hits = self.compressor.hits
+            first = app.process_response(first)
+            again = app.make_response(({"name": "x" * 2000}, 200))
+            again.set_etag("v1")
+            again = app.process_response(again)
+        self.assertEqual(self.compressor.hits, hits + 1)
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(again.headers["ETag"], 'W/"v1"')
+
+    def test_cache_size(self):
+        """It should keep at most cache_size compressed bodies"""
+        compressor = Compressor(cache_size=2)
+        for tag in ("a", "b", "c"):
+            compressor.compress(b"body", "gzip", (tag, "application/json"))
+        compressor.compress(b"body", "gzip", ("a", "application/json"))
+        self.assertEqual(compressor.hits, 0)
+        compressor.compress(b"body", "gzip", ("c", "application/json"))
+        self.assertEqual(compressor.hits, 1)
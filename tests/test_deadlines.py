@@ -0,0 +1,199 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Request Deadline Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import os
+import time
+import logging
+from unittest import TestCase, skipUnless
+from unittest.mock import patch, MagicMock
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from wsgi import app
+from service.common import status
+from service.common.deadlines import on_connect, on_begin, start_deadline, init_deadlines
+from service.models import db, Wishlist
+from .factories import WishlistFactory
+
+BASE_URL = "/api/wishlists"
+POSTGRES = os.getenv("DATABASE_URI", "postgresql").startswith("postgresql")
+
+
+def slow_find(seconds):
+    """Returns a stand-in for Wishlist.find that runs a slow query"""
+
+    def find(by_id):  # pylint: disable=unused-argument
+        db.session.execute(text(f"SELECT pg_sleep({seconds})"))
+
+    return find
+
+
+def late_find(seconds):
+    """Returns a stand-in for Wishlist.find that burns the budget first"""
+    original = Wishlist.find
+
+    def find(by_id):
+        time.sleep(seconds)
+        return original(by_id)
+
+    return find
+
+
+def set_local(budget_ms, default_ms, dialect="postgresql"):
+    """Returns the statements on_begin() sends for an endpoint budget and
+    a connection default statement_timeout"""
+    connection = MagicMock()
+    connection.dialect.name = dialect
+    connection.info = {"statement_timeout_ms": default_ms} if default_ms else {}
+    app.config["DB_ENDPOINT_BUDGETS_MS"] = {"wishlist_resource": budget_ms}
+    with app.test_request_context(f"{BASE_URL}/1"):
+        start_deadline()
+        on_begin(None, None, connection)
+    return [call.args[0] for call in connection.exec_driver_sql.call_args_list]
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestDeadlines(TestCase):
+    """Per-request database budget tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        self.budget = app.config["DB_REQUEST_BUDGET_MS"]
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["DB_REQUEST_BUDGET_MS"] = self.budget
+        app.config["DB_ENDPOINT_BUDGETS_MS"] = {}
+
+    @skipUnless(POSTGRES, "statement_timeout is only available on Postgres")
+    def test_statement_timeout(self):
+        """It should cancel a query that outlives the budget with 504"""
+        app.config["DB_ENDPOINT_BUDGETS_MS"] = {"wishlist_resource": 200}
+        with patch("service.routes.Wishlist.find", side_effect=slow_find(5)):
+            start = time.monotonic()
+            resp = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(resp.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertLess(time.monotonic() - start, 2)
+
+    @skipUnless(POSTGRES, "statement_timeout is only available on Postgres")
+    def test_endpoint_budget_above_default(self):
+        """It should give an endpoint budget larger than the default its full time"""
+        timeouts = []
+
+        def find(by_id):  # pylint: disable=unused-argument
+            timeouts.append(db.session.execute(text("SHOW statement_timeout")).scalar())
+
+        app.config["DB_ENDPOINT_BUDGETS_MS"] = {"wishlist_resource": 60000}
+        with patch("service.routes.Wishlist.find", side_effect=find):
+            self.client.get(f"{BASE_URL}/1")
+        app.config["DB_ENDPOINT_BUDGETS_MS"] = {"wishlist_resource": 0}
+        with patch("service.routes.Wishlist.find", side_effect=find):
+            self.client.get(f"{BASE_URL}/1")
+        self.assertRegex(timeouts[0], r"^(59\d{3}ms|1min)$")
+        self.assertEqual(timeouts[1], "0")
+
+    def test_budget_exhausted(self):
+        """It should refuse queries once the budget is spent with 503"""
+        app.config["DB_REQUEST_BUDGET_MS"] = 10
+        with patch("service.routes.Wishlist.find", side_effect=late_find(0.05)):
+            resp = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.get_json()["message"], "The request exceeded its database time budget")
+
+    def test_budget_exhausted_on_commit(self):
+        """It should not report an exhausted budget as bad data"""
+        app.config["DB_REQUEST_BUDGET_MS"] = 1
+        with patch("service.routes.check_content_type", side_effect=lambda *_: time.sleep(0.05)):
+            resp = self.client.post(BASE_URL, json=WishlistFactory().serialize())
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_statement_timeout_response(self):
+        """It should answer 504 when the server cancels a statement"""
+        error = OperationalError("SELECT pg_sleep(5)", {}, MagicMock(sqlstate="57014"))
+        with patch("service.routes.Wishlist.find", side_effect=error):
+            resp = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(resp.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(resp.get_json()["message"], "The database did not answer within the request time budget")
+
+    def test_set_local_timeout(self):
+        """It should set the transaction statement_timeout to the endpoint budget"""
+        (statement,) = set_local(60000, 5000)
+        self.assertRegex(statement, r"^SET LOCAL statement_timeout = (59\d{3}|60000)$")
+        (statement,) = set_local(200, None)
+        self.assertRegex(statement, r"^SET LOCAL statement_timeout = (1\d{2}|200)$")
+        self.assertEqual(set_local(0, 5000), ["SET LOCAL statement_timeout = 0"])
+        self.assertEqual(set_local(0, None), [])
+        self.assertEqual(set_local(5000, 5000), [])
+        self.assertEqual(set_local(60000, 5000, "sqlite"), [])
+
+    def test_set_local_remaining(self):
+        """It should tighten the statement_timeout to what is left of the budget"""
+        with patch("service.common.deadlines.time.monotonic", side_effect=[100.0, 102.0]):
+            (statement,) = set_local(5000, 5000)
+        self.assertEqual(statement, "SET LOCAL statement_timeout = 3000")
+        with patch("service.common.deadlines.time.monotonic", side_effect=[100.0, 106.0]):
+            (statement,) = set_local(5000, 5000)
+        self.assertEqual(statement, "SET LOCAL statement_timeout = 1")
+
+    def test_connect_listener(self):
+        """It should set the default statement_timeout of new Postgres connections"""
+        dbapi_connection, record = MagicMock(), MagicMock(info={})
+        on_connect(1234)(dbapi_connection, record)
+        cursor = dbapi_connection.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with("SET statement_timeout = 1234")
+        dbapi_connection.commit.assert_called_once()
+        self.assertEqual(record.info["statement_timeout_ms"], 1234)
+        fake_app, fake_db = MagicMock(config={"DB_REQUEST_BUDGET_MS": 1234}), MagicMock()
+        fake_db.engine.dialect.name = "postgresql"
+        with patch("service.common.deadlines.event.listen") as listen:
+            init_deadlines(fake_app, fake_db)
+        self.assertIn("connect", [call.args[1] for call in listen.call_args_list])
+
+    def test_database_unavailable(self):
+        """It should answer 503 when the database cannot be reached"""
+        error = OperationalError("SELECT 1", {}, Exception("connection refused"))
+        with patch("service.routes.Wishlist.find", side_effect=error):
+            resp = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_no_budget(self):
+        """It should not limit requests when the budget is 0"""
+        app.config["DB_REQUEST_BUDGET_MS"] = 0
+        resp = self.client.get(f"{BASE_URL}/0")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipUnless(POSTGRES, "statement_timeout is only available on Postgres")
+    def test_connection_default_timeout(self):
+        """It should give new connections the budget as statement_timeout"""
+        with app.app_context():
+            with db.engine.connect() as conn:
+                on_connect(1234)(conn.connection.dbapi_connection, conn.connection._connection_record)
+                timeout = conn.exec_driver_sql("SHOW statement_timeout").scalar()
+                on_connect(self.budget)(conn.connection.dbapi_connection, conn.connection._connection_record)
+        self.assertEqual(timeout, "1234ms")
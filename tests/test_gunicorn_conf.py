@@ -0,0 +1,100 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Gunicorn Configuration Test Suite
+"""
+
+import os
+import runpy
+import signal
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, mock_open, MagicMock
+from wsgi import app
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py")
+
+
+def load_config(**env):
+    """Loads gunicorn.conf.py with the given environment"""
+    with patch.dict(os.environ, env):
+        return runpy.run_path(CONFIG_FILE)
+
+
+class TestGunicornConfig(TestCase):
+    """Gunicorn Configuration Tests"""
+
+    def test_sync_defaults(self):
+        """It should size sync workers from the CPU count"""
+        config = load_config(GUNICORN_WORKER_CLASS="sync", PORT="9090")
+        self.assertEqual(config["workers"], 2 * config["CORES"] + 1)
+        self.assertEqual(config["bind"], os.getenv("GUNICORN_BIND", "0.0.0.0:9090"))
+        self.assertTrue(config["preload_app"])
+        self.assertEqual(config["max_requests_jitter"], config["max_requests"] // 10)
+
+    def test_gthread_workers(self):
+        """It should use a thread pool per worker for gthread"""
+        config = load_config(GUNICORN_WORKER_CLASS="gthread", GUNICORN_THREADS="8", GUNICORN_PRELOAD="no")
+        self.assertEqual(config["worker_class"], "gthread")
+        self.assertEqual(config["threads"], 8)
+        self.assertFalse(config["preload_app"])
+
+    def test_cpu_count_honors_cgroup_quota(self):
+        """It should cap the CPU count at the cgroup quota"""
+        cpu_count = load_config()["cpu_count"]
+        with patch("os.sched_getaffinity", return_value=set(range(8))):
+            with patch("builtins.open", mock_open(read_data="150000 100000\n")):
+                self.assertEqual(cpu_count(), 2)
+            with patch("builtins.open", mock_open(read_data="max 100000\n")):
+                self.assertEqual(cpu_count(), 8)
+            with patch("builtins.open", side_effect=OSError):
+                self.assertEqual(cpu_count(), 8)
+
+    def test_post_fork_disposes_engine(self):
+        """It should reset the connection pool in a forked worker"""
+        post_fork = load_config()["post_fork"]
+        server = MagicMock()
+        server.app.wsgi.return_value = app
+        with patch("service.models.db") as db_mock:
+            post_fork(server, MagicMock())
+            db_mock.engine.dispose.assert_called_once_with(close=False)
+            db_mock.reset_mock()
+            server.cfg.preload_app = False
+            post_fork(server, MagicMock())
+            db_mock.engine.dispose.assert_not_called()
+
+    def test_metrics_directory(self):
+        """It should give workers a metrics directory and clean up after them"""
+        with tempfile.TemporaryDirectory() as directory:
+            with patch("tempfile.mkdtemp") as mkdtemp:
+                config = load_config(PROMETHEUS_MULTIPROC_DIR=directory)
+                mkdtemp.assert_not_called()
+            stale = os.path.join(directory, "counter_1.db")
+            open(stale, "w", encoding="utf-8").close()  # pylint: disable=consider-using-with
+            with patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory):
+                config["on_starting"](MagicMock())
+                self.assertFalse(os.path.exists(stale))
+                with patch("prometheus_client.multiprocess.mark_process_dead") as mark_process_dead:
+                    config["child_exit"](MagicMock(), MagicMock(pid=42))
+                    mark_process_dead.assert_called_once_with(42)
+
+    def test_profile_signal(self):
+        """It should let SIGUSR2 profile a worker"""
+        config = load_config(PROFILE_SECONDS="5", PROFILE_DIR="/tmp/profiles")
+        with patch("service.common.profiler.install_signal_handler") as install:
+            config["post_worker_init"](MagicMock())
+            install.assert_called_once_with(signal.SIGUSR2, 5.0, "/tmp/profiles")
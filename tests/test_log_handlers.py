@@ -0,0 +1,224 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Log Handlers Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import io
+import json
+import logging
+import queue
+from unittest import TestCase
+from unittest.mock import patch
+from wsgi import app
+from service.common import log_handlers
+
+LOGGER = "tests.log_handlers"
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestLogHandlers(TestCase):
+    """Queued Logging Tests"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.stream = io.StringIO()
+        target = logging.getLogger(LOGGER)
+        target.handlers = [logging.StreamHandler(self.stream)]
+        target.setLevel(logging.INFO)
+        app.config["LOG_QUEUE"] = True
+
+    def tearDown(self):
+        """This runs after each test"""
+        log_queue = app.extensions.pop("log_queue", None)
+        if log_queue is not None:
+            log_queue.stop()
+        app.config.update(LOG_QUEUE=True, LOG_FORMAT="text", LOG_REQUESTS=False, LOG_RATE_LIMIT=10)
+        log_handlers.init_logging(app, "gunicorn.error")
+
+    def _drain(self) -> str:
+        """Writes out the queued records and returns the output"""
+        app.extensions["log_queue"].stop()
+        return self.stream.getvalue()
+
+    def test_queued_logging(self):
+        """It should hand records to the handlers on a background thread"""
+        log_handlers.init_logging(app, LOGGER)
+        (handler,) = app.logger.handlers
+        self.assertIsInstance(handler, log_handlers.NonBlockingQueueHandler)
+        self.assertEqual(logging.getLogger(log_handlers.MODEL_LOGGER).handlers, [handler])
+        app.logger.info("Hello %s", "world")
+        logging.getLogger(log_handlers.MODEL_LOGGER).debug("Processing lookup for id %s ...", 1)
+        output = self._drain()
+        self.assertRegex(output, r"\[INFO\] \[test_log_handlers\] Hello world\n")
+        self.assertIn("Logging handler established", output)
+        self.assertNotIn("Processing lookup", output)
+
+    def test_message_rendered_when_logged(self):
+        """It should render the message before the logged objects change"""
+        log_handlers.init_logging(app, LOGGER)
+        items = ["before"]
+        app.logger.info("Items %s", items)
+        items[0] = "after"
+        self.assertIn("Items ['before']", self._drain())
+
+    def test_exception_logged(self):
+        """It should keep the traceback of a logged exception"""
+        log_handlers.init_logging(app, LOGGER)
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            app.logger.exception("Failed")
+        output = self._drain()
+        self.assertIn("Failed", output)
+        self.assertIn("ValueError: bad value", output)
+
+    def test_full_queue_drops(self):
+        """It should drop records instead of waiting when the queue is full"""
+        handler = log_handlers.NonBlockingQueueHandler(queue.Queue(1))
+        record = logging.makeLogRecord({"msg": "hello"})
+        handler.handle(record)
+        handler.handle(record)
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.qsize(), 1)
+
+    def test_restart_after_fork(self):
+        """It should start a new queue and listener in a forked child"""
+        log_handlers.init_logging(app, LOGGER)
+        log_queue = app.extensions["log_queue"]
+        inherited = log_queue.handler.queue
+        log_queue.restart()
+        self.assertIsNot(log_queue.handler.queue, inherited)
+        app.logger.info("From the child")
+        self.assertIn("From the child", self._drain())
+        log_queue.restart()
+        self.assertIsNone(log_queue.listener)
+
+    def test_direct_logging(self):
+        """It should call the handlers directly with LOG_QUEUE off"""
+        app.config["LOG_QUEUE"] = False
+        log_handlers.init_logging(app, LOGGER)
+        self.assertNotIn("log_queue", app.extensions)
+        self.assertEqual(app.logger.handlers, logging.getLogger(LOGGER).handlers)
+        app.logger.warning("Right away")
+        self.assertIn("[WARNING]", self.stream.getvalue())
+
+
+######################################################################
+#  S T R U C T U R E D   L O G S
+######################################################################
+class TestStructuredLogs(TestCase):
+    """JSON Log Format and Rate Limiting Tests"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.stream = io.StringIO()
+        target = logging.getLogger(LOGGER)
+        target.handlers = [logging.StreamHandler(self.stream)]
+        target.setLevel(logging.INFO)
+        app.config.update(LOG_QUEUE=False, LOG_FORMAT="json", LOG_REQUESTS=True)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config.update(LOG_QUEUE=True, LOG_FORMAT="text", LOG_REQUESTS=False, LOG_RATE_LIMIT=10)
+        log_handlers.init_logging(app, "gunicorn.error")
+
+    def _records(self) -> list:
+        """Returns the JSON records written so far"""
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_request_fields(self):
+        """It should log JSON records with the request id, route and timings"""
+        log_handlers.init_logging(app, LOGGER)
+        resp = self.client.get("/api/wishlists/0", headers={"X-Request-ID": "req-42"})
+        self.assertEqual(resp.headers["X-Request-ID"], "req-42")
+        records = [record for record in self._records() if record.get("request_id") == "req-42"]
+        self.assertEqual(records[0]["message"], "Request for Wishlist with id: 0")
+        finished = records[-1]
+        self.assertEqual(finished["message"], "GET /api/wishlists/0 404")
+        self.assertEqual(finished["status"], 404)
+        self.assertEqual(finished["route"], "wishlist_resource")
+        self.assertEqual(finished["method"], "GET")
+        self.assertEqual(finished["path"], "/api/wishlists/0")
+        self.assertEqual(finished["db_queries"], 1)
+        self.assertGreaterEqual(finished["latency_ms"], finished["db_ms"])
+        self.assertEqual(finished["level"], "INFO")
+        self.assertRegex(finished["time"], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}\+00:00$")
+
+    def test_request_id_generated(self):
+        """It should replace a missing or unusable X-Request-ID"""
+        log_handlers.init_logging(app, LOGGER)
+        first = self.client.get("/health").headers["X-Request-ID"]
+        second = self.client.get("/health", headers={"X-Request-ID": "bad id"}).headers["X-Request-ID"]
+        self.assertRegex(first, r"^[0-9a-f]{32}$")
+        self.assertRegex(second, r"^[0-9a-f]{32}$")
+        self.assertNotEqual(first, second)
+
+    def test_json_exception(self):
+        """It should put the traceback of an exception in its own field"""
+        log_handlers.init_logging(app, LOGGER)
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            app.logger.exception("Failed")
+        (record,) = [record for record in self._records() if record["message"] == "Failed"]
+        self.assertIn("ValueError: bad value", record["exception"])
+        self.assertNotIn("request_id", record)
+
+    def test_rate_limit(self):
+        """It should cut repeated messages and summarize them when the window ends"""
+        app.config.update(LOG_RATE_LIMIT=3, LOG_REQUESTS=False)
+        with patch("service.common.log_handlers.time.monotonic", return_value=1000.0) as clock:
+            log_handlers.init_logging(app, LOGGER)
+            for _ in range(8):
+                self.client.post("/api/wishlists", data="{}", content_type="text/plain")
+            clock.return_value += 10
+            app.logger.info("Next window")
+        records = self._records()
+        invalid = [record for record in records if record["message"].startswith("Invalid Content-Type")]
+        self.assertEqual(len(invalid), 3)
+        summaries = {record["message_key"]: record for record in records if "suppressed" in record}
+        self.assertEqual(set(summaries), {"Invalid Content-Type: %s"})
+        summary = summaries["Invalid Content-Type: %s"]
+        self.assertEqual(summary["suppressed"], 5)
+        self.assertEqual(summary["level"], "ERROR")
+        self.assertEqual(records[-1]["message"], "Next window")
+
+    def test_rate_limit_spares_info(self):
+        """It should let every INFO record through however often it is logged"""
+        app.config.update(LOG_RATE_LIMIT=3, LOG_REQUESTS=True)
+        with patch("service.common.log_handlers.time.monotonic", return_value=1000.0):
+            log_handlers.init_logging(app, LOGGER)
+            for _ in range(20):
+                self.client.get("/api/wishlists/0")
+        records = self._records()
+        requests = [record for record in records if record["message"] == "Request for Wishlist with id: 0"]
+        finished = [record for record in records if record["message"] == "GET /api/wishlists/0 404"]
+        self.assertEqual((len(requests), len(finished)), (20, 20))
+        self.assertFalse([record for record in records if "suppressed" in record])
+
+    def test_rate_limit_off(self):
+        """It should keep every record with LOG_RATE_LIMIT=0"""
+        app.config.update(LOG_RATE_LIMIT=0, LOG_FORMAT="text")
+        log_handlers.init_logging(app, LOGGER)
+        for _ in range(20):
+            app.logger.warning("Same again")
+        self.assertEqual(self.stream.getvalue().count("Same again"), 20)
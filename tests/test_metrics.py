@@ -0,0 +1,91 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Metrics Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import os
+import sys
+import logging
+import subprocess
+import tempfile
+from unittest import TestCase
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+from wsgi import app
+from service.common import status
+
+WORKER_SCRIPT = "from wsgi import app\nfor _ in range(5):\n    app.test_client().get('/health')\n"
+
+
+def sample(name, **labels):
+    """Returns the current value of a metric in this process"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Prometheus Metrics Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+
+    def test_request_metrics(self):
+        """It should count and time requests by endpoint and status"""
+        labels = {"endpoint": "wishlist_collection", "method": "GET", "status": "200"}
+        requests = sample("http_requests_total", **labels)
+        latencies = sample("http_request_duration_seconds_count", **labels)
+        queries = sample("db_queries_total", endpoint="wishlist_collection")
+        self.assertEqual(self.client.get("/api/wishlists").status_code, status.HTTP_200_OK)
+        self.assertEqual(sample("http_requests_total", **labels), requests + 1)
+        self.assertEqual(sample("http_request_duration_seconds_count", **labels), latencies + 1)
+        self.assertGreater(sample("db_queries_total", endpoint="wishlist_collection"), queries)
+        self.assertEqual(sample("http_requests_in_progress", endpoint="wishlist_collection"), 0)
+
+    def test_unmatched_urls(self):
+        """It should not create a time series per unknown URL"""
+        labels = {"endpoint": "unmatched", "method": "GET", "status": "404"}
+        before = sample("http_requests_total", **labels)
+        self.client.get("/no/such/page")
+        self.assertEqual(sample("http_requests_total", **labels), before + 1)
+
+    def test_metrics_endpoint(self):
+        """It should serve the metrics in the Prometheus text format"""
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        self.assertIn(b"http_request_duration_seconds_bucket", resp.data)
+
+    def test_multiprocess_aggregation(self):
+        """It should add up the metrics written by several worker processes"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory, REPOSITORY_BACKEND="memory")
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", WORKER_SCRIPT], env=env, check=True, capture_output=True)
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=directory)
+            labels = {"endpoint": "health_check", "method": "GET", "status": "200"}
+            self.assertEqual(registry.get_sample_value("http_requests_total", labels), 10)
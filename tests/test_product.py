@@ -21,8 +21,10 @@ Test cases for Product Model
 
 import os
 import logging
+from decimal import Decimal
 from unittest import TestCase
 from unittest.mock import patch
+from sqlalchemy import inspect
 from tests.factories import ProductFactory, WishlistFactory
 from wsgi import app
 from service.models import Wishlist, Product, db
@@ -230,3 +232,55 @@ class TestProduct(TestCase):
         # Verify the product still exists (delete failed)
         product_exists = db.session.get(Product, product_id)
         self.assertIsNotNone(product_exists)
+
+    def test_search_after(self):
+        """It should continue a search after the (rank, id) of a result"""
+        wishlist = WishlistFactory(userid="searcher")
+        wishlist.products = [ProductFactory(name=f"Robot {n}", description="robot kit", wishlist=None) for n in range(4)]
+        wishlist.products.append(ProductFactory(name="50%_sale", description="robot", wishlist=None))
+        wishlist.create()
+        results = Product.search("searcher", "robot", 10)
+        self.assertEqual(len(results), 5)
+        rank, product = results[1]
+        self.assertEqual(Product.search("searcher", "robot", 2, after=(rank, product.id)), results[2:4])
+        self.assertEqual(Product.search("searcher", "%", 10), [])
+        self.assertEqual([p.name for _, p in Product.search("searcher", "sale", 10)], ["50%_sale"])
+
+    def test_find_by_wishlist(self):
+        """It should return a Wishlist's Products filtered and sorted"""
+        wishlist = WishlistFactory()
+        wishlist.products = [
+            ProductFactory(name=name, price=Decimal(price), wishlist=None)
+            for name, price in (("Kite", "12.50"), ("Yo-yo", "3.00"), ("Kit car", "40.00"))
+        ]
+        wishlist.create()
+        other = WishlistFactory()
+        other.products = [ProductFactory(name="Kite", wishlist=None)]
+        other.create()
+        products = Product.find_by_wishlist(wishlist.id, "-price", name="kit")
+        self.assertEqual([p.name for p in products], ["Kit car", "Kite"])
+        products = Product.find_by_wishlist(wishlist.id, "price", min_price=Decimal("3"), max_price=Decimal("12.50"))
+        self.assertEqual([p.name for p in products], ["Yo-yo", "Kite"])
+        self.assertEqual(len(Product.find_by_wishlist(wishlist.id, page=2, limit=2)), 1)
+        self.assertRaises(DataValidationError, Product.find_by_wishlist, wishlist.id, "quantity")
+
+    def test_find_sparse_fields(self):
+        """It should load only the columns of a sparse fieldset"""
+        wishlist = WishlistFactory()
+        wishlist.products = [ProductFactory(wishlist=None)]
+        wishlist.create()
+        product_id = wishlist.products[0].id
+        db.session.expunge_all()
+        (product,) = Product.find_by_wishlist(wishlist.id, fields=("id", "price"))
+        self.assertEqual(inspect(product).unloaded & {"description", "note", "name"}, {"description", "note", "name"})
+        self.assertEqual(product.serialize(("price", "id")), {"price": float(product.price), "id": product_id})
+        db.session.expunge_all()
+        product = Product.find(product_id, ("name",))
+        self.assertIn("description", inspect(product).unloaded)
+        self.assertEqual(product.serialize()["id"], product_id)
+
+    def test_check_fields_order(self):
+        """It should return a sparse fieldset in FIELDS order"""
+        self.assertEqual(Product.check_fields(["price", " name", "id", "price"]), ("id", "name", "price"))
+        self.assertEqual(Product.check_fields(["name", "id"]), Product.check_fields(["id", "name"]))
+        self.assertRaises(DataValidationError, Product.check_fields, ["id", "secret"])
@@ -0,0 +1,134 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Profiler Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import glob
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from wsgi import app
+from service.common import status, profiler
+
+TOKEN = "s3cr3t-admin-t0ken"
+PROFILE_URL = "/admin/profile"
+COLLAPSED_LINE = r"(?m)^[^ \n]+( [^ \n]+)* \d+$"
+
+
+def spin(stop):
+    """Keeps a thread busy until stop is set"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestProfiler(TestCase):
+    """Live Profiling Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        app.config["ADMIN_TOKEN"] = TOKEN
+        self.client = app.test_client()
+        self.headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["ADMIN_TOKEN"] = ""
+        app.debug = False
+
+    def test_profile_endpoint(self):
+        """It should sample the stacks of the worker's other threads"""
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            resp = self.client.get(f"{PROFILE_URL}?seconds=0.2&interval_ms=1", headers=self.headers)
+        finally:
+            stop.set()
+            worker.join()
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.content_type, "text/plain; charset=utf-8")
+        body = resp.get_data(as_text=True)
+        self.assertRegex(body, COLLAPSED_LINE)
+        self.assertRegex(body, r"(?m)^busy-worker;.*tests\.test_profiler\.spin\b.* \d+$")
+
+    def test_profile_disabled(self):
+        """It should hide the endpoint while ADMIN_TOKEN is empty"""
+        app.config["ADMIN_TOKEN"] = ""
+        resp = self.client.get(PROFILE_URL, headers=self.headers)
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_profile_unauthorized(self):
+        """It should require the admin token"""
+        resp = self.client.get(PROFILE_URL)
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+        resp = self.client.get(PROFILE_URL, headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_bad_duration(self):
+        """It should reject profiles that are too long or empty"""
+        for seconds in ("0", "-1", "3600"):
+            resp = self.client.get(f"{PROFILE_URL}?seconds={seconds}", headers=self.headers)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_profile_request(self):
+        """It should return the call stacks of a request with ?profile=1 when debugging"""
+        app.debug = True
+        resp = self.client.get("/api/wishlists?profile=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["X-Profiled-Status"], "200")
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        body = resp.get_data(as_text=True)
+        self.assertRegex(body, COLLAPSED_LINE)
+        self.assertIn("service.models.wishlist.Wishlist.find_page", body)
+
+    def test_profile_request_needs_debug(self):
+        """It should ignore ?profile=1 outside debug mode"""
+        resp = self.client.get("/api/wishlists?profile=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn("X-Profiled-Status", resp.headers)
+        self.assertIsInstance(resp.get_json(), list)
+
+    def test_signal_handler(self):
+        """It should profile in the background and write a file on a signal"""
+        previous = signal.getsignal(signal.SIGUSR2)
+        with tempfile.TemporaryDirectory() as folder:
+            try:
+                profiler.install_signal_handler(signal.SIGUSR2, 0.05, folder)
+                os.kill(os.getpid(), signal.SIGUSR2)
+                for _ in range(100):
+                    if glob.glob(os.path.join(folder, "*.collapsed")):
+                        break
+                    time.sleep(0.05)
+            finally:
+                signal.signal(signal.SIGUSR2, previous)
+            (path,) = glob.glob(os.path.join(folder, f"{os.getpid()}-*.collapsed"))
+            with open(path, encoding="utf-8") as file:
+                self.assertRegex(file.read(), r"(?m)^MainThread;.* \d+$")
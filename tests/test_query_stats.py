@@ -0,0 +1,82 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Query Statistics Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import logging
+from unittest import TestCase
+from wsgi import app
+from service.common import status
+from service.models import db, Wishlist
+from .factories import WishlistFactory
+
+BASE_URL = "/api/wishlists"
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestQueryStats(TestCase):
+    """Per-request Query Statistics Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        app.config["TESTING"] = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["TESTING"] = True
+        app.config["N_PLUS_ONE_THRESHOLD"] = 5
+
+    def test_headers(self):
+        """It should report the SQL statements of a request in headers"""
+        resp = self.client.get(f"{BASE_URL}/0")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(resp.headers["X-DB-Queries"], "1")
+        self.assertRegex(resp.headers["Server-Timing"], r'^db;dur=[0-9.]+;desc="1 queries"$')
+
+    def test_no_headers_in_production(self):
+        """It should leave the headers out unless debugging or testing"""
+        app.config["TESTING"] = False
+        resp = self.client.get(f"{BASE_URL}/0")
+        self.assertNotIn("X-DB-Queries", resp.headers)
+        self.assertNotIn("Server-Timing", resp.headers)
+
+    def test_n_plus_one_warning(self):
+        """It should warn about a statement repeated within one request"""
+        app.config["N_PLUS_ONE_THRESHOLD"] = 2
+        with app.app_context():
+            db.session.query(Wishlist).delete()
+            db.session.commit()
+        for _ in range(2):
+            self.client.post(BASE_URL, json=WishlistFactory().serialize())
+        with self.assertLogs(app.logger, logging.WARNING) as logs:
+            with app.test_request_context(BASE_URL):
+                app.preprocess_request()
+                for wishlist in Wishlist.all():
+                    db.session.expire(wishlist)
+                    _ = wishlist.products
+                app.process_response(app.response_class())
+        self.assertIn("Possible N+1 query", logs.output[0])
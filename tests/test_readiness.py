@@ -0,0 +1,155 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Readiness Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import logging
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool, StaticPool
+from wsgi import app
+from service.common import status
+from service.common.readiness import Readiness, MemoryReadiness
+
+BROKEN_URI = "sqlite:////nonexistent/directory/wishlists.db"
+
+
+def settle(readiness):
+    """Starts the probe thread of readiness and waits for its first result
+
+    A shared connection has no thread and is pinged in each check instead.
+    """
+    readiness.start()
+    deadline = time.monotonic() + 5
+    while not readiness.shared and readiness._result is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return readiness
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestReadiness(TestCase):
+    """Readiness Endpoint Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+        logging.getLogger("flask.app").setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        self.readiness = app.extensions["readiness"]
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.extensions["readiness"] = self.readiness
+
+    def test_ready(self):
+        """It should report ready when the database answers"""
+        settle(self.readiness)
+        resp = self.client.get("/ready")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["status"], "ready")
+        self.assertTrue(data["checks"]["database"]["ok"])
+        self.assertGreaterEqual(data["checks"]["database"]["latency_ms"], 0)
+
+    def test_database_down(self):
+        """It should report not ready when the database cannot be reached"""
+        app.extensions["readiness"] = settle(Readiness(create_engine(BROKEN_URI)))
+        resp = self.client.get("/ready")
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        data = resp.get_json()
+        self.assertEqual(data["status"], "not ready")
+        self.assertFalse(data["checks"]["database"]["ok"])
+        self.assertIn("OperationalError", data["checks"]["database"]["detail"])
+
+    def test_pool_saturated(self):
+        """It should report not ready when the pool has no connections left"""
+        engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0)
+        readiness = Readiness(engine)
+        app.extensions["readiness"] = readiness
+        with engine.connect():
+            resp = self.client.get("/ready")
+            self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            checks = resp.get_json()["checks"]
+            self.assertEqual(checks["database"]["detail"], "connection pool saturated")
+            self.assertEqual(checks["pool"], {"checked_out": 1, "capacity": 1, "saturation": 1.0})
+        readiness.probe()
+        self.assertEqual(self.client.get("/ready").status_code, status.HTTP_200_OK)
+        engine.dispose()
+
+    def test_cached(self):
+        """It should answer from the cached probe result without touching the database"""
+        readiness = settle(Readiness(create_engine("sqlite://")))
+        self.assertTrue(readiness.check()[0])
+        with patch.object(readiness.engine, "connect", side_effect=AssertionError("probe ran")):
+            for _ in range(10):
+                self.assertTrue(readiness.check()[0])
+
+    def test_stale_result(self):
+        """It should fail when the probe has not reported for three intervals"""
+        readiness = Readiness(create_engine("sqlite://"), interval=60)
+        readiness.check()
+        readiness._store(True, "ok", 1.0)
+        with patch("service.common.readiness.time.monotonic", return_value=time.monotonic() + 181):
+            ready, checks = readiness.check()
+        self.assertFalse(ready)
+        self.assertRegex(checks["database"]["detail"], r"^probe result is \d+s old$")
+
+    def test_first_probe_pending(self):
+        """It should not wait for the first probe of a database that is slow to connect"""
+        readiness = Readiness(create_engine("sqlite://"))
+        with patch.object(readiness.engine, "connect", side_effect=lambda: time.sleep(1)):
+            start = time.monotonic()
+            ready, checks = readiness.check()
+            self.assertLess(time.monotonic() - start, 0.5)
+            readiness.stop()
+        self.assertFalse(ready)
+        self.assertEqual(checks["database"]["detail"], "first probe pending")
+
+    def test_background_refresh(self):
+        """It should refresh the result on a background thread"""
+        readiness = Readiness(create_engine("sqlite://"), interval=0.02)
+        readiness.check()
+        with patch.object(readiness, "probe", wraps=readiness.probe) as probe:
+            time.sleep(0.2)
+            readiness.stop()
+            self.assertGreater(probe.call_count, 1)
+
+    def test_shared_connection(self):
+        """It should ping a StaticPool connection in the request instead of from a thread"""
+        readiness = Readiness(create_engine("sqlite://", poolclass=StaticPool))
+        with patch("service.common.readiness.threading.Thread") as thread:
+            self.assertTrue(readiness.check()[0])
+            self.assertTrue(readiness.check()[0])
+        thread.assert_not_called()
+        with patch.object(readiness.engine, "connect", side_effect=RuntimeError("gone")):
+            self.assertFalse(readiness.check()[0])
+
+    def test_memory_backend(self):
+        """It should always be ready without a database"""
+        ready, checks = MemoryReadiness().check()
+        self.assertTrue(ready)
+        self.assertEqual(checks["repository"]["detail"], "memory")
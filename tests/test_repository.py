@@ -0,0 +1,126 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+In-memory Repository Test Suite
+
+Runs the REST API tests of test_routes against the in-memory repository
+and checks its indexes and constraints directly.
+"""
+
+# pylint: disable=duplicate-code
+import logging
+import threading
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import patch
+from wsgi import app
+from service.models import Wishlist, Product, MemoryRepository, DataValidationError
+from tests import test_routes
+from .factories import WishlistFactory, ProductFactory
+
+
+######################################################################
+#  R E S T   A P I   O N   T H E   M E M O R Y   B A C K E N D
+######################################################################
+class TestWishlistServiceInMemory(test_routes.TestWishlistService):
+    """REST API Server Tests on the in-memory repository"""
+
+    def setUp(self):
+        """Swaps in an empty in-memory repository"""
+        self.saved_repository = app.extensions["repository"]
+        app.extensions["repository"] = MemoryRepository()
+        super().setUp()
+
+    def tearDown(self):
+        """Puts the database repository back"""
+        super().tearDown()
+        app.extensions["repository"] = self.saved_repository
+
+    def test_delete_product_database_integrity(self):
+        """It should report a failed delete as a DataValidationError"""
+        wishlist = WishlistFactory()
+        wishlist.products.append(ProductFactory())
+        wishlist.create()
+        with patch.object(MemoryRepository, "_remove", side_effect=Exception("storage error")):
+            with self.assertRaises(DataValidationError):
+                wishlist.products[0].delete()
+
+
+######################################################################
+#  M E M O R Y   R E P O S I T O R Y   T E S T   C A S E S
+######################################################################
+class TestMemoryRepository(TestCase):
+    """In-memory Repository Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.repository = MemoryRepository()
+
+    def test_indexes_follow_updates(self):
+        """It should find Wishlists by name and userid after they change"""
+        wishlist = WishlistFactory(id=None, name="old", userid="alice")
+        self.repository.add(wishlist)
+        self.assertEqual(self.repository.find_by(Wishlist, "name", "old"), [wishlist])
+        wishlist.name = "new"
+        self.repository.save(wishlist)
+        self.assertEqual(self.repository.find_by(Wishlist, "name", "old"), [])
+        self.assertEqual(self.repository.find_by(Wishlist, "name", "new"), [wishlist])
+        self.assertEqual(self.repository.find_by(Wishlist, "userid", "alice"), [wishlist])
+        self.assertEqual(self.repository.page(Wishlist, 0, 10, name="new", userid="bob"), [])
+
+    def test_children_and_cascade(self):
+        """It should store products with their Wishlist and delete them with it"""
+        wishlist = WishlistFactory(id=None)
+        wishlist.products.append(ProductFactory(id=None, wishlist=None, price=12.5))
+        self.repository.add(wishlist)
+        product = wishlist.products[0]
+        self.assertEqual(product.wishlist_id, wishlist.id)
+        self.assertEqual(product.price, Decimal("12.50"))
+        self.assertIs(self.repository.get(Product, product.id), product)
+        self.repository.remove(wishlist)
+        self.assertIsNone(self.repository.get(Product, product.id))
+        self.assertEqual(self.repository.all(Wishlist), [])
+
+    def test_constraints(self):
+        """It should reject rows the database would reject"""
+        with self.assertRaises(ValueError):
+            self.repository.add(WishlistFactory(id=None, userid=None))
+        with self.assertRaises(ValueError):
+            self.repository.add(WishlistFactory(id=None, userid="x" * 17))
+        with self.assertRaises(ValueError):
+            self.repository.add(ProductFactory(id=None, wishlist=None, wishlist_id=42))
+
+    def test_concurrent_adds(self):
+        """It should give every Wishlist added from many threads its own id"""
+
+        def add_many():
+            for _ in range(100):
+                self.repository.add(WishlistFactory(id=None, name="same"))
+
+        threads = [threading.Thread(target=add_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [wishlist.id for wishlist in self.repository.all(Wishlist)]
+        self.assertEqual(ids, list(range(1, 801)))
+        self.assertEqual(len(self.repository.page(Wishlist, 790, 50, name="same")), 10)
@@ -26,9 +26,11 @@ import logging
 from decimal import Decimal
 from unittest import TestCase
 from unittest.mock import patch
+import msgpack
 from wsgi import app
 from service.common import status
 from service.models import db, Wishlist, DataValidationError
+from service.models.repository import select_page
 from .factories import WishlistFactory, ProductFactory
 
 BASE_URL = "api/wishlists"
@@ -91,6 +93,13 @@ class TestWishlistService(TestCase):
             wishlists.append(wishlist)
         return wishlists
 
+    def _assert_max_queries(self, resp, maximum):
+        """Checks that a request ran at most maximum SQL statements"""
+        queries = int(resp.headers["X-DB-Queries"])
+        self.assertLessEqual(
+            queries, maximum, f"{resp.request.method} {resp.request.path} ran {queries} SQL statements"
+        )
+
     def _create_products(self, wishlist_id, count):
         """Factory method to create products in bulk for a specific wishlist"""
         products = []
@@ -610,6 +619,161 @@ class TestWishlistService(TestCase):
         data = resp.get_json()
         self.assertEqual(len(data), 0)  # Empty list for non-existent page
 
+    def test_wishlist_totals(self):
+        """It should keep the product count, total value and purchased count of a Wishlist"""
+        wishlist = WishlistFactory()
+        wishlist.products = [ProductFactory(price=Decimal("10.00"), quantity=2, purchased=True)]
+        resp = self.client.post(BASE_URL, json=wishlist.serialize())
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual((data["product_count"], data["total_value"], data["purchased_count"]), (1, 20.0, 1))
+        wishlist_url = f"{BASE_URL}/{data['id']}"
+
+        def totals():
+            data = self.client.get(wishlist_url).get_json()
+            return data["product_count"], data["total_value"], data["purchased_count"]
+
+        new_product = ProductFactory(price=Decimal("5.25"), quantity=1).serialize()
+        product = self.client.post(f"{wishlist_url}/products", json=new_product).get_json()
+        product_url = f"{wishlist_url}/products/{product['id']}"
+        self.assertEqual(totals(), (2, 25.25, 1))
+        self.client.patch(product_url, json={"purchased": True, "quantity": 4})
+        self.assertEqual(totals(), (2, 41.0, 2))
+        self.client.patch(product_url, json={"note": "no change"})
+        self.assertEqual(totals(), (2, 41.0, 2))
+        product.update(price=1.5, quantity=2, purchased=False)
+        self.client.put(product_url, json=product)
+        self.assertEqual(totals(), (2, 23.0, 1))
+        self.client.patch(product_url, json={"quantity": 0})
+        self.assertEqual(totals(), (1, 20.0, 1))
+        first_url = f"{wishlist_url}/products/{data['products'][0]['id']}"
+        self.client.delete(first_url)
+        self.assertEqual(totals(), (0, 0.0, 0))
+
+    def test_sort_wishlists(self):
+        """It should sort Wishlists by their totals"""
+        wishlists = self._create_wishlists(3)
+        for count, wishlist in zip((2, 0, 1), wishlists):
+            self._create_products(wishlist.id, count)
+        resp = self.client.get(BASE_URL, query_string="sort=-product_count")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([w["product_count"] for w in resp.get_json()], [2, 1, 0])
+        resp = self.client.get(BASE_URL, query_string="sort=product_count&limit=2&page=2")
+        self.assertEqual([w["id"] for w in resp.get_json()], [wishlists[0].id])
+        data = self.client.get(BASE_URL, query_string="sort=total_value").get_json()
+        values = [w["total_value"] for w in data]
+        self.assertEqual(values, sorted(values))
+        data = self.client.get(BASE_URL, query_string="sort=-id").get_json()
+        self.assertEqual([w["id"] for w in data], [w.id for w in reversed(wishlists)])
+
+    def test_sort_wishlists_invalid(self):
+        """It should reject a sort on an unknown column or with extra dashes"""
+        resp = self.client.get(BASE_URL, query_string="sort=-userid")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Invalid sort", resp.get_json()["message"])
+        statements = select_page.cache_info().currsize
+        for sort in ("--name", "-----id"):
+            resp = self.client.get(BASE_URL, query_string={"sort": sort})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(select_page.cache_info().currsize, statements)
+
+    def test_list_wishlists_by_userid(self):
+        """It should List the Wishlists of one user, optionally by name"""
+        for userid, name in (("alice", "toys"), ("bob", "toys"), ("alice", "books"), ("alice", "toys")):
+            self.client.post(BASE_URL, json={"name": name, "userid": userid})
+        resp = self.client.get(BASE_URL, query_string="userid=alice")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([w["name"] for w in resp.get_json()], ["toys", "books", "toys"])
+        resp = self.client.get(BASE_URL, query_string="userid=alice&name=toys")
+        self.assertEqual([(w["userid"], w["name"]) for w in resp.get_json()], [("alice", "toys")] * 2)
+        self.assertEqual(self.client.get(BASE_URL, query_string="userid=carol").get_json(), [])
+
+    def test_list_wishlists_by_cursor(self):
+        """It should page through Wishlists with X-Next-Cursor"""
+        wishlists = self._create_wishlists(5)
+        for count, wishlist in zip((1, 0, 2, 1, 0), wishlists):
+            self._create_products(wishlist.id, count)
+        for sort in ("id", "-id", "-product_count", "total_value", "name"):
+            expected = [w["id"] for w in self.client.get(BASE_URL, query_string={"sort": sort}).get_json()]
+            seen, query = [], {"sort": sort, "limit": 2}
+            while True:
+                resp = self.client.get(BASE_URL, query_string=query)
+                self.assertEqual(resp.status_code, status.HTTP_200_OK)
+                seen += [w["id"] for w in resp.get_json()]
+                if "X-Next-Cursor" not in resp.headers:
+                    break
+                query["cursor"] = resp.headers["X-Next-Cursor"]
+            self.assertEqual(seen, expected, sort)
+
+    def test_list_wishlists_by_cursor_null_names(self):
+        """It should page through Wishlists sorted by name when some names are NULL"""
+        for name in (None, "b", None, "a", "c"):
+            self.client.post(BASE_URL, json={"name": name, "userid": "nulls"})
+        for sort in ("name", "-name"):
+            expected = [w["id"] for w in self.client.get(BASE_URL, query_string={"sort": sort, "userid": "nulls"}).get_json()]
+            self.assertEqual(len(expected), 5)
+            seen, query = [], {"sort": sort, "userid": "nulls", "limit": 1}
+            while True:
+                resp = self.client.get(BASE_URL, query_string=query)
+                self.assertEqual(resp.status_code, status.HTTP_200_OK)
+                seen += [w["id"] for w in resp.get_json()]
+                if "X-Next-Cursor" not in resp.headers:
+                    break
+                query["cursor"] = resp.headers["X-Next-Cursor"]
+            self.assertEqual(seen, expected, sort)
+        names = [w["name"] for w in self.client.get(BASE_URL, query_string={"sort": "name", "userid": "nulls"}).get_json()]
+        self.assertEqual(names, [None, None, "a", "b", "c"])
+
+    def test_list_wishlists_bad_cursor(self):
+        """It should reject a cursor that does not fit the sort"""
+        self._create_wishlists(2)
+        cursor = self.client.get(BASE_URL, query_string="limit=1").headers["X-Next-Cursor"]
+        for query in ({"cursor": "????"}, {"cursor": cursor, "sort": "name"}, {"cursor": cursor, "sort": "userid"}):
+            resp = self.client.get(BASE_URL, query_string=query)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    def _create_searchable(self, userid, products):
+        """Creates a Wishlist of userid with (name, description) Products"""
+        resp = self.client.post(BASE_URL, json={"name": "search", "userid": userid})
+        wishlist_id = resp.get_json()["id"]
+        for name, description in products:
+            product = ProductFactory(name=name, description=description).serialize()
+            resp = self.client.post(f"{BASE_URL}/{wishlist_id}/products", json=product)
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    def test_search_products(self):
+        """It should search the Products of all of a user's Wishlists, best matches first"""
+        self._create_searchable("alice", [("Lego castle", "A big lego set"), ("Doll", "Not a brick toy")])
+        self._create_searchable("alice", [("Lego car", "Red"), ("Bricks", "Works with Lego")])
+        self._create_searchable("bob", [("Lego train", "Lego for bob")])
+
+        found, cursor = [], None
+        while True:
+            query = {"userid": "alice", "q": "lego", "limit": 2, **({"cursor": cursor} if cursor else {})}
+            resp = self.client.get(f"{BASE_URL}/products", query_string=query)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            found += resp.get_json()
+            cursor = resp.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(found[0]["name"], "Lego castle")
+        self.assertEqual(sorted(product["name"] for product in found), ["Bricks", "Lego car", "Lego castle"])
+        ranks = [product["rank"] for product in found]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+        resp = self.client.get(f"{BASE_URL}/products", query_string={"userid": "alice", "q": "LEGO car"})
+        self.assertEqual([product["name"] for product in resp.get_json()], ["Lego car"])
+        resp = self.client.get(f"{BASE_URL}/products", query_string={"userid": "carol", "q": "lego"})
+        self.assertEqual(resp.get_json(), [])
+
+    def test_search_products_bad_request(self):
+        """It should not search without words or with an invalid cursor"""
+        for query in ({"userid": "alice"}, {"userid": "alice", "q": " !? "}, {"q": "lego"},
+                      {"userid": "alice", "q": "lego", "cursor": "not-a-cursor"},
+                      {"userid": "alice", "q": "lego", "cursor": "WyJhIiwxXQ"}):
+            resp = self.client.get(f"{BASE_URL}/products", query_string=query)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, query)
+
     def test_get_wishlists_invalid_pagination(self):
         """It should handle invalid pagination parameters gracefully"""
         # Create some wishlists
@@ -665,6 +829,40 @@ class TestWishlistService(TestCase):
             with self.assertRaises(DataValidationError):
                 product.delete()
 
+    def test_msgpack_round_trip(self):
+        """It should accept and return MessagePack bodies with the JSON schemas"""
+        headers = {"Accept": "application/msgpack"}
+        wishlist = WishlistFactory()
+        resp = self.client.post(
+            BASE_URL, data=msgpack.packb(wishlist.serialize()), content_type="application/msgpack", headers=headers
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.content_type, "application/msgpack")
+        created = msgpack.unpackb(resp.data)
+        self.assertEqual(created["name"], wishlist.name)
+
+        product = ProductFactory().serialize()
+        resp = self.client.post(
+            f"{BASE_URL}/{created['id']}/products", data=msgpack.packb(product), content_type="application/msgpack"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.content_type, "application/json")
+
+        resp = self.client.get(f"{BASE_URL}/{created['id']}", headers=headers)
+        self.assertEqual(resp.content_type, "application/msgpack")
+        self.assertEqual(msgpack.unpackb(resp.data), self.client.get(f"{BASE_URL}/{created['id']}").get_json())
+        resp = self.client.get(f"{BASE_URL}/0", headers=headers)
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("message", msgpack.unpackb(resp.data))
+
+    def test_msgpack_bad_body(self):
+        """It should reject MessagePack bodies that cannot be decoded"""
+        resp = self.client.post(BASE_URL, data=b"\xc1", content_type="application/msgpack")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post(BASE_URL, data=b"{}", content_type="application/x-msgpack")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertIn("application/json or application/msgpack", resp.get_json()["message"])
+
     def test_check_content_type_missing(self):
         """Test missing Content-Type header (lines 414-415)"""
         # Create a request without a Content-Type header
@@ -1426,6 +1624,161 @@ class TestWishlistService(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("Invalid max_price", resp.get_data(as_text=True))
 
+    def test_sort_products(self):
+        """It should sort, filter and page Products in the database"""
+        wishlist = self._create_wishlists(1)[0]
+        url = f"/api/wishlists/{wishlist.id}/products"
+        for name, price in (("Cherry", "20.00"), ("apple", "5.00"), ("Banana", "20.00"), ("100%_juice", "8.00")):
+            product = ProductFactory(name=name, price=Decimal(price))
+            self.client.post(url, json=product.serialize(), content_type="application/json")
+
+        def names(**query):
+            resp = self.client.get(url, query_string=query)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            return [product["name"] for product in resp.get_json()]
+
+        self.assertEqual(names(), ["Cherry", "apple", "Banana", "100%_juice"])
+        self.assertEqual(names(sort="-created"), ["100%_juice", "Banana", "apple", "Cherry"])
+        self.assertEqual(names(sort="price"), ["apple", "100%_juice", "Cherry", "Banana"])
+        self.assertEqual(names(sort="-price"), ["Cherry", "Banana", "100%_juice", "apple"])
+        self.assertEqual(names(sort="price", min_price="6", limit=2, page=2), ["Banana"])
+        self.assertEqual(names(sort="price", product_name="AN"), ["Banana"])
+        self.assertEqual(names(product_name="%_"), ["100%_juice"])
+        self.assertEqual(names(sort="-created", limit=1), ["100%_juice"])
+        names_asc = names(sort="name")
+        self.assertEqual(set(names_asc), {"Cherry", "apple", "Banana", "100%_juice"})
+        self.assertEqual(names(sort="-name"), names_asc[::-1])
+        for sort in ("color", "--price"):
+            resp = self.client.get(url, query_string={"sort": sort})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get("/api/wishlists/0/products", query_string={"sort": "price"})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_price_stats(self):
+        """It should aggregate the prices of a Wishlist's and a user's Products"""
+        ids = []
+        for userid, prices in (("budget", ("10", "20", "30")), ("budget", ("40", "100.5")), ("other", ("999",))):
+            wishlist_id = self.client.post("/api/wishlists", json={"name": "gifts", "userid": userid}).get_json()["id"]
+            for price in prices:
+                product = ProductFactory(price=Decimal(price))
+                self.client.post(f"/api/wishlists/{wishlist_id}/products", json=product.serialize())
+            ids.append(wishlist_id)
+
+        resp = self.client.get("/api/wishlists/products/stats", query_string={"userid": "budget", "buckets": 3})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        stats = resp.get_json()
+        self.assertEqual((stats["count"], stats["min"], stats["max"], stats["avg"]), (5, 10.0, 100.5, 40.1))
+        self.assertEqual(stats["percentiles"], {"p25": 20.0, "p50": 30.0, "p75": 40.0, "p90": 76.3})
+        self.assertEqual([bucket["count"] for bucket in stats["histogram"]], [4, 0, 1])
+        self.assertEqual(stats["histogram"][0], {"min": 10.0, "max": 40.17, "count": 4})
+        self.assertEqual(stats["histogram"][-1]["max"], 100.5)
+
+        resp = self.client.get(f"/api/wishlists/{ids[0]}/products/stats", query_string={"buckets": 0})
+        stats = resp.get_json()
+        self.assertEqual((stats["count"], stats["avg"], stats["percentiles"]["p50"]), (3, 20.0, 20.0))
+        self.assertEqual(stats["histogram"], [{"min": 10.0, "max": 30.0, "count": 3}])
+
+        resp = self.client.get("/api/wishlists/products/stats", query_string={"userid": "nobody"})
+        self.assertEqual(resp.get_json()["count"], 0)
+        self.assertEqual(resp.get_json()["histogram"], [])
+        resp = self.client.get("/api/wishlists/0/products/stats")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.get("/api/wishlists/products/stats")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_sparse_fields(self):
+        """It should return only the Product fields asked for"""
+        wishlist = self._create_wishlists(1)[0]
+        url = f"/api/wishlists/{wishlist.id}/products"
+        for _ in range(2):
+            self.client.post(url, json=ProductFactory().serialize())
+        resp = self.client.get(url, query_string={"fields": "id,name, price", "sort": "-price"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        products = resp.get_json()
+        self.assertEqual([set(product) for product in products], [{"id", "name", "price"}] * 2)
+        self.assertGreaterEqual(products[0]["price"], products[1]["price"])
+        statements = select_page.cache_info().currsize
+        resp = self.client.get(url, query_string={"fields": "price,name,id", "sort": "-price"})
+        self.assertEqual(resp.get_json(), products)
+        self.assertEqual(select_page.cache_info().currsize, statements)
+
+        resp = self.client.get(f"{url}/{products[0]['id']}", query_string={"fields": "name,is_gift"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(resp.get_json()), {"name", "is_gift"})
+        resp = self.client.get(f"{url}/{products[0]['id']}")
+        self.assertEqual(len(resp.get_json()), 9)
+
+        for bad in ("id,secret", ","):
+            resp = self.client.get(url, query_string={"fields": bad})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(f"/api/wishlists/0/products/{products[0]['id']}", query_string={"fields": "id"})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_share_wishlist(self):
+        """It should serve a shared Wishlist publicly without its owner"""
+        wishlist = self._create_wishlists(1)[0]
+        self._create_products(wishlist.id, 2)
+        resp = self.client.post(f"/api/wishlists/{wishlist.id}/share")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        share = resp.get_json()
+        self.assertTrue(share["url"].endswith(f"/api/shared/{share['token']}"))
+        resp = self.client.post(f"/api/wishlists/{wishlist.id}/share")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.get_json(), share)
+
+        resp = self.client.get(f"/api/shared/{share['token']}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["Cache-Control"], "public, max-age=60")
+        self.assertIn("Last-Modified", resp.headers)
+        data = resp.get_json()
+        self.assertEqual(data["name"], wishlist.name)
+        self.assertEqual(data["product_count"], 2)
+        self.assertNotIn("userid", data)
+        self.assertNotIn("wishlist_id", data["products"][0])
+
+        resp = self.client.post("/api/wishlists/0/share")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.get("/api/shared/unknown")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shared_snapshot_revalidation(self):
+        """It should answer conditional requests until the Wishlist changes"""
+        wishlist = self._create_wishlists(1)[0]
+        url = f"/api/shared/{self.client.post(f'/api/wishlists/{wishlist.id}/share').get_json()['token']}"
+        snapshots = app.extensions["snapshots"]
+        first = self.client.get(url)
+        hits = snapshots.hits
+        etag = first.headers["ETag"]
+        for headers in ({"If-None-Match": etag}, {"If-None-Match": f"W/{etag}"},
+                        {"If-Modified-Since": first.headers["Last-Modified"]}):
+            resp = self.client.get(url, headers=headers)
+            self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(resp.data, b"")
+        self.assertEqual(snapshots.hits, hits + 3)
+
+        self._create_products(wishlist.id, 1)
+        resp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        self.assertEqual(resp.get_json()["product_count"], 1)
+        etag = resp.headers["ETag"]
+        self.client.put(f"/api/wishlists/{wishlist.id}", json={"name": "renamed"})
+        resp = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(resp.get_json()["name"], "renamed")
+
+    def test_unshare_wishlist(self):
+        """It should stop serving the snapshot once sharing is revoked"""
+        wishlist = self._create_wishlists(1)[0]
+        token = self.client.post(f"/api/wishlists/{wishlist.id}/share").get_json()["token"]
+        resp = self.client.delete(f"/api/wishlists/{wishlist.id}/share")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.client.get(f"/api/shared/{token}")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        resp = self.client.delete("/api/wishlists/0/share")
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        resp = self.client.post(f"/api/wishlists/{wishlist.id}/share")
+        self.assertNotEqual(resp.get_json()["token"], token)
+
     def test_put_product_wrong_wishlist(self):
         """It should return 403 if product does not belong to the specified wishlist"""
         wishlist1 = self._create_wishlists(1)[0]
@@ -1577,3 +1930,31 @@ class TestWishlistService(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn(f"Product with id '{non_existent_product_id}' not found", response.get_data(as_text=True))
+
+    ######################################################################
+    #  Q U E R Y   C O U N T S
+    ######################################################################
+
+    def test_query_counts(self):
+        """It should keep the number of SQL statements per route bounded"""
+        wishlists = self._create_wishlists(5)
+        for wishlist in wishlists:
+            self._create_products(wishlist.id, 2)
+        wishlist_url = f"/api/wishlists/{wishlists[0].id}"
+        product = self.client.get(f"{wishlist_url}/products").get_json()[0]
+        product_url = f"{wishlist_url}/products/{product['id']}"
+        new_product = ProductFactory().serialize()
+
+        # Lists must not load the products of each Wishlist separately (N+1)
+        self._assert_max_queries(self.client.get("/api/wishlists"), 2)
+        self._assert_max_queries(self.client.get("/api/wishlists", query_string=f"name={wishlists[0].name}"), 2)
+        self._assert_max_queries(self.client.get(wishlist_url), 2)
+        self._assert_max_queries(self.client.put(wishlist_url, json={"name": "renamed"}), 4)
+        self._assert_max_queries(self.client.get(f"{wishlist_url}/products"), 2)
+        # Changing a product also updates the Wishlist totals and version (one UPDATE)
+        self._assert_max_queries(self.client.post(f"{wishlist_url}/products", json=new_product), 6)
+        self._assert_max_queries(self.client.get(product_url), 2)
+        self._assert_max_queries(self.client.patch(product_url, json={"note": "gift"}), 5)
+        self._assert_max_queries(self.client.put(product_url, json=product), 5)
+        self._assert_max_queries(self.client.delete(product_url), 5)
+        self._assert_max_queries(self.client.delete(wishlist_url), 4)
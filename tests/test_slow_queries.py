@@ -0,0 +1,123 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Slow Query Log Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock
+from sqlalchemy import text
+from wsgi import app
+from service.common import slow_queries
+from service.models import db, Wishlist
+from .factories import WishlistFactory
+
+BASE_URL = "/api/wishlists"
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestSlowQueries(TestCase):
+    """Slow Query Log Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        # every statement counts as slow, and none is rate limited
+        app.config["SLOW_QUERY_MS"] = 0.0001
+        self.filters, slow_queries.logger.filters = slow_queries.logger.filters, []
+
+    def tearDown(self):
+        """This runs after each test"""
+        app.config["SLOW_QUERY_MS"] = 200
+        slow_queries.logger.filters = self.filters
+        app.config["SLOW_QUERY_EXPLAIN"] = False
+        app.debug = False
+
+    def _slow_queries(self, method, url, **kwargs) -> list:
+        """Returns the slow query messages logged while sending a request"""
+        with self.assertLogs(slow_queries.logger, logging.WARNING) as logs:
+            method(url, **kwargs)
+        return [record.getMessage() for record in logs.records if record.msg.startswith("Slow query")]
+
+    def test_slow_query_logged(self):
+        """It should log slow statements with their route and parameter shapes"""
+        wishlist = WishlistFactory(name="a secret name")
+        self.client.post(BASE_URL, json=wishlist.serialize())
+        message = self._slow_queries(self.client.get, f"{BASE_URL}?name=a secret name")[0]
+        self.assertRegex(message, r"^Slow query \([0-9.]+ ms\) in wishlist_collection: SELECT ")
+        self.assertRegex(message, r"params=.*'str\[13\]'")
+        self.assertNotIn("a secret name", message)
+        self.assertNotIn("\n", message)
+
+    def test_fast_queries_not_logged(self):
+        """It should stay quiet below the threshold or when disabled"""
+        for threshold in (60_000, 0):
+            app.config["SLOW_QUERY_MS"] = threshold
+            with self.assertNoLogs(slow_queries.logger, logging.WARNING):
+                self.client.get(f"{BASE_URL}/0")
+
+    def test_explain_in_debug(self):
+        """It should add the query plan when debugging"""
+        app.debug = True
+        (message,) = self._slow_queries(self.client.get, f"{BASE_URL}/0")
+        plan = message.split("\n", 1)[1]
+        with app.app_context():
+            dialect = db.engine.dialect.name
+        if dialect == "postgresql":
+            self.assertIn("actual time=", plan)
+            self.assertIn("Execution Time", plan)
+        else:
+            self.assertIn("SEARCH", plan)
+
+    def test_explain_writes_once(self):
+        """It should only plan statements that change data"""
+        app.config["SLOW_QUERY_EXPLAIN"] = True
+        with app.app_context():
+            db.session.query(Wishlist).delete()
+            db.session.commit()
+        messages = self._slow_queries(self.client.post, BASE_URL, json=WishlistFactory().serialize())
+        (insert,) = [message for message in messages if "INSERT INTO wishlist " in message]
+        self.assertNotIn("Execution Time", insert)
+        with app.app_context():
+            self.assertEqual(len(Wishlist.all()), 1)
+
+    def test_explain_failure(self):
+        """It should report a plan that cannot be made instead of failing"""
+        with app.app_context():
+            with db.engine.connect() as conn:
+                plan = slow_queries.explain(conn, "SELECT * FROM no_such_table", {})
+                self.assertTrue(plan.startswith("EXPLAIN failed"))
+                self.assertEqual(conn.execute(text("SELECT 1")).scalar(), 1)
+        conn = MagicMock()
+        conn.dialect.name = "mysql"
+        self.assertEqual(slow_queries.explain(conn, "SELECT 1", {}), "EXPLAIN is not supported on mysql")
+
+    def test_parameter_shape(self):
+        """It should describe parameters without their values"""
+        self.assertEqual(slow_queries.parameter_shape({"name": "abc", "limit": 10}), {"name": "str[3]", "limit": "int"})
+        self.assertEqual(slow_queries.parameter_shape(("abc", None)), ["str[3]", "NoneType"])
+        self.assertEqual(slow_queries.parameter_shape([{"id": 1}, {"id": 2}]), "2 x {'id': 'int'}")
+        self.assertEqual(slow_queries.parameter_shape(None), "NoneType")
@@ -0,0 +1,63 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+
+"""
+SQL Statement Timing Test Suite
+"""
+
+# pylint: disable=duplicate-code
+from unittest import TestCase
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from service.common import sql_timing
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestSqlTiming(TestCase):
+    """Shared SQL Statement Timer Tests"""
+
+    def setUp(self):
+        """Runs before each test"""
+        self.engine = create_engine("sqlite://")
+        self.timings = []
+        sql_timing.on_statement(self.engine, lambda conn, statement, *args: self.timings.append((statement, args[-1])))
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.engine.dispose()
+
+    def test_statement_timed(self):
+        """It should hand every callback the statement and its duration"""
+        seen = []
+        sql_timing.on_statement(self.engine, lambda conn, statement, *args: seen.append(statement))
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual([statement for statement, _ in self.timings], ["SELECT 1"])
+        self.assertGreaterEqual(self.timings[0][1], 0)
+        self.assertEqual(seen, ["SELECT 1"])
+
+    def test_failed_statement(self):
+        """It should not leave the start time of a failed statement behind"""
+        with self.engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+            self.assertEqual(conn.info[sql_timing.START_TIMES], [])
+            conn.execute(text("SELECT 2"))
+            self.assertEqual(conn.info[sql_timing.START_TIMES], [])
+        self.assertEqual([statement for statement, _ in self.timings], ["SELECT 2"])
@@ -0,0 +1,96 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+SQLite Backend Test Suite
+
+These tests always run against SQLite, whatever DATABASE_URI says, so the
+hermetic backend keeps working when CI uses Postgres.
+"""
+
+import os
+import asyncio
+import tempfile
+from decimal import Decimal
+from unittest import TestCase
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+from service.aio.database import create_engine as create_async_engine, create_all
+from service.models import db, configure_sqlite, Product
+from .factories import WishlistFactory, ProductFactory
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestSqliteBackend(TestCase):
+    """SQLite Backend Tests"""
+
+    def setUp(self):
+        """Creates a file backed SQLite database"""
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'test.db')}")
+        configure_sqlite(self.engine)
+        db.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        """Removes the database"""
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_wal_and_foreign_keys(self):
+        """It should open file databases in WAL mode with foreign keys on"""
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+            self.assertEqual(conn.exec_driver_sql("PRAGMA foreign_keys").scalar(), 1)
+
+    def test_price_round_trip(self):
+        """It should store prices as exact cents and compare them in SQL"""
+        with Session(self.engine) as session:
+            wishlist = WishlistFactory(id=None)
+            for price in ("0.10", "19.99", "12345678.91"):
+                wishlist.products.append(ProductFactory(id=None, wishlist=None, name=price, price=Decimal(price)))
+            session.add(wishlist)
+            session.commit()
+            session.expire_all()
+            prices = session.scalars(select(Product.price).order_by(Product.price)).all()
+            self.assertEqual(prices, [Decimal("0.10"), Decimal("19.99"), Decimal("12345678.91")])
+            cheap = session.scalars(select(Product.name).where(Product.price <= Decimal("19.99"))).all()
+            self.assertEqual(sorted(cheap), ["0.10", "19.99"])
+
+    def test_cascade_delete(self):
+        """It should delete the products of a deleted wishlist"""
+        with Session(self.engine) as session:
+            wishlist = WishlistFactory(id=None)
+            wishlist.products.append(ProductFactory(id=None, wishlist=None))
+            session.add(wishlist)
+            session.commit()
+            session.execute(text("DELETE FROM wishlist"))
+            session.commit()
+            self.assertEqual(session.scalars(select(Product)).all(), [])
+
+    def test_async_in_memory(self):
+        """It should run the async engine on an in-memory database"""
+
+        async def scenario():
+            engine = create_async_engine("sqlite://")
+            await create_all(engine)
+            async with engine.connect() as conn:
+                tables = await conn.run_sync(lambda sync: sync.dialect.get_table_names(sync))
+            await engine.dispose()
+            return tables
+
+        self.assertIn("products", asyncio.run(scenario()))
@@ -0,0 +1,202 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Tracing Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import json
+import logging
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from flask_restx import marshalling
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from wsgi import app
+from service.common import status, tracing
+from service.models import db
+from .factories import WishlistFactory
+
+BASE_URL = "/api/wishlists"
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+######################################################################
+#  T E S T   C A S E S
+######################################################################
+class TestTracing(TestCase):
+    """In-process Tracing Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    def setUp(self):
+        """Runs before each test"""
+        self.client = app.test_client()
+        self.tracer = app.extensions["tracer"]
+        self.exporter = tracing.MemoryExporter()
+        self.tracer.exporter, self.saved_exporter = self.exporter, self.tracer.exporter
+        self.tracer.sample_rate = 1.0
+
+    def tearDown(self):
+        """This runs after each test"""
+        self.tracer.exporter = self.saved_exporter
+        self.tracer.sample_rate = 0.0
+
+    def _trace(self, resp) -> dict:
+        """Returns the spans of the response's trace by name"""
+        return {span.name: span for span in self.exporter.trace(resp.headers["X-Trace-Id"])}
+
+    def test_request_trace(self):
+        """It should trace a request down to its SQL statements"""
+        resp = self.client.post(BASE_URL, json=WishlistFactory().serialize())
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        spans = self._trace(resp)
+        root = spans["POST /api/wishlists"]
+        self.assertEqual(root.parent_id, None)
+        self.assertEqual(root.kind, "SERVER")
+        self.assertEqual(root.attributes["http.response.status_code"], 201)
+        self.assertEqual(spans["check_content_type"].parent_id, root.span_id)
+        self.assertEqual(spans["Wishlist.create"].parent_id, root.span_id)
+        self.assertEqual(spans["session.commit"].parent_id, spans["Wishlist.create"].span_id)
+        self.assertEqual(spans["INSERT"].parent_id, spans["session.commit"].span_id)
+        self.assertEqual(spans["INSERT"].kind, "CLIENT")
+        self.assertIn("INSERT INTO wishlist ", spans["INSERT"].attributes["db.statement"])
+        self.assertEqual(spans["marshal"].parent_id, root.span_id)
+        for span in spans.values():
+            self.assertEqual(span.trace_id, root.trace_id)
+            self.assertGreaterEqual(span.start_ns, root.start_ns)
+            self.assertLessEqual(span.end_ns, root.end_ns)
+
+    def test_sparse_fieldset_marshal_traced(self):
+        """It should trace the marshalling of sparse fieldset responses"""
+        wishlist_id = self.client.post(BASE_URL, json=WishlistFactory().serialize()).get_json()["id"]
+        resp = self.client.get(f"{BASE_URL}/{wishlist_id}/products", query_string={"fields": "id,name"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        spans = self._trace(resp)
+        (root,) = [span for span in spans.values() if span.parent_id is None]
+        self.assertEqual(spans["marshal"].parent_id, root.span_id)
+        self.assertFalse(hasattr(marshalling.marshal, "__wrapped__"))
+
+    def test_not_sampled(self):
+        """It should not trace requests left out by the sample rate"""
+        self.tracer.sample_rate = 0.0
+        resp = self.client.get(f"{BASE_URL}/0")
+        self.assertNotIn("X-Trace-Id", resp.headers)
+        self.assertEqual(len(self.exporter.spans), 0)
+        self.assertIsNone(tracing.current_span())
+
+    def test_traceparent(self):
+        """It should continue a sampled trace from the traceparent header"""
+        self.tracer.sample_rate = 0.0
+        resp = self.client.get(f"{BASE_URL}/0", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+        self.assertEqual(resp.headers["X-Trace-Id"], TRACE_ID)
+        root = self._trace(resp)["GET /api/wishlists/<int:wishlist_id>"]
+        self.assertEqual(root.parent_id, PARENT_ID)
+        self.assertEqual(root.attributes["http.response.status_code"], 404)
+
+    def test_traceparent_not_sampled(self):
+        """It should follow the sampled flag and ignore invalid headers"""
+        resp = self.client.get(f"{BASE_URL}/0", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+        self.assertNotIn("X-Trace-Id", resp.headers)
+        resp = self.client.get(f"{BASE_URL}/0", headers={"traceparent": f"00-{'0' * 32}-{PARENT_ID}-01"})
+        self.assertNotEqual(resp.headers["X-Trace-Id"], "0" * 32)
+
+    def test_failed_span(self):
+        """It should mark spans that raised as errors"""
+        resp = self.client.post(BASE_URL, data="{}", content_type="text/plain")
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        span = self._trace(resp)["check_content_type"]
+        self.assertEqual(span.status, "ERROR")
+        self.assertEqual(span.to_dict()["status"], {"code": "STATUS_CODE_ERROR"})
+
+    def test_failed_statement(self):
+        """It should end the span of a SQL statement that failed"""
+        root = self.tracer.start_trace("job")
+        with app.app_context():
+            token = tracing._current_span.set(root)  # pylint: disable=protected-access
+            try:
+                with self.assertRaises(SQLAlchemyError):
+                    db.session.execute(text("SELECT * FROM no_such_table"))
+                db.session.rollback()
+            finally:
+                tracing._current_span.reset(token)  # pylint: disable=protected-access
+        (span,) = root.finished
+        self.assertEqual(span.name, "SELECT")
+        self.assertEqual(span.status, "ERROR")
+        self.assertGreaterEqual(span.duration_ms, 0)
+
+    def test_deadline_exceeded(self):
+        """It should not leave a SQL span on a connection when the deadline refuses the query"""
+        left = []
+
+        def checkin(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+            left.extend(connection_record.info.get("trace_spans", []))
+
+        with app.app_context():
+            engine = db.engine
+        budget = app.config["DB_REQUEST_BUDGET_MS"]
+        event.listen(engine, "checkin", checkin)
+        try:
+            app.config["DB_REQUEST_BUDGET_MS"] = 1
+            with patch("service.routes.check_content_type", side_effect=lambda *_: time.sleep(0.05)):
+                resp = self.client.post(BASE_URL, json=WishlistFactory().serialize())
+        finally:
+            event.remove(engine, "checkin", checkin)
+            app.config["DB_REQUEST_BUDGET_MS"] = budget
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(left, [])
+
+    def test_file_exporter(self):
+        """It should append finished traces to a file as JSON lines"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "traces.jsonl")
+            self.tracer.exporter = tracing.FileExporter(path)
+            resp = self.client.get(f"{BASE_URL}/0")
+            with open(path, encoding="utf-8") as file:
+                spans = [json.loads(line) for line in file]
+        self.assertTrue(spans)
+        for span in spans:
+            self.assertEqual(span["traceId"], resp.headers["X-Trace-Id"])
+        root = next(span for span in spans if span["parentSpanId"] == "")
+        self.assertEqual(root["kind"], "SPAN_KIND_SERVER")
+        self.assertEqual(root["attributes"]["http.route"], "/api/wishlists/<int:wishlist_id>")
+
+    def test_export_failure(self):
+        """It should keep serving when a trace cannot be written"""
+        self.tracer.exporter = tracing.FileExporter(os.path.join(tempfile.gettempdir(), "missing", "traces.jsonl"))
+        resp = self.client.get(f"{BASE_URL}/0")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_span_outside_trace(self):
+        """It should skip spans when nothing is being traced"""
+        with tracing.start_span("idle") as span:
+            self.assertIsNone(span)
+
+    def test_unknown_exporter(self):
+        """It should reject an unknown TRACE_EXPORTER"""
+        other = Flask(__name__)
+        other.config["TRACE_EXPORTER"] = "zipkin"
+        with self.assertRaises(ValueError):
+            tracing.init_tracing(other, db)
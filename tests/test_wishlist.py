@@ -21,8 +21,10 @@ Test cases for Wishlist Model
 # pylint: disable=duplicate-code
 import os
 import logging
+from decimal import Decimal
 from unittest import TestCase
 from unittest.mock import patch
+from sqlalchemy.exc import OperationalError
 from tests.factories import WishlistFactory, ProductFactory
 from wsgi import app
 from service.models import Wishlist, Product, db, DataValidationError
@@ -138,6 +140,19 @@ class TestWishlist(TestCase):
         self.assertEqual(same_wishlist.id, wishlist.id)
         self.assertEqual(same_wishlist.name, wishlist.name)
 
+    def test_find_page(self):
+        """It should Find a page of Wishlists in id order, optionally by name"""
+        wishlists = WishlistFactory.create_batch(5)
+        for wishlist in wishlists:
+            wishlist.name = "same" if wishlist is not wishlists[0] else "other"
+            wishlist.create()
+
+        page = Wishlist.find_page(2, 2)
+        self.assertEqual([w.id for w in page], [wishlists[2].id, wishlists[3].id])
+        page = Wishlist.find_page(1, 10, "same")
+        self.assertEqual([w.id for w in page], [w.id for w in wishlists[1:]])
+        self.assertEqual(Wishlist.find_page(3, 10), [])
+
     def test_serialize_an_wishlist(self):
         """It should Serialize a wishlist"""
         wishlist = WishlistFactory()
@@ -283,4 +298,77 @@ class TestWishlist(TestCase):
             with self.assertRaises(DataValidationError):
                 wishlist.delete()
 
+    def test_database_errors_are_not_validation_errors(self):
+        """It should pass database availability errors through"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        error = OperationalError("UPDATE", {}, Exception("connection lost"))
+        with patch("service.models.persistent_base.db.session.commit", side_effect=error):
+            self.assertRaises(OperationalError, wishlist.update)
+            self.assertRaises(OperationalError, wishlist.delete)
+
+    def test_totals(self):
+        """It should add product changes to the Wishlist totals in the same transaction"""
+        wishlist = WishlistFactory(products=[ProductFactory(price=Decimal("2.50"), quantity=2)])
+        wishlist.create()
+        self.assertEqual((wishlist.product_count, wishlist.total_value, wishlist.purchased_count), (1, Decimal("5.00"), 0))
+        other = WishlistFactory()
+        other.create()
+
+        # Columns changed without loading them first still count their old value
+        product = wishlist.products[0]
+        product.purchased = True
+        product.wishlist_id = other.id
+        product.update()
+        db.session.refresh(wishlist)
+        self.assertEqual((wishlist.product_count, wishlist.total_value), (0, Decimal("0.00")))
+        self.assertEqual((other.product_count, other.total_value, other.purchased_count), (1, Decimal("5.00"), 1))
+
+        # A failed write leaves the totals as they were
+        self.assertRaises(DataValidationError, ProductFactory(wishlist=other, name=None).create)
+        self.assertEqual(Wishlist.find(other.id).product_count, 1)
+
+        product.delete()
+        self.assertEqual((other.product_count, other.total_value, other.purchased_count), (0, Decimal("0.00"), 0))
+
+    def test_total_value_wider_than_price(self):
+        """It should hold a total value larger than any single price"""
+        wishlist = WishlistFactory(products=[ProductFactory(price=Decimal("99999999.99"), quantity=1000)])
+        wishlist.create()
+        self.assertEqual(Wishlist.find(wishlist.id).total_value, Decimal("99999999990.00"))
+
+    def test_totals_add_up(self):
+        """It should add to the stored totals instead of overwriting them"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        stale = Wishlist.find(wishlist.id)
+        # Another transaction adds a product behind the loaded Wishlist's back
+        db.session.execute(db.update(Wishlist).where(Wishlist.id == wishlist.id).values(product_count=5))
+        ProductFactory(wishlist=stale).create()
+        self.assertEqual(Wishlist.find(wishlist.id).product_count, 6)
+
+    def test_find_page_sorted(self):
+        """It should Find a page of Wishlists sorted by a total"""
+        wishlists = WishlistFactory.create_batch(3)
+        for count, wishlist in zip((1, 3, 2), wishlists):
+            wishlist.products = ProductFactory.build_batch(count, wishlist=None)
+            wishlist.create()
+        page = Wishlist.find_page(1, 2, sort="-product_count")
+        self.assertEqual([w.product_count for w in page], [3, 2])
+        self.assertRaises(DataValidationError, Wishlist.find_page, 1, 2, sort="price")
+
+    def test_find_after(self):
+        """It should Find the Wishlists that follow a cursor"""
+        wishlists = WishlistFactory.create_batch(4, userid="owner")
+        for count, wishlist in zip((2, 1, 2, 0), wishlists):
+            wishlist.products = ProductFactory.build_batch(count, wishlist=None, price=Decimal("1.10"))
+            wishlist.create()
+        page = Wishlist.find_after(wishlists[0].cursor(), 2, userid="owner")
+        self.assertEqual([w.id for w in page], [wishlists[1].id, wishlists[2].id])
+        first = Wishlist.find_page(1, 1, sort="-total_value")[0]
+        self.assertEqual(first.cursor("-total_value"), (2.2, wishlists[0].id))
+        page = Wishlist.find_after(first.cursor("-total_value"), 10, "-total_value")
+        self.assertEqual([w.id for w in page], [wishlists[2].id, wishlists[1].id, wishlists[3].id])
+        self.assertEqual(Wishlist.cursor_types("-name"), (str, int))
+
     # Completed